@@ -1,16 +1,30 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 import base64
 import io
 import re
-from typing import Dict, List, Optional
+from typing import Annotated, Dict, List, Optional, Tuple
 import json
 import time
+import asyncio
 from loguru import logger
 
-from services.dsb_service import get_timetable, authenticate_user, get_specific_plan_image
-from services.ocr_service import process_ocr
-from services.db import store_timetable, get_latest_timetable
+from services.dsb_service import get_timetable, authenticate_user, get_specific_plan_image, get_all_plan_images, find_timetable_plans, iter_plan_images
+from services.ocr_service import process_ocr, process_ocr_batch, process_ocr_pipelined
+from services.ocr_pool import OCRQueueFull, get_ocr_pool
+from services.ocr_cache import get_ocr_cache
+from services.session_pool import get_session_pool
+from services.shared_cache import get_shared_cache
+from services.http_client import get_http_stats
+from services.prefetch import get_prefetch_scheduler
+from services.jobs import JobQueueFull, get_job_queue
+from services.db import store_timetable, get_latest_timetable, get_latest_response, get_latest_class_response, get_plan_history, get_timetable_version
+from services.timetable_diff import diff_timetables, index_entries, is_empty
+from services.class_index import select_class
+from services.timetable_cache import FRESH, STALE, get_timetable_cache
+from services.upstream import UpstreamUnavailable, get_gateway_stats
 
 router = APIRouter()
 
@@ -31,13 +45,192 @@ class TimetableResponse(BaseModel):
     status: str
     from_cache: bool = False
 
+class MultiTimetableResponse(BaseModel):
+    timetables: Dict[str, Dict]  # Stundenpläne nach Plantitel
+    available_plans: List[Dict] = []
+    last_updated: str
+    status: str
+
+def _collect_available_classes(auth_result, available_plans: List[Dict]) -> List[str]:
+    """
+    Ermittelt die verfügbaren Klassen aus den Plantiteln und, falls vorhanden,
+    aus den OCR-Daten des DSB-Clients.
+    """
+    # Verfügbare Klassen aus den Titeln extrahieren
+    available_classes = []
+    for plan in available_plans:
+        plan_title = plan.get('title', '')
+        # Klassen im Format MTL01, MTL02, etc. oder MTL 01, MTL 02 extrahieren
+        class_matches = re.findall(r'MTL\s*\d+', plan_title)
+        available_classes.extend(class_matches)
+
+    # Extrahiere zusätzlich Klassen aus den OCR-Ergebnissen, wenn diese verfügbar sind
+    if hasattr(auth_result, 'ocr_results') and auth_result.ocr_results:
+        # Extrahiere Klasseninformationen, falls vorhanden
+        class_names = []
+        try:
+            # 1. Prüfe, ob bereits Klasseninformationen im Timetable-Objekt vorhanden sind
+            if 'class_names' in auth_result.ocr_results and isinstance(auth_result.ocr_results['class_names'], list):
+                class_names = auth_result.ocr_results['class_names']
+                logger.info(f"Klassen direkt aus OCR-Daten übernommen: {class_names}")
+            else:
+                # 2. Fallback: Suche nach Klasseninformationen in den Einträgen
+                # Einfache Pattern-Suche nach Klasseninformationen in der Bildüberschrift
+                class_pattern = re.compile(r'\b(\d{1,2}[a-zA-Z]{1,2})\b')
+                mtl_pattern = re.compile(r'MTL\s*\d+', re.IGNORECASE)
+                classes_found = set()
+
+                for item in auth_result.ocr_results.get('entries', []):
+                    text = item.get('text', '')
+                    # Traditionelle Klassen (z.B. 10a)
+                    standard_matches = class_pattern.findall(text)
+                    classes_found.update(standard_matches)
+
+                    # MTL-Klassen (z.B. MTL 02)
+                    mtl_matches = mtl_pattern.findall(text)
+                    if mtl_matches:
+                        normalized_matches = [re.sub(r'\s+', ' ', match).strip() for match in mtl_matches]
+                        classes_found.update(normalized_matches)
+
+                class_names = sorted(list(classes_found))
+                logger.info(f"Gefundene Klassen aus Textanalyse: {class_names}")
+
+            # Fallback, wenn keine Klassen gefunden wurden
+            if not class_names:
+                logger.info("Keine Klassen gefunden, verwende Fallback-Klassen")
+                class_names = ["MTL 01", "MTL 02"]
+
+            available_classes.extend(class_names)
+        except Exception as e:
+            logger.error(f"Fehler bei der Extraktion von Klasseninformationen: {str(e)}")
+
+    # Duplikate entfernen
+    available_classes = list(set(available_classes))
+    logger.info(f"Gefundene Klassen: {available_classes}")
+    return available_classes
+
+def _plan_key(auth_result, plan_url: Optional[str] = None) -> Optional[str]:
+    """
+    Kennung eines Plans für die Versionshistorie: sein Titel, sonst seine URL.
+    Ohne plan_url ist der neueste Plan gemeint (erster Eintrag der Planliste).
+    """
+    plans = getattr(auth_result, "available_plans", None) or []
+    if plan_url is None:
+        return (plans[0].get("title") or plans[0].get("url")) if plans else None
+    for plan in plans:
+        if plan.get("url") == plan_url:
+            return plan.get("title") or plan_url
+    return plan_url
+
+def _cached_entry(cached_result: Dict) -> Dict:
+    """Bringt einen gespeicherten Stundenplan in die Form der Einträge des Stundenplan-Caches."""
+    return {
+        "timetable": json.loads(cached_result["data"]),
+        "available_plans": cached_result.get("available_plans", []),
+        "available_classes": cached_result.get("available_classes", []),
+        "last_updated": cached_result["timestamp"],
+        "plan": cached_result.get("plan"),
+    }
+
+def _cached_response(entry: Dict, class_name: Optional[str]) -> TimetableResponse:
+    """Erstellt die Antwort von /parse-plan aus einem Eintrag des Stundenplan-Caches."""
+    return TimetableResponse(
+        timetable=select_class(entry["timetable"], class_name),
+        available_plans=entry["available_plans"],
+        available_classes=entry["available_classes"],
+        last_updated=entry["last_updated"],
+        status="success",
+        from_cache=True
+    )
+
+def _fetched_at(timestamp: str) -> float:
+    """Wandelt den gespeicherten Zeitstempel eines Abrufs in Sekunden seit der Epoche um."""
+    return time.mktime(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+
+async def _fetch_latest_plan(username: str, auth_result) -> Optional[Tuple[Dict, bytes]]:
+    """
+    Lädt den neuesten Plan, erkennt ihn per OCR und legt das Ergebnis im Stundenplan-Cache ab.
+
+    Returns:
+        Ein Tupel aus Cache-Eintrag und Bilddaten oder None, wenn kein Plan gefunden wurde
+    """
+    image_data = await get_timetable(auth_result)
+    if not image_data:
+        return None
+    
+    # Alle verfügbaren Pläne aus der get_timetable-Funktion extrahieren
+    available_plans = getattr(auth_result, "available_plans", [])
+    logger.info(f"Verfügbare Pläne: {len(available_plans)}")
+    
+    available_classes = _collect_available_classes(auth_result, available_plans)
+    
+    logger.info("Stundenplan gefunden. Starte OCR-Verarbeitung...")
+    ocr_result = await process_ocr(image_data)
+    
+    entry = {
+        "timetable": ocr_result,
+        "available_plans": available_plans,
+        "available_classes": available_classes,
+        "last_updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "plan": _plan_key(auth_result),
+    }
+    get_timetable_cache().put(username, entry)
+    return entry, image_data
+
+def _upstream_unavailable(error: UpstreamUnavailable) -> HTTPException:
+    """Antwort, wenn DSBmobile bzw. der Bild-Host nicht erreichbar ist und keine gespeicherten Daten vorliegen."""
+    logger.warning(f"Upstream nicht verfügbar: {str(error)}")
+    return HTTPException(
+        status_code=503,
+        detail="DSBmobile ist derzeit nicht erreichbar, bitte später erneut versuchen",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+async def _upstream_fallback(request: LoginRequest, error: UpstreamUnavailable,
+                             class_name: Optional[str]) -> TimetableResponse:
+    """
+    Liefert bei nicht erreichbarem DSBmobile den letzten bekannten Stundenplan.
+
+    Da die Zugangsdaten nicht geprüft werden können, geschieht das nur, wenn sich
+    der Benutzer zuletzt mit genau diesen Zugangsdaten erfolgreich angemeldet hat.
+    """
+    if get_session_pool().is_verified(request.username, request.password):
+        entry, _ = get_timetable_cache().get(request.username)
+        if entry is None:
+            cached_result = await get_latest_timetable(request.username)
+            entry = _cached_entry(cached_result) if cached_result else None
+        if entry is not None:
+            logger.warning(f"Upstream nicht verfügbar, liefere gespeicherten Stundenplan: {str(error)}")
+            return _cached_response(entry, class_name)
+    raise _upstream_unavailable(error)
+
+async def _refresh_timetable(username: str, auth_result) -> None:
+    """Ruft einen veralteten Stundenplan im Hintergrund neu ab (stale-while-revalidate)."""
+    try:
+        fetched = await _fetch_latest_plan(username, auth_result)
+        if fetched is not None:
+            entry, image_data = fetched
+            await store_timetable(username, entry["timetable"], image_data, entry["last_updated"],
+                                  entry["available_plans"], entry["available_classes"], plan=entry["plan"])
+            logger.info(f"Stundenplan für Benutzer {username} im Hintergrund aktualisiert")
+    except Exception as e:
+        logger.warning(f"Hintergrund-Aktualisierung für Benutzer {username} fehlgeschlagen: {str(e)}")
+    finally:
+        get_timetable_cache().end_refresh(username)
+
 @router.post("/parse-plan", response_model=TimetableResponse)
-async def parse_plan(request: LoginRequest, background_tasks: BackgroundTasks):
+async def parse_plan(request: LoginRequest, background_tasks: BackgroundTasks,
+                     class_name: Annotated[Optional[str], Query(alias="class")] = None):
     """
     Authentifiziert den Benutzer bei DSBmobile, ruft den Stundenplan ab,
     führt OCR durch und wandelt den Text in eine strukturierte JSON-Tabelle um.
     
-    Die Ergebnisse werden in der Datenbank gespeichert.
+    Die Ergebnisse werden in der Datenbank gespeichert. Mit ?class=MTL 01 werden
+    nur die Einträge dieser Klasse zurückgegeben.
+    
+    Ein frischer Stundenplan (jünger als TIMETABLE_CACHE_TTL) wird direkt aus dem
+    Cache geliefert. Ein veralteter Plan innerhalb der Gnadenfrist wird ebenfalls
+    sofort geliefert und im Hintergrund neu abgerufen.
     """
     try:
         # Protokollierung des Abrufs (ohne Passwörter)
@@ -48,109 +241,182 @@ async def parse_plan(request: LoginRequest, background_tasks: BackgroundTasks):
         if not auth_result:
             raise HTTPException(status_code=401, detail="Authentifizierung fehlgeschlagen")
         
-        # Letzten gespeicherten Stundenplan abrufen
-        cached_result = await get_latest_timetable(request.username)
+        # Zuerst im Stundenplan-Cache, danach im Speicher nach dem letzten Stand suchen
+        cache = get_timetable_cache()
+        entry, state = cache.get(request.username)
+        if entry is None:
+            cached_result = await get_latest_timetable(request.username)
+            if cached_result:
+                entry = _cached_entry(cached_result)
+                # Ein unverändert bestätigter Plan gilt ab der Bestätigung als frisch, nicht ab seiner ersten Version
+                fetched_at = _fetched_at(cached_result.get("checked_at") or cached_result["timestamp"])
+                state = cache.state(fetched_at)
+                cache.put(request.username, entry, fetched_at)
+                
+                # Für registrierte Konten liegt der Plan aus der Vorab-Verarbeitung bereits vor
+                scheduler = get_prefetch_scheduler()
+                if scheduler is not None and scheduler.is_fresh(request.username):
+                    state = FRESH
+        
+        if state == FRESH:
+            logger.info("Verwende frischen Stundenplan aus dem Cache")
+            return _cached_response(entry, class_name)
+        if state == STALE:
+            if cache.begin_refresh(request.username):
+                logger.info("Stundenplan veraltet, aktualisiere im Hintergrund")
+                background_tasks.add_task(_refresh_timetable, request.username, auth_result)
+            return _cached_response(entry, class_name)
         
         # Stundenplan-Daten abrufen
         logger.info("Authentifizierung erfolgreich. Rufe Stundenplan ab...")
-        image_data = await get_timetable(auth_result)
+        fetched = await _fetch_latest_plan(request.username, auth_result)
         
-        if not image_data:
-            # Falls kein neuer Plan gefunden wurde, aber ein Cache existiert, geben wir den zurück
-            if cached_result:
+        if fetched is None:
+            # Falls kein neuer Plan gefunden wurde, aber ein (abgelaufener) Stand existiert, geben wir den zurück
+            if entry:
                 logger.info("Kein neuer Plan gefunden. Verwende Cache.")
-                return TimetableResponse(
-                    timetable=json.loads(cached_result["data"]),
-                    last_updated=cached_result["timestamp"],
-                    status="success",
-                    from_cache=True
-                )
+                return _cached_response(entry, class_name)
             raise HTTPException(status_code=404, detail="Kein Stundenplan gefunden")
-        
-        # Alle verfügbaren Pläne aus der get_timetable-Funktion extrahieren
-        available_plans = getattr(auth_result, "available_plans", [])
-        logger.info(f"Verfügbare Pläne: {len(available_plans)}")
-        
-        # Verfügbare Klassen aus den Titeln extrahieren
-        available_classes = []
-        for plan in available_plans:
-            plan_title = plan.get('title', '')
-            # Klassen im Format MTL01, MTL02, etc. oder MTL 01, MTL 02 extrahieren
-            class_matches = re.findall(r'MTL\s*\d+', plan_title)
-            available_classes.extend(class_matches)
-        
-        # Extrahiere zusätzlich Klassen aus den OCR-Ergebnissen, wenn diese verfügbar sind
-        if hasattr(auth_result, 'ocr_results') and auth_result.ocr_results:
-            # Extrahiere Klasseninformationen, falls vorhanden
-            class_names = []
-            try:
-                # 1. Prüfe, ob bereits Klasseninformationen im Timetable-Objekt vorhanden sind
-                if 'class_names' in auth_result.ocr_results and isinstance(auth_result.ocr_results['class_names'], list):
-                    class_names = auth_result.ocr_results['class_names']
-                    logger.info(f"Klassen direkt aus OCR-Daten übernommen: {class_names}")
-                else:
-                    # 2. Fallback: Suche nach Klasseninformationen in den Einträgen
-                    # Einfache Pattern-Suche nach Klasseninformationen in der Bildüberschrift
-                    class_pattern = re.compile(r'\b(\d{1,2}[a-zA-Z]{1,2})\b')
-                    mtl_pattern = re.compile(r'MTL\s*\d+', re.IGNORECASE)
-                    classes_found = set()
-
-                    for item in auth_result.ocr_results.get('entries', []):
-                        text = item.get('text', '')
-                        # Traditionelle Klassen (z.B. 10a)
-                        standard_matches = class_pattern.findall(text)
-                        classes_found.update(standard_matches)
-                        
-                        # MTL-Klassen (z.B. MTL 02)
-                        mtl_matches = mtl_pattern.findall(text)
-                        if mtl_matches:
-                            normalized_matches = [re.sub(r'\s+', ' ', match).strip() for match in mtl_matches]
-                            classes_found.update(normalized_matches)
-                    
-                    class_names = sorted(list(classes_found))
-                    logger.info(f"Gefundene Klassen aus Textanalyse: {class_names}")
-            
-                # Fallback, wenn keine Klassen gefunden wurden
-                if not class_names:
-                    logger.info("Keine Klassen gefunden, verwende Fallback-Klassen")
-                    class_names = ["MTL 01", "MTL 02"]
-            
-                available_classes.extend(class_names)
-            except Exception as e:
-                logger.error(f"Fehler bei der Extraktion von Klasseninformationen: {str(e)}")
-        
-        # Duplikate entfernen
-        available_classes = list(set(available_classes))
-        logger.info(f"Gefundene Klassen: {available_classes}")
-        
-        # OCR-Verarbeitung im Hintergrund starten
-        logger.info("Stundenplan gefunden. Starte OCR-Verarbeitung...")
-        ocr_result = await process_ocr(image_data)
+        entry, image_data = fetched
         
         # Ergebnisse speichern (im Hintergrund)
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
         background_tasks.add_task(
             store_timetable, 
             request.username, 
-            ocr_result, 
+            entry["timetable"], 
             image_data,
-            timestamp,
-            available_plans,
-            available_classes
+            entry["last_updated"],
+            entry["available_plans"],
+            entry["available_classes"],
+            plan=entry["plan"]
         )
         
         return TimetableResponse(
-            timetable=ocr_result,
-            available_plans=available_plans,
-            available_classes=available_classes,
-            last_updated=timestamp,
+            timetable=select_class(entry["timetable"], class_name),
+            available_plans=entry["available_plans"],
+            available_classes=entry["available_classes"],
+            last_updated=entry["last_updated"],
             status="success"
         )
 
+    except HTTPException as e:
+        # HTTP-Exceptions (z.B. 401 bei falschen Zugangsdaten) weiterleiten
+        raise e
+    except OCRQueueFull as e:
+        # OCR ausgelastet: sofort ablehnen, statt die Anfrage anzustauen
+        logger.warning(f"OCR-Warteschlange voll, Anfrage abgelehnt: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="OCR-Verarbeitung ausgelastet, bitte später erneut versuchen",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UpstreamUnavailable as e:
+        # DSBmobile ausgefallen oder gedrosselt: sofort auf gespeicherte Daten ausweichen
+        return await _upstream_fallback(request, e, class_name)
     except Exception as e:
         logger.error(f"Fehler beim Abruf des Stundenplans: {str(e)}")
         raise HTTPException(status_code=500, detail="Fehler beim Abruf des Stundenplans")
 
+def _sse_event(event: str, data: Dict) -> str:
+    """Formatiert ein Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/parse-plan/stream")
+async def parse_plan_stream(request: LoginRequest):
+    """
+    Wie /parse-plan, liefert die Ergebnisse aber schrittweise als Server-Sent Events.
+
+    Reihenfolge der Events:
+    - plans: Liste der verfügbaren Pläne (nach einem Abruf bei DSBmobile)
+    - cached: zuletzt gespeicherter Stundenplan, falls vorhanden
+    - timetable: frisches OCR-Ergebnis
+    - error: Fehler mit status_code und detail (beendet den Stream)
+    - done: Ende des Streams
+    """
+    logger.info(f"Versuche Stundenplan-Abruf (Stream) für Benutzer: {request.username}")
+
+    # Die Authentifizierung erfolgt vor Beginn des Streams, damit 401 als HTTP-Status ankommt
+    auth_result = await authenticate_user(request.username, request.password)
+    if not auth_result:
+        raise HTTPException(status_code=401, detail="Authentifizierung fehlgeschlagen")
+
+    async def events():
+        # Gespeicherten Stundenplan parallel zur Planliste laden
+        cached_task = asyncio.create_task(get_latest_timetable(request.username))
+        try:
+            available_plans = await find_timetable_plans(auth_result)
+            yield _sse_event("plans", {
+                "available_plans": available_plans,
+                "available_classes": _collect_available_classes(auth_result, available_plans)
+            })
+
+            cached_result = await cached_task
+            if cached_result:
+                yield _sse_event("cached", {
+                    "timetable": json.loads(cached_result["data"]),
+                    "available_plans": cached_result.get("available_plans", []),
+                    "available_classes": cached_result.get("available_classes", []),
+                    "last_updated": cached_result["timestamp"],
+                    "status": "success",
+                    "from_cache": True
+                })
+
+            image_data = await get_timetable(auth_result)
+            if not image_data:
+                if not cached_result:
+                    yield _sse_event("error", {"status_code": 404, "detail": "Kein Stundenplan gefunden"})
+                yield _sse_event("done", {})
+                return
+
+            available_classes = _collect_available_classes(auth_result, available_plans)
+            ocr_result = await process_ocr(image_data)
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            yield _sse_event("timetable", {
+                "timetable": ocr_result,
+                "available_plans": available_plans,
+                "available_classes": available_classes,
+                "last_updated": timestamp,
+                "status": "success",
+                "from_cache": False
+            })
+
+            plan = _plan_key(auth_result)
+            await store_timetable(request.username, ocr_result, image_data, timestamp, available_plans,
+                                  available_classes, plan=plan)
+            get_timetable_cache().put(request.username, {
+                "timetable": ocr_result,
+                "available_plans": available_plans,
+                "available_classes": available_classes,
+                "last_updated": timestamp,
+                "plan": plan,
+            })
+            yield _sse_event("done", {})
+        except OCRQueueFull as e:
+            logger.warning(f"OCR-Warteschlange voll, Anfrage abgelehnt: {str(e)}")
+            yield _sse_event("error", {
+                "status_code": 503,
+                "detail": "OCR-Verarbeitung ausgelastet, bitte später erneut versuchen",
+                "retry_after": e.retry_after
+            })
+        except UpstreamUnavailable as e:
+            logger.warning(f"Upstream nicht verfügbar (Stream): {str(e)}")
+            yield _sse_event("error", {
+                "status_code": 503,
+                "detail": "DSBmobile ist derzeit nicht erreichbar, bitte später erneut versuchen",
+                "retry_after": e.retry_after
+            })
+        except Exception as e:
+            logger.error(f"Fehler beim Abruf des Stundenplans (Stream): {str(e)}")
+            yield _sse_event("error", {"status_code": 500, "detail": "Fehler beim Abruf des Stundenplans"})
+        finally:
+            cached_task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/get-specific-plan")
 async def get_specific_plan(request: SpecificPlanRequest, background_tasks: BackgroundTasks):
     """Liest einen spezifischen Plan basierend auf der URL"""
@@ -177,7 +443,8 @@ async def get_specific_plan(request: SpecificPlanRequest, background_tasks: Back
             request.username, 
             ocr_result, 
             image_data,
-            timestamp
+            timestamp,
+            plan=_plan_key(auth_result, request.plan_url)
         )
         
         return TimetableResponse(
@@ -189,29 +456,322 @@ async def get_specific_plan(request: SpecificPlanRequest, background_tasks: Back
     except HTTPException as e:
         # HTTP-Exceptions weiterleiten
         raise e
+    except OCRQueueFull as e:
+        # OCR ausgelastet: sofort ablehnen, statt die Anfrage anzustauen
+        logger.warning(f"OCR-Warteschlange voll, Anfrage abgelehnt: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="OCR-Verarbeitung ausgelastet, bitte später erneut versuchen",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
     except Exception as e:
         # Alle anderen Fehler protokollieren und eine generische Fehlermeldung ausgeben
         logger.error(f"Fehler beim Abruf des Stundenplans: {str(e)}")
         raise HTTPException(status_code=500, detail="Fehler beim Abruf des Stundenplans")
 
+async def _enqueue_job(kind: str, endpoint, request) -> Dict:
+    """
+    Stellt einen Endpunkt-Aufruf als Job in die Warteschlange.
+
+    Der Job ruft den Endpunkt mit eigenen BackgroundTasks auf und führt diese
+    (z.B. das Speichern des Stundenplans) direkt im Anschluss aus.
+    """
+    async def run():
+        background_tasks = BackgroundTasks()
+        result = await endpoint(request, background_tasks)
+        await background_tasks()
+        return jsonable_encoder(result)
+
+    queue = get_job_queue()
+    try:
+        # Erst bestätigen, wenn alle Worker den Job kennen (GET /jobs/{job_id} kann bei einem anderen landen)
+        job = await queue.submit(kind, run)
+    except JobQueueFull as e:
+        logger.warning(f"Job-Warteschlange voll, Anfrage abgelehnt: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Job-Warteschlange ausgelastet, bitte später erneut versuchen",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    logger.info(f"Job {job.id} ({kind}) angelegt für Benutzer {request.username}")
+    return {"job_id": job.id, "status": job.status}
+
+@router.post("/jobs/parse-plan", status_code=202)
+async def create_parse_plan_job(request: LoginRequest):
+    """
+    Job-Variante von /parse-plan: bestätigt sofort mit einer Job-ID,
+    das Ergebnis wird über GET /jobs/{job_id} abgefragt.
+    """
+    return await _enqueue_job("parse-plan", parse_plan, request)
+
+@router.post("/jobs/get-specific-plan", status_code=202)
+async def create_specific_plan_job(request: SpecificPlanRequest):
+    """
+    Job-Variante von /get-specific-plan: bestätigt sofort mit einer Job-ID,
+    das Ergebnis wird über GET /jobs/{job_id} abgefragt.
+    """
+    return await _enqueue_job("get-specific-plan", get_specific_plan, request)
+
+@router.get("/jobs/stats")
+async def get_job_stats():
+    """
+    Gibt Warteschlangentiefe und Zähler der Job-Verarbeitung zurück.
+    """
+    return get_job_queue().stats()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Gibt Status (queued, running, done, failed) und gegebenenfalls Ergebnis eines Jobs zurück,
+    bei gemeinsamem Cache auch für Jobs, die ein anderer Worker angenommen hat.
+    """
+    job = await get_job_queue().lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job nicht gefunden oder abgelaufen")
+    return job
+
+@router.post("/parse-all-plans", response_model=MultiTimetableResponse)
+async def parse_all_plans(request: LoginRequest, pipeline: bool = False):
+    """
+    Lädt alle verfügbaren Stundenpläne eines Kontos gleichzeitig und erkennt sie in einem
+    gebündelten OCR-Durchlauf. Die Ergebnisse werden nach Plantitel zurückgegeben.
+    
+    Mit ?pipeline=true startet die OCR jedes Plans, sobald sein Download abgeschlossen
+    ist, statt auf alle Downloads zu warten.
+    """
+    try:
+        logger.info(f"Versuche Abruf aller Stundenpläne für Benutzer: {request.username}")
+        
+        auth_result = await authenticate_user(request.username, request.password)
+        if not auth_result:
+            raise HTTPException(status_code=401, detail="Authentifizierung fehlgeschlagen")
+        
+        if pipeline:
+            arrived = await process_ocr_pipelined(
+                ((entry.get("title") or entry.get("url", ""), image_data)
+                 async for entry, image_data in iter_plan_images(auth_result))
+            )
+            # Ergebnisse in der Reihenfolge der Planliste (neuester Plan zuerst) zurückgeben
+            titles = [entry.get("title") or entry.get("url", "") for entry in getattr(auth_result, "available_plans", [])]
+            timetables = {title: arrived[title] for title in titles if title in arrived}
+        else:
+            images = await get_all_plan_images(auth_result)
+            timetables = await process_ocr_batch(images) if images else {}
+        if not timetables:
+            raise HTTPException(status_code=404, detail="Kein Stundenplan gefunden")
+        
+        return MultiTimetableResponse(
+            timetables=timetables,
+            available_plans=getattr(auth_result, "available_plans", []),
+            last_updated=time.strftime("%Y-%m-%d %H:%M:%S"),
+            status="success"
+        )
+    except HTTPException as e:
+        raise e
+    except OCRQueueFull as e:
+        logger.warning(f"OCR-Warteschlange voll, Anfrage abgelehnt: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="OCR-Verarbeitung ausgelastet, bitte später erneut versuchen",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except UpstreamUnavailable as e:
+        raise _upstream_unavailable(e)
+    except Exception as e:
+        logger.error(f"Fehler beim Abruf aller Stundenpläne: {str(e)}")
+        raise HTTPException(status_code=500, detail="Fehler beim Abruf der Stundenpläne")
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Prüft, ob der If-None-Match-Header den aktuellen ETag enthält."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
 @router.get("/latest", response_model=TimetableResponse)
-async def get_latest(username: str):
+async def get_latest(username: str, if_none_match: Optional[str] = Header(None),
+                     class_name: Annotated[Optional[str], Query(alias="class")] = None):
     """
     Ruft den zuletzt abgerufenen Stundenplan für einen Benutzer ab.
+
+    Die Antwort wird beim Speichern vorab serialisiert und hier unverändert
+    ausgeliefert. Kennt der Client den aktuellen Stand bereits (If-None-Match),
+    wird nur 304 ohne Inhalt gesendet. Mit ?class=MTL 01 wird die beim Speichern
+    aus dem Klassen-Index erstellte Antwort dieser Klasse (mit eigenem ETag) geliefert.
     """
     try:
-        result = await get_latest_timetable(username)
-        if not result:
+        if class_name:
+            cached = await get_latest_class_response(username, class_name)
+        else:
+            cached = await get_latest_response(username)
+        if not cached:
             raise HTTPException(status_code=404, detail="Kein Stundenplan für diesen Benutzer gefunden")
-            
-        return TimetableResponse(
-            timetable=json.loads(result["data"]),
-            last_updated=result["timestamp"],
-            status="success",
-            from_cache=True
-        )
+
+        headers = {"ETag": cached["etag"], "Cache-Control": "no-cache"}
+        if _etag_matches(if_none_match, cached["etag"]):
+            return Response(status_code=304, headers=headers)
+        return Response(content=cached["body"], media_type="application/json", headers=headers)
     except HTTPException as e:
         raise e
     except Exception as e:
         logger.error(f"Fehler beim Abruf des letzten Stundenplans: {str(e)}")
         raise HTTPException(status_code=500, detail="Fehler beim Abruf des letzten Stundenplans")
+
+@router.get("/delta")
+async def get_delta(username: str, since: Optional[int] = None):
+    """
+    Liefert nur die Änderungen seit der Version, die der Client zuletzt erhalten hat.
+
+    Ist die Version unbekannt oder nicht mehr gespeichert (oder fehlt since), wird
+    der vollständige Stundenplan gesendet. Die Antwort enthält immer die aktuelle
+    Version, die der Client beim nächsten Abruf als since mitschickt.
+    """
+    try:
+        latest = await get_latest_timetable(username)
+        if not latest:
+            raise HTTPException(status_code=404, detail="Kein Stundenplan für diesen Benutzer gefunden")
+
+        timetable = json.loads(latest["data"])
+        response = {"version": latest["id"], "since": since, "last_updated": latest["timestamp"],
+                    "plan": latest.get("plan")}
+        if since == latest["id"]:
+            return {**response, "full": False, "changed": False,
+                    "diff": {"added": [], "removed": [], "changed": [], "unchanged": len(index_entries(timetable))}}
+
+        # Nur Versionen desselben Plans vergleichen, eine andere Woche wird vollständig gesendet
+        previous = await get_timetable_version(username, since) if since is not None else None
+        if previous is None or previous.get("plan") != latest.get("plan"):
+            return {**response, "full": True, "changed": True, "timetable": timetable}
+
+        diff = diff_timetables(json.loads(previous["data"]), timetable)
+        return {**response, "full": False, "changed": not is_empty(diff), "diff": diff}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Fehler beim Berechnen der Änderungen: {str(e)}")
+        raise HTTPException(status_code=500, detail="Fehler beim Berechnen der Änderungen")
+
+@router.get("/changes")
+async def get_changes(username: str, limit: int = 10, plan: Optional[str] = None):
+    """
+    Listet die Änderungen zwischen aufeinanderfolgenden gespeicherten Versionen
+    eines Plans (neueste zuerst), z.B. für Benachrichtigungen. Ohne plan wird der
+    Plan der neuesten Version verwendet. Versionen ohne Änderung werden ausgelassen.
+    """
+    if plan is None:
+        latest = await get_latest_timetable(username)
+        if not latest:
+            return {"username": username, "plan": None, "changes": []}
+        plan = latest.get("plan")
+
+    history = await get_plan_history(username, plan, max(1, min(limit, 50)) + 1)
+    changes = []
+    for newer, older in zip(history, history[1:]):
+        diff = diff_timetables(json.loads(older["data"]), json.loads(newer["data"]))
+        if not is_empty(diff):
+            changes.append({
+                "version": newer["id"],
+                "previous_version": older["id"],
+                "timestamp": newer["timestamp"],
+                "diff": diff
+            })
+    return {"username": username, "plan": plan, "changes": changes}
+
+@router.get("/ocr-cache/stats")
+async def get_ocr_cache_stats():
+    """
+    Gibt die Treffer- und Fehlzähler des OCR-Caches sowie die eingesparte OCR-Zeit zurück.
+    """
+    return get_ocr_cache().stats()
+
+@router.get("/timetable-cache/stats")
+async def get_timetable_cache_stats():
+    """
+    Gibt die Statistik des Stundenplan-Caches von /parse-plan zurück (frische/veraltete Treffer, Größe in Bytes).
+    """
+    return get_timetable_cache().stats()
+
+@router.get("/shared-cache/stats")
+async def get_shared_cache_stats():
+    """
+    Gibt die Statistik des gemeinsamen Caches dieses Workers zurück (Treffer lokal und gemeinsam, verworfene Einträge).
+    """
+    shared = get_shared_cache()
+    if shared is None:
+        return {"enabled": False}
+    return {"enabled": True, **shared.stats()}
+
+@router.get("/upstream/stats")
+async def get_upstream_stats():
+    """
+    Gibt je Upstream-Host den Zustand des Schutzschalters sowie Aufrufe, Wiederholungen,
+    Zeitüberschreitungen und abgewiesene Aufrufe zurück.
+    """
+    return get_gateway_stats()
+
+@router.get("/sessions/stats")
+async def get_session_pool_stats():
+    """
+    Gibt die Kennzahlen des DSB-Sitzungs-Pools zurück.
+    """
+    return get_session_pool().stats()
+
+@router.get("/ocr-pool/stats")
+async def get_ocr_pool_stats():
+    """
+    Gibt die Auslastung des OCR-Worker-Pools zurück.
+    """
+    pool = get_ocr_pool()
+    if pool is None:
+        return {"workers": 0, "status": "disabled"}
+    return pool.stats()
+
+@router.get("/downloads/stats")
+async def get_download_stats():
+    """
+    Gibt die Zähler der bedingten Plan-Downloads zurück (304-Antworten und eingesparte Bytes).
+    """
+    return get_http_stats()
+
+@router.post("/prefetch/register")
+async def register_prefetch(request: LoginRequest):
+    """
+    Registriert ein Konto für die Vorab-Verarbeitung: neue Pläne werden
+    periodisch abgerufen und erkannt, bevor der Benutzer danach fragt.
+    """
+    scheduler = get_prefetch_scheduler()
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="Vorab-Verarbeitung ist nicht aktiviert")
+    
+    auth_result = await authenticate_user(request.username, request.password)
+    if not auth_result:
+        raise HTTPException(status_code=401, detail="Authentifizierung fehlgeschlagen")
+    
+    scheduler.register(request.username, request.password)
+    return {"status": "registered", "username": request.username}
+
+@router.delete("/prefetch/{username}")
+async def unregister_prefetch(username: str, password: Optional[str] = Header(None, alias="X-DSB-Password")):
+    """
+    Entfernt ein Konto aus der Vorab-Verarbeitung.
+
+    Das Passwort (Header X-DSB-Password) muss zum registrierten Konto passen.
+    Nicht registrierte Konten und falsche Passwörter werden gleich beantwortet,
+    damit nicht erkennbar ist, welche Konten registriert sind.
+    """
+    scheduler = get_prefetch_scheduler()
+    if scheduler is None or not scheduler.unregister(username, password):
+        raise HTTPException(status_code=401, detail="Konto nicht registriert oder Zugangsdaten ungültig")
+    return {"status": "unregistered", "username": username}
+
+@router.get("/prefetch/status")
+async def get_prefetch_status():
+    """
+    Gibt Warteschlangentiefe und Verzögerung der Vorab-Verarbeitung zurück.
+    """
+    scheduler = get_prefetch_scheduler()
+    if scheduler is None:
+        return {"status": "disabled"}
+    return scheduler.stats()
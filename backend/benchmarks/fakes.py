@@ -0,0 +1,177 @@
+import time
+import asyncio
+import hashlib
+import httpx
+import pydsb
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from services import http_client, ocr_pool
+from services.ocr_pool import OCRPool
+
+# Basis-URL des simulierten Bild-Hosts
+PLAN_HOST = "https://plans.benchmark.invalid"
+
+
+class FakePyDSB:
+    """
+    Ersatz für pydsb.PyDSB ohne Netzwerkzugriff.
+
+    Konstruktor und get_plans verhalten sich wie die Bibliothek (Anmeldung im
+    Konstruktor, Exception bei falschen Zugangsdaten) und warten jeweils eine
+    einstellbare Latenz, um die Umlaufzeit zu DSBmobile nachzubilden.
+    """
+
+    credentials: Dict[str, str] = {}
+    plans: List[Dict] = []
+    account_plans: Dict[str, List[Dict]] = {}
+    latency = 0.0
+    logins = 0
+    plan_requests = 0
+
+    def __init__(self, username: str = None, password: str = None):
+        time.sleep(self.latency)
+        type(self).logins += 1
+        if self.credentials.get(username) != password:
+            raise Exception("Invalid Credentials")
+        self.username = username
+        self.token = hashlib.sha256(f"{username}:{password}".encode("utf-8")).hexdigest()
+
+    def get_plans(self) -> list:
+        time.sleep(self.latency)
+        type(self).plan_requests += 1
+        return [dict(plan) for plan in self.account_plans.get(self.username, self.plans)]
+
+
+class PlanHost:
+    """Simulierter Bild-Host mit ETags, damit auch bedingte Downloads gemessen werden."""
+
+    def __init__(self, images: Dict[str, bytes], latency: float = 0.0):
+        self.images = images
+        self.latency = latency
+        self.requests = 0
+
+    def url(self, title: str) -> str:
+        return f"{PLAN_HOST}/{hashlib.sha256(title.encode('utf-8')).hexdigest()[:16]}.jpg"
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        for title, content in self.images.items():
+            if str(request.url) == self.url(title):
+                etag = '"' + hashlib.sha256(content).hexdigest()[:16] + '"'
+                if request.headers.get("If-None-Match") == etag:
+                    return httpx.Response(304, headers={"ETag": etag})
+                return httpx.Response(200, content=content, headers={"ETag": etag})
+        return httpx.Response(404)
+
+
+@contextmanager
+def fake_dsb_backend(images: Dict[str, bytes], username: str = "benchmark", password: str = "benchmark",
+                     latency: float = 0.0) -> Iterator[PlanHost]:
+    """
+    Ersetzt DSBmobile und den Bild-Host für die Dauer des Blocks.
+
+    Args:
+        images: Die Plan-Bilder nach Titel (erster Eintrag = neuester Plan)
+        username: Gültiger Benutzername
+        password: Gültiges Passwort
+        latency: Simulierte Latenz je Upstream-Aufruf in Sekunden
+    """
+    with fake_dsb_accounts({username: (password, images)}, latency) as host:
+        yield host
+
+
+@contextmanager
+def fake_dsb_accounts(accounts: Dict[str, Tuple[str, Dict[str, bytes]]],
+                      latency: float = 0.0) -> Iterator[PlanHost]:
+    """
+    Wie fake_dsb_backend, aber mit mehreren Konten, die jeweils eigene Pläne sehen.
+
+    Args:
+        accounts: Passwort und Plan-Bilder nach Titel je Benutzername; Konten derselben
+            Schule teilen sich dasselbe Dictionary der Bilder
+        latency: Simulierte Latenz je Upstream-Aufruf in Sekunden
+    """
+    images: Dict[str, bytes] = {}
+    for _, account_images in accounts.values():
+        images.update(account_images)
+    host = PlanHost(images, latency)
+
+    def listing(account_images: Dict[str, bytes]) -> List[Dict]:
+        return [
+            {"id": str(i), "is_html": False, "uploaded_date": "14.04.2025 07:30", "title": title,
+             "url": host.url(title), "preview_url": host.url(title)}
+            for i, title in enumerate(account_images)
+        ]
+
+    FakePyDSB.credentials = {username: password for username, (password, _) in accounts.items()}
+    FakePyDSB.account_plans = {username: listing(account_images) for username, (_, account_images) in accounts.items()}
+    FakePyDSB.plans = []
+    FakePyDSB.latency = latency
+    FakePyDSB.logins = 0
+    FakePyDSB.plan_requests = 0
+
+    original_pydsb = pydsb.PyDSB
+    original_client = http_client._client
+    pydsb.PyDSB = FakePyDSB
+    http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(host.handle))
+    try:
+        yield host
+    finally:
+        pydsb.PyDSB = original_pydsb
+        http_client._client = original_client
+
+
+class FakeReader:
+    """
+    Ersatz für den EasyOCR Reader, falls die Modelle nicht verfügbar sind.
+
+    Gibt für jede Box einen festen Text zurück und wartet je Box bzw. Seite eine
+    einstellbare Zeit, sodass sich die Kosten proportional zur Anzahl der
+    erkannten Zeilen verhalten.
+    """
+
+    def __init__(self, seconds_per_box: float = 0.0, seconds_per_page: float = 0.0):
+        self.seconds_per_box = seconds_per_box
+        self.seconds_per_page = seconds_per_page
+
+    def recognize(self, gray, horizontal_list=None, free_list=None, detail=1, **kwargs):
+        boxes = horizontal_list or []
+        time.sleep(self.seconds_per_box * len(boxes))
+        return [
+            ([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], "LF 04.6 (Mich) Raum 423", 0.9)
+            for x0, x1, y0, y1 in boxes
+        ]
+
+    def readtext(self, gray, **kwargs):
+        time.sleep(self.seconds_per_page)
+        return [([[0, 0], [100, 0], [100, 20], [0, 20]], "Stundenplan MTL 01", 0.9)]
+
+    def readtext_batched(self, images, **kwargs):
+        return [self.readtext(image) for image in images]
+
+
+class ThreadOCRPool(OCRPool):
+    """
+    OCR-Pool mit Threads statt Worker-Prozessen und einem vorgegebenen Reader.
+
+    Verhält sich bei Warteschlange, Ablehnung (OCRQueueFull) und Kennzahlen wie
+    der echte Pool, lädt aber keine EasyOCR-Modelle, sodass sich die Auslastung
+    auch mit dem FakeReader messen lässt.
+    """
+
+    def __init__(self, workers: int, queue_size: int, reader):
+        super().__init__(workers=workers, queue_size=queue_size, torch_threads=1)
+        self.reader = reader
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        ocr_pool._worker_reader = self.reader
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fake-ocr")
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        ocr_pool._worker_reader = None
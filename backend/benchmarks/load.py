@@ -0,0 +1,375 @@
+"""
+Lasttest für das Backend.
+
+Simuliert N gleichzeitige Nutzer gegen die ASGI-Anwendung einer einzelnen
+Backend-Instanz. DSBmobile und der Bild-Host werden lokal ersetzt
+(benchmarks.fakes), die OCR läuft mit den echten Modellen oder dem FakeReader
+in einem OCR-Pool mit begrenzter Warteschlange. Szenarien:
+
+    morning-rush    alle Nutzer rufen gleichzeitig POST /parse-plan für dasselbe Konto ab
+    many-accounts   jeder Nutzer hat ein eigenes Konto; die Konten verteilen sich auf
+                    --schools Schulen mit jeweils eigenem Plan (0 = eine Schule je Konto)
+    latest-polling  jeder Nutzer fragt GET /latest für sein Konto mit If-None-Match ab
+
+Der Bericht enthält je Szenario Durchsatz, p50/p95/p99 und Fehlerquote je
+Endpunkt, die Auslastung der OCR-Warteschlange und die Aufrufe beim
+Upstream-Ersatz. Das Ratenlimit des Upstream-Gateways (UPSTREAM_*) bleibt
+bewusst auf der Konfiguration der Instanz, da es die Kapazität mitbestimmt.
+
+Aufruf aus dem backend-Verzeichnis:
+
+    python -m benchmarks.load --scenario all --users 50 --duration 30
+    python -m benchmarks.load --scenario many-accounts --users 100 --schools 10 --ocr-workers 4
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from benchmarks.synthetic_plans import render_plan, encode
+from benchmarks.fakes import FakePyDSB, FakeReader, ThreadOCRPool, fake_dsb_accounts
+from benchmarks.run import git_commit, reset_caches, select_reader, summarize
+from services import ocr_pool, ocr_service
+from services.db import store_timetable
+
+SCENARIOS = ["morning-rush", "many-accounts", "latest-polling"]
+
+PARSE_PLAN = "POST /api/dsb/parse-plan"
+LATEST = "GET /api/dsb/latest"
+
+# Eine Anfrage eines simulierten Nutzers
+UserRequest = Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]
+
+
+class LoadRecorder:
+    """Sammelt Laufzeit und Statuscode jeder Anfrage je Endpunkt."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, status: str, seconds: float) -> None:
+        self.samples.setdefault(endpoint, []).append(seconds)
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    @staticmethod
+    def is_error(status: str) -> bool:
+        """Alles außer 2xx und 304 (unverändert) zählt als Fehler."""
+        return not (status.startswith("2") or status == "304")
+
+    def report(self, elapsed: float) -> Dict:
+        """Gibt Durchsatz sowie Latenzen und Fehlerquote je Endpunkt zurück."""
+        endpoints = {}
+        total = errors = 0
+        for endpoint, samples in self.samples.items():
+            counts = self.statuses[endpoint]
+            failed = sum(count for status, count in counts.items() if self.is_error(status))
+            endpoints[endpoint] = {
+                **summarize(samples),
+                "throughput_rps": round(len(samples) / elapsed, 3),
+                "errors": failed,
+                "error_rate": round(failed / len(samples), 4),
+                "status": dict(sorted(counts.items())),
+            }
+            total += len(samples)
+            errors += failed
+        return {
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 3) if elapsed else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class QueueSampler:
+    """
+    Tastet die Auslastung des OCR-Pools in festen Abständen ab.
+
+    Gesättigt ist der Pool, wenn alle Worker belegt und alle Plätze der
+    Warteschlange vergeben sind; neue Aufträge werden dann mit 503 abgelehnt.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: List[Tuple[int, int]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._initial: Dict = {}
+
+    def start(self) -> None:
+        pool = ocr_pool.get_ocr_pool()
+        self._initial = pool.stats() if pool is not None else {}
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            pool = ocr_pool.get_ocr_pool()
+            if pool is not None:
+                stats = pool.stats()
+                self.samples.append((stats["in_progress"], stats["queue_depth"]))
+            await asyncio.sleep(self.interval)
+
+    async def stop(self) -> Dict:
+        """Beendet die Abtastung und fasst sie zusammen."""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        pool = ocr_pool.get_ocr_pool()
+        if pool is None:
+            return {"pool": False}
+        stats = pool.stats()
+        samples = self.samples or [(0, 0)]
+        busy = [in_progress for in_progress, _ in samples]
+        depths = [depth for _, depth in samples]
+        return {
+            "pool": True,
+            "workers": stats["workers"],
+            "capacity": stats["capacity"],
+            "samples": len(self.samples),
+            "mean_busy_workers": round(statistics.mean(busy), 3),
+            "mean_queue_depth": round(statistics.mean(depths), 3),
+            "max_queue_depth": max(depths),
+            "saturation": round(
+                sum(1 for in_progress, depth in samples if in_progress + depth >= stats["capacity"]) / len(samples), 4),
+            "completed": stats["completed"] - self._initial.get("completed", 0),
+            "rejected": stats["rejected"] - self._initial.get("rejected", 0),
+            "avg_duration": stats["avg_duration"],
+        }
+
+
+def school_images(schools: int) -> List[Dict[str, bytes]]:
+    """Erzeugt je Schule einen eigenen Plan (eigene Klasse, eigener Inhalt)."""
+    return [
+        {f"14.04.-18.04.25_MTA MTL {school + 1:02d}":
+            encode(render_plan(1754, 1240, class_name=f"MTL {school + 1:02d}", seed=school + 1), "jpeg-q75")}
+        for school in range(schools)
+    ]
+
+
+def build_accounts(scenario: str, users: int, schools: int) -> Tuple[Dict[str, Tuple[str, Dict[str, bytes]]], List[str]]:
+    """
+    Legt die Konten eines Szenarios an.
+
+    Returns:
+        Passwort und Plan-Bilder je Benutzername sowie den Benutzernamen je simuliertem Nutzer
+    """
+    if scenario == "morning-rush":
+        images = school_images(1)[0]
+        return {"rush": ("rush", images)}, ["rush"] * users
+
+    plans = school_images(schools or users)
+    accounts = {
+        f"user{index:04d}": (f"pw{index:04d}", plans[index % len(plans)])
+        for index in range(users)
+    }
+    return accounts, list(accounts)
+
+
+async def seed_latest(accounts: Dict[str, Tuple[str, Dict[str, bytes]]]) -> None:
+    """Legt für jedes Konto einen erkannten Stundenplan ab, wie es ein früherer Abruf getan hätte."""
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    for username, (_, images) in accounts.items():
+        title, image_data = next(iter(images.items()))
+        timetable = await ocr_service.process_ocr(image_data)
+        await store_timetable(username, timetable, image_data, timestamp, [], [title.split("_MTA ")[-1]])
+
+
+def parse_plan_request(username: str, password: str) -> UserRequest:
+    """Nutzer, der den aktuellen Plan per POST /parse-plan anfordert."""
+    async def send(client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post("/api/dsb/parse-plan", json={"username": username, "password": password})
+    return send
+
+
+def latest_request(username: str) -> UserRequest:
+    """Nutzer, der GET /latest abfragt und den zuletzt gesehenen ETag mitschickt."""
+    etag = None
+
+    async def send(client: httpx.AsyncClient) -> httpx.Response:
+        nonlocal etag
+        headers = {"If-None-Match": etag} if etag else {}
+        response = await client.get("/api/dsb/latest", params={"username": username}, headers=headers)
+        etag = response.headers.get("ETag", etag)
+        return response
+    return send
+
+
+async def simulate_user(client: httpx.AsyncClient, endpoint: str, send: UserRequest, recorder: LoadRecorder,
+                        deadline: float, start_delay: float, think_time: float, rng: random.Random) -> None:
+    """Sendet bis zum Ende des Szenarios Anfragen, jeweils gefolgt von einer zufälligen Denkpause."""
+    await asyncio.sleep(start_delay)
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status = str((await send(client)).status_code)
+        except Exception as e:
+            status = type(e).__name__
+        recorder.record(endpoint, status, time.perf_counter() - started)
+        await asyncio.sleep(think_time * rng.uniform(0.5, 1.5))
+
+
+def start_pool(backend: str, workers: int, queue_size: int, seconds_per_box: float) -> Optional[ocr_pool.OCRPool]:
+    """Startet den OCR-Pool für ein Szenario (workers=0: OCR im Prozess ohne Warteschlange)."""
+    if workers <= 0:
+        return None
+    if backend == "fake":
+        pool = ThreadOCRPool(workers, queue_size, FakeReader(seconds_per_box=seconds_per_box))
+    else:
+        pool = ocr_pool.OCRPool(workers=workers, queue_size=queue_size,
+                                torch_threads=max(1, (os.cpu_count() or 1) // workers))
+    pool.start()
+    ocr_pool._ocr_pool = pool
+    return pool
+
+
+async def run_scenario(scenario: str, args: argparse.Namespace, backend: str) -> Dict:
+    """Führt ein Szenario mit frischen Caches und eigenem OCR-Pool aus."""
+    from main import app
+
+    reset_caches()
+    accounts, usernames = build_accounts(scenario, args.users, args.schools)
+    rng = random.Random(args.seed)
+    pool = start_pool(backend, args.ocr_workers, args.ocr_queue_size, args.fake_seconds_per_box)
+    try:
+        with fake_dsb_accounts(accounts, latency=args.upstream_latency) as host:
+            if scenario == "latest-polling":
+                await seed_latest(accounts)
+                users = [(LATEST, latest_request(username)) for username in usernames]
+            else:
+                users = [(PARSE_PLAN, parse_plan_request(username, accounts[username][0])) for username in usernames]
+            FakePyDSB.logins = FakePyDSB.plan_requests = host.requests = 0
+
+            recorder = LoadRecorder()
+            sampler = QueueSampler(args.sample_interval)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+                sampler.start()
+                started = time.perf_counter()
+                deadline = started + args.duration
+                await asyncio.gather(*(
+                    simulate_user(client, endpoint, send, recorder, deadline, rng.uniform(0, args.ramp_up),
+                                  args.think_time, random.Random(rng.random()))
+                    for endpoint, send in users
+                ))
+                elapsed = time.perf_counter() - started
+                ocr_queue = await sampler.stop()
+
+            upstream = {"logins": FakePyDSB.logins, "plan_requests": FakePyDSB.plan_requests,
+                        "image_requests": host.requests}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+            ocr_pool._ocr_pool = None
+
+    return {
+        "users": args.users,
+        "accounts": len(accounts),
+        "duration_s": round(elapsed, 3),
+        **recorder.report(elapsed),
+        "ocr_queue": ocr_queue,
+        "upstream": upstream,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    """Führt die gewählten Szenarien nacheinander aus und gibt den Bericht samt Metadaten zurück."""
+    backend = select_reader(args.ocr, args.fake_seconds_per_box)
+    scenarios = SCENARIOS if args.scenario == "all" else [args.scenario]
+    results = {}
+    for scenario in scenarios:
+        results[scenario] = await run_scenario(scenario, args, backend)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ocr_backend": backend,
+            "ocr_workers": args.ocr_workers,
+            "ocr_queue_size": args.ocr_queue_size,
+            "users": args.users,
+            "duration": args.duration,
+            "ramp_up": args.ramp_up,
+            "think_time": args.think_time,
+            "upstream_latency": args.upstream_latency,
+        },
+        "scenarios": results,
+    }
+
+
+def print_report(report: Dict) -> None:
+    """Gibt eine kurze Übersicht je Szenario und Endpunkt aus."""
+    for scenario, result in report["scenarios"].items():
+        queue = result["ocr_queue"]
+        saturation = f", OCR-Sättigung {queue['saturation']:.0%}, abgelehnt {queue['rejected']}" if queue["pool"] else ""
+        print(f"{scenario}: {result['throughput_rps']} Anfragen/s, Fehlerquote {result['error_rate']:.1%}{saturation}")
+        for endpoint, stats in result["endpoints"].items():
+            print(f"  {endpoint}: n={stats['n']} p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms "
+                  f"p99={stats['p99_ms']}ms Fehler={stats['errors']}")
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Lasttest für DSB But Better")
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all", help="Auszuführendes Szenario")
+    parser.add_argument("--output", default="benchmarks/results/load.json", help="Zieldatei für den Bericht")
+    parser.add_argument("--users", type=int, default=20, help="Anzahl gleichzeitiger Nutzer")
+    parser.add_argument("--duration", type=float, default=10.0, help="Dauer je Szenario in Sekunden")
+    parser.add_argument("--ramp-up", type=float, default=1.0,
+                        help="Zeitraum in Sekunden, über den die Nutzer zufällig verteilt starten")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="Mittlere Pause eines Nutzers zwischen zwei Anfragen in Sekunden")
+    parser.add_argument("--schools", type=int, default=0,
+                        help="Schulen mit eigenem Plan bei many-accounts und latest-polling (0 = eine je Konto)")
+    parser.add_argument("--ocr", choices=["auto", "easyocr", "fake"], default="auto", help="OCR-Backend")
+    parser.add_argument("--fake-seconds-per-box", type=float, default=0.02,
+                        help="Simulierte Erkennungszeit je Textzeile beim FakeReader")
+    parser.add_argument("--ocr-workers", type=int, default=2, help="OCR-Worker (0 = OCR im Prozess ohne Pool)")
+    parser.add_argument("--ocr-queue-size", type=int, default=8, help="Plätze in der Warteschlange des OCR-Pools")
+    parser.add_argument("--upstream-latency", type=float, default=0.05,
+                        help="Simulierte Latenz je Aufruf an DSBmobile bzw. den Bild-Host in Sekunden")
+    parser.add_argument("--sample-interval", type=float, default=0.05,
+                        help="Abstand der Messungen der OCR-Warteschlange in Sekunden")
+    parser.add_argument("--seed", type=int, default=0, help="Startwert für Startzeitpunkte und Denkpausen")
+    return parser.parse_args(argv)
+
+
+def main() -> int:
+    """Kommandozeilen-Einstieg."""
+    args = parse_args()
+
+    # Lokaler Speicher ohne Festplatten-Tiers, damit die Läufe reproduzierbar bleiben
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    os.environ.setdefault("OCR_CACHE_DIR", "")
+    os.environ.setdefault("PLAN_CACHE_DIR", "")
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    report = asyncio.run(run(args))
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Ergebnisse gespeichert: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Benchmark-Suite für das Backend.
+
+Misst Bild-Dekodierung, Rastererkennung, OCR, Planabruf und die Ende-zu-Ende-Latenz
+von /api/dsb/parse-plan gegen einen lokalen Ersatz für DSBmobile und schreibt die
+Ergebnisse als JSON. Mit --baseline wird gegen einen früheren Lauf verglichen.
+
+Aufruf aus dem backend-Verzeichnis:
+
+    python -m benchmarks.run --output benchmarks/results/latest.json
+    python -m benchmarks.run --baseline benchmarks/results/main.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+from typing import Any, Callable, Dict, List
+
+import httpx
+from loguru import logger
+
+from benchmarks.synthetic_plans import plan_variants, render_plan, encode
+from benchmarks.fakes import FakeReader, fake_dsb_backend
+from services import db, http_client, ocr_service
+from services.image_ingest import decode_gray
+from services.ocr_cache import get_ocr_cache
+from services.session_pool import get_session_pool
+from services.timetable_cache import get_timetable_cache
+from services.table_segmentation import detect_grid
+from services.dsb_service import authenticate_user, find_timetable_plans
+
+USERNAME = "benchmark"
+PASSWORD = "benchmark"
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Gibt das Perzentil einer aufsteigend sortierten Liste zurück (nächster Rang)."""
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Fasst Laufzeiten in Sekunden als Kennzahlen in Millisekunden zusammen."""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def measure(func: Callable[[], Any], iterations: int, setup: Callable[[], Any] = None) -> Dict[str, float]:
+    """Misst eine synchrone Funktion; setup läuft vor jeder Wiederholung und wird nicht gemessen."""
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+async def measure_async(func: Callable[[], Any], iterations: int, setup: Callable[[], Any] = None) -> Dict[str, float]:
+    """Wie measure, aber für Coroutine-Funktionen."""
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def reset_caches() -> None:
+    """Leert alle Caches, damit ein kalter Abruf gemessen wird."""
+    get_ocr_cache().clear()
+    get_session_pool().clear()
+    get_timetable_cache().clear()
+    http_client._validators = None
+    db.TIMETABLE_CACHE.clear()
+
+
+def select_reader(mode: str, seconds_per_box: float) -> str:
+    """
+    Wählt den OCR-Reader: echte EasyOCR-Modelle oder den FakeReader.
+
+    Returns:
+        Das verwendete Backend ("easyocr" oder "fake")
+    """
+    if mode in ("auto", "easyocr"):
+        if ocr_service.get_reader() is not None:
+            return "easyocr"
+        if mode == "easyocr":
+            raise SystemExit("EasyOCR-Modelle nicht verfügbar")
+        logger.warning("EasyOCR-Modelle nicht verfügbar, verwende FakeReader")
+    ocr_service._reader = FakeReader(seconds_per_box=seconds_per_box)
+    return "fake"
+
+
+def bench_decode(variants: Dict[str, bytes], iterations: int) -> Dict[str, Dict]:
+    """Dekodierung der Plan-Bilder in Graustufen (je Auflösung und Kodierung)."""
+    return {name: measure(lambda data=data: decode_gray(data), iterations) for name, data in variants.items()}
+
+
+def bench_grid_detection(variants: Dict[str, bytes], iterations: int) -> Dict[str, Dict]:
+    """Rastererkennung auf bereits dekodierten Bildern (je Auflösung, unabhängig von der Kodierung)."""
+    results = {}
+    for name, data in variants.items():
+        resolution = name.split("/")[0]
+        if resolution in results:
+            continue
+        gray = decode_gray(data)
+        results[resolution] = measure(lambda gray=gray: detect_grid(gray), iterations)
+    return results
+
+
+async def bench_process_ocr(variants: Dict[str, bytes], iterations: int) -> Dict[str, Dict]:
+    """process_ocr ohne Cache (kalt) und mit Cache-Treffer (warm)."""
+    results = {}
+    for name, data in variants.items():
+        results[f"{name}/cold"] = await measure_async(
+            lambda data=data: ocr_service.process_ocr(data), iterations, setup=get_ocr_cache().clear)
+        results[f"{name}/warm"] = await measure_async(lambda data=data: ocr_service.process_ocr(data), iterations)
+    return results
+
+
+async def bench_plan_listing(iterations: int) -> Dict[str, Dict]:
+    """Anmeldung und Planliste, mit leerem (kalt) und gefülltem Sitzungs-Pool (warm)."""
+    async def list_all():
+        client = await authenticate_user(USERNAME, PASSWORD)
+        await find_timetable_plans(client)
+
+    return {
+        "cold": await measure_async(list_all, iterations, setup=get_session_pool().clear),
+        "warm": await measure_async(list_all, iterations),
+    }
+
+
+async def bench_parse_plan(iterations: int) -> Dict[str, Dict]:
+    """Ende-zu-Ende-Latenz von POST /api/dsb/parse-plan über die ASGI-Anwendung."""
+    from main import app
+
+    async def request():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+            response = await client.post("/api/dsb/parse-plan", json={"username": USERNAME, "password": PASSWORD})
+            response.raise_for_status()
+
+    return {
+        "cold": await measure_async(request, iterations, setup=reset_caches),
+        "warm": await measure_async(request, iterations),
+    }
+
+
+def git_commit() -> str:
+    """Gibt den aktuellen Commit zurück (leer, falls kein Git verfügbar ist)."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Vergleicht die p50-Werte mit einem früheren Lauf.
+
+    Returns:
+        Beschreibungen aller Messungen, die um mehr als tolerance langsamer geworden sind
+    """
+    regressions = []
+    for group, entries in results["results"].items():
+        for name, stats in entries.items():
+            previous = baseline.get("results", {}).get(group, {}).get(name)
+            if previous and stats["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{group}/{name}: p50 {previous['p50_ms']}ms -> {stats['p50_ms']}ms")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    """Führt alle Benchmarks aus und gibt den Bericht samt Metadaten zurück."""
+    variants = plan_variants(resolutions=args.resolutions, encodings=args.encodings)
+    ocr_backend = select_reader(args.ocr, args.fake_seconds_per_box)
+
+    # Der simulierte Host liefert den neuesten Plan zuerst
+    latest = encode(render_plan(1754, 1240, seed=1), "jpeg-q75")
+    images = {"14.04.-18.04.25_MTA MTL 01": latest, "07.04.-11.04.25_MTA MTL 01": variants[next(iter(variants))]}
+
+    results = {
+        "decode": bench_decode(variants, args.iterations),
+        "grid_detection": bench_grid_detection(variants, args.iterations),
+        "process_ocr": await bench_process_ocr(variants, args.ocr_iterations),
+    }
+    with fake_dsb_backend(images, USERNAME, PASSWORD, latency=args.upstream_latency):
+        results["plan_listing"] = await bench_plan_listing(args.iterations)
+        results["parse_plan"] = await bench_parse_plan(args.ocr_iterations)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ocr_backend": ocr_backend,
+            "iterations": args.iterations,
+            "ocr_iterations": args.ocr_iterations,
+            "upstream_latency": args.upstream_latency,
+        },
+        "results": results,
+    }
+
+
+def main() -> int:
+    """Kommandozeilen-Einstieg; Exit-Code 1, wenn gegenüber --baseline Regressionen gefunden wurden."""
+    parser = argparse.ArgumentParser(description="Benchmarks für DSB But Better")
+    parser.add_argument("--output", default="benchmarks/results/latest.json", help="Zieldatei für die Ergebnisse")
+    parser.add_argument("--baseline", help="Früherer Lauf zum Vergleich (Exit-Code 1 bei Regressionen)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Erlaubte Verlangsamung des p50 (0.2 = 20%%)")
+    parser.add_argument("--iterations", type=int, default=20, help="Wiederholungen für schnelle Messungen")
+    parser.add_argument("--ocr-iterations", type=int, default=5, help="Wiederholungen für OCR-Messungen")
+    parser.add_argument("--ocr", choices=["auto", "easyocr", "fake"], default="auto", help="OCR-Backend")
+    parser.add_argument("--fake-seconds-per-box", type=float, default=0.002,
+                        help="Simulierte Erkennungszeit je Textzeile beim FakeReader")
+    parser.add_argument("--upstream-latency", type=float, default=0.05,
+                        help="Simulierte Latenz je Aufruf an DSBmobile bzw. den Bild-Host in Sekunden")
+    parser.add_argument("--resolutions", nargs="*", help="Auflösungen aus synthetic_plans.RESOLUTIONS")
+    parser.add_argument("--encodings", nargs="*", help="Kodierungen aus synthetic_plans.ENCODINGS")
+    args = parser.parse_args()
+
+    # Lokaler Speicher ohne Festplatten-Tiers, damit die Läufe reproduzierbar bleiben
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    os.environ.setdefault("OCR_CACHE_DIR", "")
+    os.environ.setdefault("PLAN_CACHE_DIR", "")
+    # Das Ratenlimit des Upstream-Gateways würde sonst die Wiederholungen gegen den lokalen Ersatz drosseln
+    os.environ.setdefault("UPSTREAM_RATE", "1000")
+    os.environ.setdefault("UPSTREAM_BURST", "1000")
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    report = asyncio.run(run(args))
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Ergebnisse gespeichert: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
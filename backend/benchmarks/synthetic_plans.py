@@ -0,0 +1,111 @@
+import io
+import random
+from PIL import Image, ImageDraw, ImageFont
+from typing import Dict, List, Tuple
+
+from services.table_segmentation import DAYS, PERIODS
+
+# Auflösungen typischer Plan-Bilder (Bildschirmfoto, A4 bei 150 dpi, A4 bei 300 dpi)
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "small": (1240, 877),
+    "a4-150dpi": (1754, 1240),
+    "a4-300dpi": (3508, 2480),
+}
+
+# Kodierungen, in denen DSBmobile Pläne ausliefert
+ENCODINGS: Dict[str, Dict] = {
+    "jpeg-q75": {"format": "JPEG", "quality": 75},
+    "jpeg-q95": {"format": "JPEG", "quality": 95},
+    "png": {"format": "PNG"},
+}
+
+SUBJECTS = ["LF 04.6", "LF 02.2", "LF 01.1", "Deutsch", "Englisch", "Politik", "Religion"]
+TEACHERS = ["(Mich)", "(Sch)", "(Web)", "(Hof)", "(Kra)"]
+ROOMS = ["Raum 423", "Raum 118", "Labor", "Raum 207", "Aula"]
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    """Skalierbare Standardschrift (fällt bei älteren Pillow-Versionen auf die Bitmap-Schrift zurück)."""
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def render_plan(width: int, height: int, class_name: str = "MTL 01", seed: int = 0,
+                fill_ratio: float = 0.7) -> Image.Image:
+    """
+    Zeichnet einen Wochenplan im MTL-Layout: Überschrift, Kopfzeile mit den Tagen,
+    Kopfspalte mit den Blöcken und beschriftete Zellen.
+
+    Args:
+        width: Breite in Pixeln
+        height: Höhe in Pixeln
+        class_name: Klassenbezeichnung in der Überschrift
+        seed: Startwert für die Belegung der Zellen
+        fill_ratio: Anteil der belegten Zellen
+
+    Returns:
+        Das Bild im Graustufenmodus
+    """
+    rng = random.Random(seed)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    text_size = max(10, height // 60)
+    font = _font(text_size)
+    line = max(1, width // 800)
+
+    draw.text((width * 0.03, height * 0.02), f"Stundenplan {class_name} KW 16", fill=0, font=_font(text_size * 2))
+
+    left, top = int(width * 0.02), int(height * 0.1)
+    right, bottom = int(width * 0.98), int(height * 0.97)
+    cols = len(DAYS) + 1
+    rows = len(PERIODS) + 1
+    col_width = (right - left) / cols
+    row_height = (bottom - top) / rows
+
+    for i in range(rows + 1):
+        y = int(top + i * row_height)
+        draw.line([(left, y), (right, y)], fill=0, width=line)
+    for i in range(cols + 1):
+        x = int(left + i * col_width)
+        draw.line([(x, top), (x, bottom)], fill=0, width=line)
+
+    for i, day in enumerate(DAYS):
+        draw.text((left + (i + 1) * col_width + text_size, top + text_size), day, fill=0, font=font)
+    for j, period in enumerate(PERIODS):
+        draw.text((left + text_size, top + (j + 1) * row_height + text_size), period, fill=0, font=font)
+
+    for i in range(len(DAYS)):
+        for j in range(len(PERIODS)):
+            if rng.random() > fill_ratio:
+                continue
+            x = left + (i + 1) * col_width + text_size
+            y = top + (j + 1) * row_height + text_size
+            draw.text((x, y), f"{rng.choice(SUBJECTS)} {rng.choice(TEACHERS)}", fill=0, font=font)
+            draw.text((x, y + text_size * 1.6), rng.choice(ROOMS), fill=0, font=font)
+    return image
+
+
+def encode(image: Image.Image, encoding: str) -> bytes:
+    """Kodiert ein Bild in einer der ENCODINGS."""
+    options = dict(ENCODINGS[encoding])
+    output = io.BytesIO()
+    image.save(output, **options)
+    return output.getvalue()
+
+
+def plan_variants(resolutions: List[str] = None, encodings: List[str] = None) -> Dict[str, bytes]:
+    """
+    Erzeugt alle Kombinationen aus Auflösung und Kodierung.
+
+    Returns:
+        Die kodierten Bilder nach Namen, z.B. "a4-150dpi/jpeg-q75"
+    """
+    variants = {}
+    for resolution in resolutions or list(RESOLUTIONS):
+        width, height = RESOLUTIONS[resolution]
+        image = render_plan(width, height)
+        for encoding in encodings or list(ENCODINGS):
+            variants[f"{resolution}/{encoding}"] = encode(image, encoding)
+    return variants
@@ -1,14 +1,23 @@
 import os
-from fastapi import FastAPI, HTTPException, Depends
+import time
+import asyncio
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from loguru import logger
 import uvicorn
 
 from app.api import router as api_router
-from services.db import init_db
+from services.db import init_db, close_db
+from services.ocr_pool import start_ocr_pool, stop_ocr_pool, get_ocr_pool
+from services.http_client import start_http_client, close_http_client
+from services.prefetch import start_prefetch_scheduler, stop_prefetch_scheduler, get_prefetch_scheduler
+from services.jobs import get_job_queue, stop_job_queue
+from services.ocr_service import warm_up_ocr, skip_warm_up, get_warmup_state
+from services.metrics import QUEUE_DEPTH, REQUESTS_IN_FLIGHT, REQUEST_DURATION, get_metrics_registry
+from services.profiling import RequestProfile, get_profiler, new_request_id, start_request_profile, stop_request_profile
 
 # Load environment variables
 load_dotenv()
@@ -34,21 +43,112 @@ app.add_middleware(
 # Include API router
 app.include_router(api_router, prefix="/api")
 
+def _route_path(request: Request) -> str:
+    """Route template of a handled request (e.g. /api/dsb/jobs/{job_id}) to keep metric labels bounded"""
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    # The route template is relative to the prefixes of included routers; they are static,
+    # so they are taken from the path segments in front of the template's segments
+    depth = route.path.count("/")
+    prefix = "/".join(request.url.path.split("/")[:-depth]) if depth else ""
+    return prefix + route.path
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Record in-flight requests and request latency per route"""
+    REQUESTS_IN_FLIGHT.inc(method=request.method)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec(method=request.method)
+        REQUEST_DURATION.observe(time.perf_counter() - started, method=request.method,
+                                 path=_route_path(request), status=str(status))
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Attach a request id and run admin-requested (X-Profile header) or sampled requests under the profiler"""
+    request_id = new_request_id(request.headers.get("X-Request-ID"))
+    profiler = get_profiler()
+    trigger = profiler.trigger(request.headers.get("X-Profile")) if profiler.enabled else None
+    if trigger is None:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        return response
+
+    profile = RequestProfile(request_id, request.method, request.url.path, trigger)
+    profiler.active = True
+    token = start_request_profile(profile)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        stop_request_profile(profile, token)
+        profiler.active = False
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, profiler.save, profile, status, time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Failed to save profile {request_id}: {str(e)}")
+    response.headers["X-Request-ID"] = request_id
+    response.headers["X-Profile-ID"] = request_id
+    return response
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database connection and other services on startup"""
     logger.info("Starting up DSB But Better API")
     await init_db()
+    start_http_client()
+    start_ocr_pool()
+    
+    # Warm up OCR models in the background, /ready reports ready afterwards
+    if os.getenv("OCR_WARMUP", "true").lower() in ("1", "true", "yes"):
+        app.state.warmup_task = asyncio.create_task(warm_up_ocr())
+    else:
+        skip_warm_up()
+    
+    start_prefetch_scheduler()
+    get_job_queue().start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close connections and perform cleanup on shutdown"""
     logger.info("Shutting down DSB But Better API")
+    await stop_job_queue()
+    await stop_prefetch_scheduler()
+    await close_http_client()
+    stop_ocr_pool()
+    await close_db()
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"status": "online", "message": "DSB But Better API is running"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness check: only ready once the OCR models have been warmed up"""
+    state = get_warmup_state()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "error": state["error"]})
+    return {"status": "ready", "warmup_seconds": state["duration"]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: stage latencies, cache hits/misses, queue depths, upstream errors, in-flight requests"""
+    pool = get_ocr_pool()
+    QUEUE_DEPTH.set(pool.queue_depth if pool is not None else 0, queue="ocr")
+    QUEUE_DEPTH.set(get_job_queue().stats()["queue_depth"], queue="jobs")
+    scheduler = get_prefetch_scheduler()
+    QUEUE_DEPTH.set(scheduler.stats()["queue_depth"] if scheduler is not None else 0, queue="prefetch")
+    return PlainTextResponse(get_metrics_registry().render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,65 @@
+import re
+from typing import Dict, List, Optional
+
+# Klassenbezeichnungen wie "MTL01", "MTL 02" oder "mtl 3"
+CLASS_PATTERN = re.compile(r'MTL\s*(\d+)', re.IGNORECASE)
+
+
+def normalize_class(name: str) -> str:
+    """Bringt eine Klassenbezeichnung in die Form "MTL 01"."""
+    match = CLASS_PATTERN.search(name or "")
+    if match:
+        return f"MTL {int(match.group(1)):02d}"
+    return (name or "").strip()
+
+
+def build_class_index(timetable: Dict) -> Dict[str, List[int]]:
+    """
+    Ordnet jeder Klasse die Positionen ihrer Einträge zu.
+
+    Ein Eintrag gehört zu der Klasse in seinem Feld "class", sonst zu den im
+    Text genannten Klassen und ohne Nennung zu allen Klassen des Plans (ein
+    MTL-Plan gilt in der Regel für genau eine Klasse).
+
+    Args:
+        timetable: Der Stundenplan mit entries und class_names
+
+    Returns:
+        Die Positionen in timetable["entries"] je Klasse
+    """
+    classes = [normalize_class(name) for name in timetable.get("class_names", [])]
+    index: Dict[str, List[int]] = {name: [] for name in classes}
+    for position, entry in enumerate(timetable.get("entries", [])):
+        if entry.get("class"):
+            targets = [normalize_class(entry["class"])]
+        else:
+            mentioned = [normalize_class(match.group(0)) for match in CLASS_PATTERN.finditer(entry.get("text", ""))]
+            targets = list(dict.fromkeys(mentioned)) or classes
+        for name in targets:
+            index.setdefault(name, []).append(position)
+    return index
+
+
+def select_class(timetable: Dict, class_name: Optional[str]) -> Dict:
+    """
+    Gibt den Stundenplan nur mit den Einträgen einer Klasse zurück.
+
+    Verwendet den beim Erkennen erstellten Index (class_index) und baut ihn nur
+    für ältere gespeicherte Versionen ohne Index nachträglich auf.
+
+    Args:
+        timetable: Der vollständige Stundenplan
+        class_name: Die gewünschte Klasse oder None für den vollständigen Plan
+
+    Returns:
+        Den gefilterten Stundenplan (ohne class_index) mit selected_class
+    """
+    if not class_name:
+        return timetable
+    index = timetable.get("class_index") or build_class_index(timetable)
+    selected = normalize_class(class_name)
+    entries = timetable.get("entries", [])
+    filtered = {key: value for key, value in timetable.items() if key != "class_index"}
+    filtered["entries"] = [entries[position] for position in index.get(selected, []) if position < len(entries)]
+    filtered["selected_class"] = selected
+    return filtered
@@ -1,73 +1,486 @@
 import os
 import json
 import time
+import base64
+import hashlib
+import asyncio
 from loguru import logger
 from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
 
+from services.timetable_store import DEFAULT_MAX_VERSIONS, SQLiteTimetableStore
+from services.metrics import observe_stage, stage_timer, record_cache
+from services.shared_cache import get_shared_cache, close_shared_cache
+from services.class_index import normalize_class, select_class
+
 # Lade Umgebungsvariablen
 load_dotenv()
 
-# In-Memory Cache für Timetables (einfacher Ersatz für Supabase)
+# In-Memory Cache für Timetables (einfacher Ersatz für Supabase, bei STORAGE_BACKEND=memory)
 TIMETABLE_CACHE = {}
 
+# Fortlaufende Versionsnummer der Einträge im In-Memory-Cache
+_memory_version = 0
+
+# Obergrenze des In-Memory-Caches in Bytes (Daten und vorab serialisierte Antworten)
+DEFAULT_MEMORY_MAX_BYTES = 64 * 1024 * 1024
+
+# Persistenter SQLite-Speicher (bei STORAGE_BACKEND=sqlite)
+_sqlite_store: Optional[SQLiteTimetableStore] = None
+
+def _use_sqlite() -> bool:
+    """Gibt zurück, ob der persistente SQLite-Speicher verwendet wird."""
+    return os.getenv("STORAGE_BACKEND", "sqlite").lower() == "sqlite"
+
+def _get_sqlite_store() -> SQLiteTimetableStore:
+    """Öffnet den SQLite-Speicher beim ersten Zugriff."""
+    global _sqlite_store
+    if _sqlite_store is None:
+        _sqlite_store = SQLiteTimetableStore(
+            db_path=os.getenv("DB_PATH", "data/timetables.db"),
+            blob_dir=os.getenv("BLOB_DIR", "data/blobs"),
+            max_versions=int(os.getenv("DB_MAX_VERSIONS", DEFAULT_MAX_VERSIONS)),
+        )
+    return _sqlite_store
+
+def _image_bytes(image_data: Any) -> Optional[bytes]:
+    """Bringt die Bilddaten in Bytes-Form (Base64-Strings älterer Aufrufer werden dekodiert)."""
+    if not image_data:
+        return None
+    if isinstance(image_data, str):
+        return base64.b64decode(image_data)
+    return bytes(image_data)
+
+def _render_body(timetable: Dict, timestamp: str, available_plans: List, available_classes: List) -> Dict[str, Any]:
+    """Serialisiert eine Antwort im Format von TimetableResponse samt starkem ETag."""
+    body = json.dumps({
+        "timetable": timetable,
+        "available_plans": available_plans,
+        "available_classes": available_classes,
+        "last_updated": timestamp,
+        "status": "success",
+        "from_cache": True
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return {"body": body, "etag": etag}
+
+def render_latest_response(data: Dict, timestamp: str, available_plans=None, available_classes=None) -> Dict[str, Any]:
+    """
+    Serialisiert die Antwort von /latest einmalig beim Speichern.
+
+    Das Format entspricht dem TimetableResponse-Modell der API, sodass /latest die
+    Bytes direkt ausliefern kann, statt bei jedem Abruf zu parsen, zu validieren
+    und erneut zu serialisieren. Für jede Klasse des beim Erkennen erstellten
+    Klassen-Index wird zusätzlich die Antwort von /latest?class= mit eigenem ETag vorbereitet.
+
+    Args:
+        data: Der erkannte Stundenplan
+        timestamp: Der Zeitstempel des Abrufs
+        available_plans: Optional, Liste der verfügbaren Pläne
+        available_classes: Optional, Liste der verfügbaren Klassen
+
+    Returns:
+        Ein Dictionary mit den Antwort-Bytes (body), dem starken ETag (etag) und
+        den Antworten je Klasse (classes, ebenfalls mit body und etag)
+    """
+    available_plans = available_plans or []
+    available_classes = available_classes or []
+    rendered = _render_body(data, timestamp, available_plans, available_classes)
+    rendered["classes"] = {
+        name: _render_body(select_class(data, name), timestamp, available_plans, available_classes)
+        for name in data.get("class_index") or {}
+    }
+    return rendered
+
+def _render_class_response(entry: Dict, class_name: str) -> Dict[str, Any]:
+    """Serialisiert die Antwort einer Klasse nachträglich (ältere Versionen oder Klassen außerhalb des Index)."""
+    return _render_body(select_class(json.loads(entry["data"]), class_name), entry["timestamp"],
+                        entry.get("available_plans", []), entry.get("available_classes", []))
+
+def _entry_size(entry: Dict) -> int:
+    """Größe eines Eintrags im In-Memory-Cache in Bytes."""
+    response = entry["response"]
+    return (len(entry["data"]) + len(response["body"])
+            + sum(len(rendered["body"]) for rendered in response.get("classes", {}).values()))
+
+def _evict_memory_entries() -> None:
+    """Verdrängt die am längsten nicht aktualisierten Benutzer, bis der In-Memory-Cache in MEMORY_CACHE_MAX_BYTES passt."""
+    max_bytes = int(os.getenv("MEMORY_CACHE_MAX_BYTES", DEFAULT_MEMORY_MAX_BYTES))
+    total = sum(_entry_size(entry) for entry in TIMETABLE_CACHE.values())
+    while total > max_bytes and len(TIMETABLE_CACHE) > 1:
+        username = next(iter(TIMETABLE_CACHE))
+        total -= _entry_size(TIMETABLE_CACHE.pop(username))
+        logger.info(f"In-Memory-Cache voll, verdränge Stundenplan von Benutzer {username}")
+
+def _latest_key(username: str) -> str:
+    """Schlüssel des neuesten Stundenplans eines Benutzers im gemeinsamen Cache."""
+    return f"latest:{username}"
+
+def _pack_latest(entry: Dict) -> bytes:
+    """Serialisiert einen Eintrag samt vorab serialisierter Antwort für den gemeinsamen Cache."""
+    def encode(rendered: Dict) -> Dict:
+        return {"body": rendered["body"].decode("utf-8"), "etag": rendered["etag"]}
+
+    response = entry["response"]
+    packed = {**encode(response),
+              "classes": {name: encode(rendered) for name, rendered in response.get("classes", {}).items()}}
+    return json.dumps({**entry, "response": packed}, ensure_ascii=False).encode("utf-8")
+
+def _unpack_latest(payload: bytes) -> Dict:
+    """Liest einen mit _pack_latest gespeicherten Eintrag."""
+    entry = json.loads(payload)
+    response = entry["response"]
+    for rendered in (response, *response.get("classes", {}).values()):
+        rendered["body"] = rendered["body"].encode("utf-8")
+    return entry
+
+def _read_sqlite_latest(store: SQLiteTimetableStore, username: str) -> Optional[Dict]:
+    """Liest den neuesten Eintrag samt vorab serialisierter Antwort aus SQLite."""
+    entry = store.latest(username)
+    if entry is None:
+        return None
+    response = store.latest_response(username)
+    if response is None or response["id"] != entry["id"]:
+        response = render_latest_response(json.loads(entry["data"]), entry["timestamp"],
+                                          entry["available_plans"], entry["available_classes"])
+    else:
+        response["classes"] = store.class_responses(entry["id"])
+    entry["response"] = {"body": response["body"], "etag": response["etag"], "classes": response["classes"]}
+    return entry
+
+async def _shared_latest(username: str) -> Optional[Dict]:
+    """
+    Liest den neuesten Eintrag über den gemeinsamen Cache aller Worker.
+
+    Bei STORAGE_BACKEND=sqlite wird ein fehlender Eintrag aus SQLite gelesen und
+    in der gemeinsamen Datei abgelegt, sodass die übrigen Worker ihn nicht erneut
+    aus SQLite lesen, bis ein Worker eine neue Version meldet.
+    Bei STORAGE_BACKEND=memory ist der gemeinsame Cache selbst der Speicher.
+    """
+    shared = get_shared_cache()
+    key = _latest_key(username)
+    loop = asyncio.get_event_loop()
+    # Auch das Lesen der gemeinsamen Datei kann blockieren (Sperre eines schreibenden Workers)
+    entry = await loop.run_in_executor(None, shared.get, key, _unpack_latest)
+    record_cache("latest", entry is not None)
+    if entry is not None or not _use_sqlite():
+        return entry
+    since = shared.seen
+
+    store = _get_sqlite_store()
+    with stage_timer("db_read"):
+        entry = await loop.run_in_executor(None, _read_sqlite_latest, store, username)
+    if entry is not None:
+        await loop.run_in_executor(None, shared.remember, key, entry, since, _pack_latest(entry))
+    return entry
+
+async def _memory_latest(username: str) -> Optional[Dict]:
+    """Gibt den neuesten Eintrag des In-Memory-Speichers zurück (über alle Worker, falls der gemeinsame Cache aktiv ist)."""
+    if get_shared_cache() is not None:
+        return await _shared_latest(username)
+    return TIMETABLE_CACHE.get(username)
+
 async def init_db() -> None:
-    """Initialisiert die Datenbankverbindung (Dummy-Implementation)."""
+    """Initialisiert die Datenbankverbindung."""
+    if _use_sqlite():
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, _get_sqlite_store)
+        return
     logger.info("Verwende In-Memory Cache statt Datenbank")
-    return
 
-async def store_timetable(username: str, data: Dict, image_data: bytes, timestamp: str, available_plans=None, available_classes=None) -> bool:
+async def close_db() -> None:
+    """Schließt die Datenbankverbindung."""
+    global _sqlite_store
+    if _sqlite_store is not None:
+        _sqlite_store.close()
+        _sqlite_store = None
+    close_shared_cache()
+
+async def store_timetable(username: str, data: Dict, image_data: bytes, timestamp: str, available_plans=None,
+                          available_classes=None, plan: Optional[str] = None) -> bool:
     """
-    Speichert einen abgerufenen Stundenplan im In-Memory-Cache.
-    
+    Speichert einen abgerufenen Stundenplan (als neue Version im SQLite-Speicher oder im In-Memory-Cache).
+
     Args:
         username: Der Benutzername
         data: Die strukturierten Stundenplan-Daten
-        image_data: Die Bilddaten des Stundenplans als Base64-String
+        image_data: Die Bilddaten des Stundenplans
         timestamp: Der Zeitstempel des Abrufs
         available_plans: Optional, Liste der verfügbaren Pläne
         available_classes: Optional, Liste der verfügbaren Klassen
-        
+        plan: Optional, Titel oder URL des Plans (Versionen werden nur innerhalb eines Plans verglichen)
+
     Returns:
         True bei erfolgreicher Speicherung
     """
+    started = time.perf_counter()
     try:
-        # Daten vorbereiten
+        rendered = render_latest_response(data, timestamp, available_plans, available_classes)
+
+        if _use_sqlite():
+            store = _get_sqlite_store()
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(
+                None,
+                store.insert,
+                username,
+                data,
+                _image_bytes(image_data),
+                timestamp,
+                available_plans or [],
+                available_classes or [],
+                rendered["body"],
+                rendered["etag"],
+                plan,
+                rendered["classes"]
+            )
+            # Die übrigen Worker verwerfen ihren zwischengespeicherten Stand und lesen die neue Version
+            shared = get_shared_cache()
+            if shared is not None:
+                await loop.run_in_executor(None, shared.invalidate, _latest_key(username))
+            logger.info(f"Stundenplan erfolgreich in SQLite gespeichert für Benutzer {username}")
+            return True
+
+        # Unveränderte Abrufe behalten die bisherige Version (und damit ihren ETag)
+        global TIMETABLE_CACHE
+        serialized = json.dumps(data)
+        current = TIMETABLE_CACHE.get(username)
+        if (current is not None and current["data"] == serialized and current.get("plan") == plan
+                and current["available_plans"] == (available_plans or [])
+                and current["available_classes"] == (available_classes or [])):
+            # Nur der Zeitpunkt der Bestätigung ändert sich (maßgeblich für die Frische im Stundenplan-Cache)
+            current = TIMETABLE_CACHE[username] = {**TIMETABLE_CACHE.pop(username), "checked_at": timestamp}
+            shared = get_shared_cache()
+            if shared is not None:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, shared.put, _latest_key(username), current, _pack_latest(current))
+            logger.info(f"Stundenplan unverändert, keine neue Version für Benutzer {username}")
+            return True
+
+        # Daten vorbereiten (Versions-IDs mit gemeinsamem Cache über alle Worker fortlaufend)
+        global _memory_version
+        shared = get_shared_cache()
+        if shared is not None:
+            _memory_version = shared.next_id("memory_version")
+        else:
+            _memory_version += 1
         entry = {
-            "data": json.dumps(data),
+            "id": _memory_version,
+            "data": serialized,
             "image": image_data if isinstance(image_data, str) else "<binary_data>",  # Nur den String speichern oder Platzhalter für binäre Daten
             "timestamp": timestamp,
             "available_plans": available_plans or [],
-            "available_classes": available_classes or []
+            "available_classes": available_classes or [],
+            "plan": plan,
+            "checked_at": timestamp,
+            "response": rendered
         }
-        
+
         # Im In-Memory-Cache speichern
-        global TIMETABLE_CACHE
+        # Neu einfügen, damit der Benutzer in der Verdrängungsreihenfolge nach hinten rückt
+        TIMETABLE_CACHE.pop(username, None)
         TIMETABLE_CACHE[username] = entry
-        
+        _evict_memory_entries()
+        if shared is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, shared.put, _latest_key(username), entry, _pack_latest(entry))
+
         logger.info(f"Stundenplan erfolgreich im Cache gespeichert für Benutzer {username}")
         return True
     except Exception as e:
-        logger.error(f"Fehler beim Speichern des Stundenplans im Cache: {str(e)}")
+        logger.error(f"Fehler beim Speichern des Stundenplans: {str(e)}")
         return False
-        
+    finally:
+        observe_stage("store", time.perf_counter() - started)
+
 async def get_latest_timetable(username: str) -> Optional[Dict]:
     """
-    Ruft den zuletzt gespeicherten Stundenplan für einen Benutzer aus dem Cache ab.
-    
+    Ruft den zuletzt gespeicherten Stundenplan für einen Benutzer ab.
+
     Args:
         username: Der Benutzername
-        
+
     Returns:
         Ein Dictionary mit den gespeicherten Daten oder None, wenn kein Plan gefunden wurde
     """
     try:
-        global TIMETABLE_CACHE
-        if username not in TIMETABLE_CACHE:
-            logger.warning(f"Kein Stundenplan im Cache gefunden für Benutzer {username}")
+        if get_shared_cache() is not None:
+            entry = await _shared_latest(username)
+        elif _use_sqlite():
+            store = _get_sqlite_store()
+            loop = asyncio.get_event_loop()
+            with stage_timer("db_read"):
+                entry = await loop.run_in_executor(None, store.latest, username)
+        else:
+            global TIMETABLE_CACHE
+            entry = TIMETABLE_CACHE.get(username)
+
+        if entry is None:
+            logger.warning(f"Kein Stundenplan gefunden für Benutzer {username}")
             return None
-        
-        return TIMETABLE_CACHE[username]
+        return entry
+    except Exception as e:
+        logger.error(f"Fehler beim Abrufen des letzten Stundenplans: {str(e)}")
+        return None
+
+async def get_latest_response(username: str) -> Optional[Dict]:
+    """
+    Ruft die vorab serialisierte /latest-Antwort eines Benutzers ab.
+
+    Args:
+        username: Der Benutzername
+
+    Returns:
+        Ein Dictionary mit body (Bytes) und etag oder None, wenn kein Plan gespeichert ist
+    """
+    try:
+        if get_shared_cache() is not None:
+            entry = await _shared_latest(username)
+            return entry["response"] if entry else None
+
+        if _use_sqlite():
+            store = _get_sqlite_store()
+            loop = asyncio.get_event_loop()
+            with stage_timer("db_read"):
+                cached = await loop.run_in_executor(None, store.latest_response, username)
+            if cached is not None:
+                return cached
+            # Ältere Einträge ohne gespeicherte Antwort einmalig nachträglich serialisieren
+            entry = await loop.run_in_executor(None, store.latest, username)
+            if entry is None:
+                return None
+            return render_latest_response(json.loads(entry["data"]), entry["timestamp"],
+                                          entry["available_plans"], entry["available_classes"])
+
+        entry = TIMETABLE_CACHE.get(username)
+        return entry["response"] if entry else None
+    except Exception as e:
+        logger.error(f"Fehler beim Abrufen der gespeicherten Antwort: {str(e)}")
+        return None
+
+async def get_latest_class_response(username: str, class_name: str) -> Optional[Dict]:
+    """
+    Ruft die vorab serialisierte Antwort von /latest?class= für eine Klasse ab.
+
+    Die Antworten je Klasse werden beim Speichern aus dem Klassen-Index erstellt;
+    nur für ältere Versionen oder unbekannte Klassen wird der Plan gelesen und gefiltert.
+
+    Args:
+        username: Der Benutzername
+        class_name: Die gewünschte Klasse (z.B. "MTL 01" oder "mtl1")
+
+    Returns:
+        Ein Dictionary mit body (Bytes) und etag oder None, wenn kein Plan gespeichert ist
+    """
+    selected = normalize_class(class_name)
+    try:
+        if get_shared_cache() is not None or not _use_sqlite():
+            entry = await _memory_latest(username)
+            if entry is None:
+                return None
+            rendered = entry["response"].get("classes", {}).get(selected)
+            return rendered if rendered is not None else _render_class_response(entry, selected)
+
+        store = _get_sqlite_store()
+        loop = asyncio.get_event_loop()
+        with stage_timer("db_read"):
+            latest = await loop.run_in_executor(None, store.latest_response, username)
+            rendered = None
+            if latest is not None:
+                rendered = await loop.run_in_executor(None, store.class_response, latest["id"], selected)
+        if rendered is not None:
+            return rendered
+        entry = await loop.run_in_executor(None, store.latest, username)
+        return _render_class_response(entry, selected) if entry else None
     except Exception as e:
-        logger.error(f"Fehler beim Abrufen des letzten Stundenplans aus dem Cache: {str(e)}")
+        logger.error(f"Fehler beim Abrufen der gespeicherten Klassen-Antwort: {str(e)}")
+        return None
+
+async def get_timetable_history(username: str, limit: int = 10) -> List[Dict]:
+    """
+    Ruft die letzten gespeicherten Versionen eines Benutzers ab (neueste zuerst).
+
+    Args:
+        username: Der Benutzername
+        limit: Maximale Anzahl der Versionen
+
+    Returns:
+        Die gespeicherten Versionen im Format von get_latest_timetable
+    """
+    try:
+        if _use_sqlite():
+            store = _get_sqlite_store()
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, store.history, username, limit)
+
+        # Der In-Memory-Cache hält nur die neueste Version
+        entry = await _memory_latest(username)
+        return [entry] if entry else []
+    except Exception as e:
+        logger.error(f"Fehler beim Abrufen der Stundenplan-Historie: {str(e)}")
+        return []
+
+async def get_plan_history(username: str, plan: Optional[str], limit: int = 10) -> List[Dict]:
+    """
+    Ruft die letzten gespeicherten Versionen eines Plans eines Benutzers ab (neueste zuerst).
+
+    Args:
+        username: Der Benutzername
+        plan: Titel oder URL des Plans (wie beim Speichern angegeben)
+        limit: Maximale Anzahl der Versionen
+
+    Returns:
+        Die gespeicherten Versionen im Format von get_latest_timetable
+    """
+    try:
+        if _use_sqlite():
+            store = _get_sqlite_store()
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, store.plan_history, username, plan, limit)
+
+        entry = await _memory_latest(username)
+        return [entry] if entry and entry.get("plan") == plan else []
+    except Exception as e:
+        logger.error(f"Fehler beim Abrufen der Plan-Historie: {str(e)}")
+        return []
+
+async def get_timetable_version(username: str, version_id: int) -> Optional[Dict]:
+    """
+    Ruft eine bestimmte gespeicherte Version eines Benutzers ab.
+
+    Args:
+        username: Der Benutzername
+        version_id: Die ID der Version (wie von get_latest_timetable geliefert)
+
+    Returns:
+        Die Version im Format von get_latest_timetable oder None, wenn sie nicht (mehr) existiert
+    """
+    try:
+        if _use_sqlite():
+            store = _get_sqlite_store()
+            loop = asyncio.get_event_loop()
+            with stage_timer("db_read"):
+                return await loop.run_in_executor(None, store.version, username, version_id)
+
+        # Der In-Memory-Cache hält nur die neueste Version
+        entry = await _memory_latest(username)
+        return entry if entry and entry["id"] == version_id else None
+    except Exception as e:
+        logger.error(f"Fehler beim Abrufen der Stundenplan-Version: {str(e)}")
+        return None
+
+async def get_plan_image(image_hash: str) -> Optional[bytes]:
+    """
+    Lädt ein gespeichertes Plan-Bild aus dem Blob-Speicher.
+
+    Args:
+        image_hash: Der SHA-256-Hash des Bildes
+
+    Returns:
+        Die Bilddaten oder None, wenn das Bild nicht gespeichert ist
+    """
+    if not _use_sqlite():
         return None
+    store = _get_sqlite_store()
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, store.blobs.get, image_hash)
@@ -1,17 +1,41 @@
+import os
 import pydsb
 import asyncio
-import httpx
 from loguru import logger
-from typing import Dict, List, Optional, Any
-import io
-import base64
-import requests
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+from services.session_pool import get_session_pool
+from services.singleflight import get_flights
+from services.http_client import conditional_get
+from services.metrics import stage_timer, record_cache, record_upstream_error
+from services.image_ingest import probe_image
+from services.upstream import UpstreamUnavailable, get_gateway
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Host der DSBmobile-API (für Ratenlimit und Schutzschalter der pydsb-Aufrufe)
+DSB_HOST = urlparse(getattr(pydsb, "BASE_URL", "https://mobileapi.dsbcontrol.de")).netloc
+
+# Bild-Hosts von DSBmobile, die ein eigenes Gateway erhalten. Plan-URLs kommen über
+# /get-specific-plan vom Client, Downloads von allen anderen Hosts teilen sich daher
+# ein festes Gateway, statt je Host ein neues (mit eigenem ThreadPool) anzulegen.
+DEFAULT_PLAN_HOSTS = "light.dsbcontrol.de,app.dsbcontrol.de"
+PLAN_IMAGES_GATEWAY = "plan-images"
+
+# Gleichzeitige Plan-Downloads je Konto und Zeitlimit je Download in Sekunden
+DEFAULT_DOWNLOAD_CONCURRENCY = 4
+DEFAULT_DOWNLOAD_TIMEOUT = 20.0
 
 async def authenticate_user(username: str, password: str) -> Optional[Any]:
     """
     Authentifiziert einen Benutzer bei DSBmobile.
     
+    Bestehende Sitzungen aus dem Sitzungs-Pool werden wiederverwendet, sodass
+    wiederholte Anfragen innerhalb der TTL keine erneute Anmeldung auslösen.
+    
     Args:
         username: DSBmobile Benutzername
         password: DSBmobile Passwort
@@ -19,53 +43,158 @@ async def authenticate_user(username: str, password: str) -> Optional[Any]:
     Returns:
         Das DSB-Objekt bei erfolgreicher Authentifizierung, None sonst
     """
+    pool = get_session_pool()
+    session = pool.get(username, password)
+    record_cache("session", session is not None)
+    if session is not None:
+        logger.info(f"Verwende bestehende DSB-Sitzung für Benutzer {username}")
+        return session.client
+    
     try:
-        # PyDSB initialisieren (mit Version 2.3.0)
-        dsb_client = pydsb.PyDSB(username, password)
+        # Da pydsb keine native async-Unterstützung hat, laufen die Aufrufe im ThreadPool des DSB-Gateways
+        gateway = get_gateway(DSB_HOST)
         
-        # Da pydsb keine native async-Unterstützung hat, führen wir den Aufruf in einem ThreadPool aus
-        loop = asyncio.get_event_loop()
+        # PyDSB initialisieren (mit Version 2.3.0), der Konstruktor meldet sich bereits an
+        try:
+            with stage_timer("auth"):
+                dsb_client = await gateway.run_sync(pydsb.PyDSB, username, password)
+        except UpstreamUnavailable:
+            # DSBmobile nicht erreichbar ist kein Anmeldefehler, die API antwortet mit 503 bzw. dem Cache
+            record_upstream_error("dsb_auth")
+            raise
+        except Exception as auth_err:
+            record_upstream_error("dsb_auth")
+            logger.warning(f"Authentifizierung fehlgeschlagen für Benutzer {username}: {str(auth_err)}")
+            return None
         
-        # Wir versuchen, Nachrichten abzurufen, um zu prüfen, ob die Authentifizierung erfolgreich war
+        # Wir versuchen, Pläne abzurufen, um zu prüfen, ob die Authentifizierung erfolgreich war
         try:
-            # Testen der Verbindung durch Abruf der Pläne
-            await loop.run_in_executor(None, dsb_client.get_plans)
+            # Testen der Verbindung durch Abruf der Pläne (die Liste wird für get_timetable aufbewahrt)
+            with stage_timer("get_plans"):
+                plans = await gateway.run_sync(dsb_client.get_plans)
             logger.info(f"Erfolgreiche Authentifizierung für Benutzer {username}")
-            return dsb_client
+        except UpstreamUnavailable:
+            record_upstream_error("dsb_plans")
+            raise
         except Exception as conn_err:
+            record_upstream_error("dsb_plans")
             logger.warning(f"Authentifizierung fehlgeschlagen für Benutzer {username}: {str(conn_err)}")
             return None
+        
+        dsb_client.dsb_session = pool.put(username, password, dsb_client, plans)
+        return dsb_client
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Fehler bei der Authentifizierung: {str(e)}")
         return None
 
+def invalidate_session(dsb_client: Any) -> None:
+    """
+    Verwirft die Pool-Sitzung eines Clients, z.B. wenn DSBmobile einen Authentifizierungsfehler meldet.
+    
+    Args:
+        dsb_client: Das PyDSB-Objekt
+    """
+    session = getattr(dsb_client, "dsb_session", None)
+    if session is not None:
+        get_session_pool().invalidate(session.key)
+
+async def list_plans(dsb_client: Any) -> List:
+    """
+    Ruft die Planliste eines Clients ab und verwendet dabei die Liste aus dem Sitzungs-Pool, solange sie gültig ist.
+    
+    Args:
+        dsb_client: Das PyDSB-Objekt
+        
+    Returns:
+        Die Liste der Pläne
+    """
+    pool = get_session_pool()
+    session = getattr(dsb_client, "dsb_session", None)
+    if session is not None:
+        plans = pool.get_plans(session)
+        record_cache("plans", plans is not None)
+        if plans is not None:
+            logger.info("Verwende zwischengespeicherte Planliste")
+            return plans
+    
+    # Gleichzeitige Abrufe derselben Sitzung teilen sich einen Upstream-Aufruf
+    flight_key = ("plans", session.key if session is not None else id(dsb_client))
+    try:
+        with stage_timer("get_plans"):
+            plans = await get_flights().do(flight_key, lambda: get_gateway(DSB_HOST).run_sync(dsb_client.get_plans))
+    except UpstreamUnavailable:
+        # Die Sitzung bleibt gültig, nur DSBmobile ist gerade nicht erreichbar
+        record_upstream_error("dsb_plans")
+        raise
+    except Exception:
+        record_upstream_error("dsb_plans")
+        # Ein abgelaufenes Token äußert sich bei pydsb als fehlerhafte Antwort, die Sitzung ist dann unbrauchbar
+        invalidate_session(dsb_client)
+        raise
+    
+    if session is not None:
+        pool.set_plans(session, plans)
+    return plans
+
+def plan_gateway_name(plan_url: str) -> str:
+    """Gibt das Gateway eines Plan-Downloads zurück (bekannter DSB-Bild-Host oder PLAN_IMAGES_GATEWAY)."""
+    host = urlparse(plan_url).netloc.lower()
+    known = {name.strip().lower() for name in os.getenv("DSB_PLAN_HOSTS", DEFAULT_PLAN_HOSTS).split(",") if name.strip()}
+    return host if host in known else PLAN_IMAGES_GATEWAY
+
+async def download_plan(plan_url: str) -> Tuple[int, bytes]:
+    """
+    Lädt ein Plan-Bild über den gemeinsamen HTTP-Client herunter.
+    
+    Unveränderte Pläne werden per bedingtem GET bestätigt (304) und aus dem
+    Validator-Speicher geliefert. Gleichzeitige Downloads derselben URL werden zusammengefasst.
+    Der Download läuft über das Gateway des Bild-Hosts (unbekannte Hosts über ein
+    gemeinsames Gateway); Antworten mit 429 oder 5xx werden wie Verbindungsfehler wiederholt.
+    
+    Args:
+        plan_url: Die URL des Plan-Bildes
+        
+    Returns:
+        Ein Tupel aus HTTP-Statuscode und Inhalt der Antwort
+    """
+    try:
+        with stage_timer("download"):
+            gateway = get_gateway(plan_gateway_name(plan_url))
+            status_code, content = await get_flights().do(
+                ("download", plan_url),
+                lambda: gateway.call(lambda: conditional_get(plan_url),
+                                     is_failure=lambda result: result[0] == 429 or result[0] >= 500)
+            )
+    except Exception:
+        record_upstream_error("plan_download")
+        raise
+    if status_code != 200:
+        record_upstream_error("plan_download")
+    return status_code, content
+
 async def get_specific_plan_image(auth_client: Any, plan_url: str) -> bytes:
     """Ruft einen spezifischen Stundenplan anhand der URL ab"""
     try:
         logger.info(f"Lade spezifischen Plan: {plan_url}")
         
         # Direkt die URL verwenden, um den Plan zu laden
-        response = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: requests.get(plan_url, verify=False)
-        )
+        status_code, content = await download_plan(plan_url)
         
-        if response.status_code != 200:
-            logger.error(f"Fehler beim Abruf des Plans: HTTP {response.status_code}")
-            raise Exception(f"HTTP-Fehler beim Abruf des Plans: {response.status_code}")
+        if status_code in (401, 403):
+            invalidate_session(auth_client)
+        if status_code != 200:
+            logger.error(f"Fehler beim Abruf des Plans: HTTP {status_code}")
+            raise Exception(f"HTTP-Fehler beim Abruf des Plans: {status_code}")
         
-        # Prüfen, ob es ein gültiges Bild ist
+        # Prüfen, ob es ein gültiges Bild ist (nur der Header, dekodiert wird einmalig bei der OCR)
         try:
-            # Versuche die Bilddaten zu verifizieren, indem wir sie mit Pillow öffnen
-            from PIL import Image
-            import io
-            img = Image.open(io.BytesIO(response.content))
-            img.verify()  # Verifiziere, dass es ein gültiges Bild ist
-            logger.info(f"Gültiges Bild vom Typ {img.format} geladen, Größe: {img.size}")
-            img.close()
+            image_format, size = probe_image(content)
+            logger.info(f"Gültiges Bild vom Typ {image_format} geladen, Größe: {size}")
             
-            # Bildaten als Bytes zurückgeben
-            return response.content
+            # Bildaten unverändert als Bytes zurückgeben
+            return content
         except Exception as img_err:
             logger.error(f"Ungültiges Bildformat: {str(img_err)}")
             # Falls das Bild ungültig ist, verwenden wir den ersten Plan aus der Liste
@@ -84,83 +213,179 @@ async def get_specific_plan_image(auth_client: Any, plan_url: str) -> bytes:
         logger.error(f"Fehler beim Laden des Plans über URL: {str(e)}")
         raise
 
-async def get_timetable(dsb_client) -> Optional[bytes]:
+async def find_timetable_plans(dsb_client) -> List[Dict]:
     """
-    Lädt den aktuellen Stundenplan von DSBmobile herunter.
+    Sucht alle Stundenplan-Einträge (mit 'MTA' im Titel) eines DSBmobile-Kontos.
     
     Args:
         dsb_client: Das PyDSB-Objekt
         
     Returns:
-        Die Bilddaten des Stundenplans als Base64-String oder None, wenn kein Plan gefunden wurde
+        Die gefundenen Pläne als Liste von {"url", "title"}, neuester Plan zuerst
     """
-    try:
-        # Abruf der Pläne in einem ThreadPool, da pydsb nicht nativ asynchron ist
-        loop = asyncio.get_event_loop()
-        plans = await loop.run_in_executor(None, dsb_client.get_plans)
+    # Abruf der Pläne (aus dem Sitzungs-Pool oder über das DSB-Gateway, da pydsb nicht nativ asynchron ist)
+    plans = await list_plans(dsb_client)
+    
+    if not plans:
+        logger.warning("Keine Pläne gefunden")
+        return []
+    
+    # Suche nach Stundenplan-Einträgen mit 'MTA' im Titel
+    timetable_entries = []
+    for plan in plans:
+        # Pläne können verschiedene Formate haben
+        plan_title = ""
+        plan_url = ""
         
-        if not plans:
-            logger.warning("Keine Pläne gefunden")
-            return None
+        if isinstance(plan, dict):
+            if 'url' in plan:
+                plan_url = plan['url']
+            if 'title' in plan:
+                plan_title = plan['title']
+        elif hasattr(plan, 'url'):
+            plan_url = plan.url
+            if hasattr(plan, 'title'):
+                plan_title = plan.title
         
-        # Suche nach Stundenplan-Einträgen mit 'MTA' im Titel
-        timetable_entries = []
-        for plan in plans:
-            # Pläne können verschiedene Formate haben
-            plan_title = ""
-            plan_url = ""
+        # Nur Einträge mit 'MTA' im Titel hinzufügen
+        if plan_url and ('MTA' in plan_title or not plan_title):  # Falls kein Titel vorhanden ist, nehmen wir auch den Plan
+            logger.info(f"Gefundener Plan: {plan_title}")
+            timetable_entries.append({"url": plan_url, "title": plan_title})
             
-            if isinstance(plan, dict):
-                if 'url' in plan:
-                    plan_url = plan['url']
-                if 'title' in plan:
-                    plan_title = plan['title']
-            elif hasattr(plan, 'url'):
-                plan_url = plan.url
-                if hasattr(plan, 'title'):
-                    plan_title = plan.title
+    if not timetable_entries:
+        # Versuche es mit den Neuigkeiten, falls es keine Pläne gibt
+        news = await get_gateway(DSB_HOST).run_sync(dsb_client.get_news)
+        logger.info(f"Anzahl gefundener Neuigkeiten: {len(news)}")
+        
+        for item in news:
+            item_title = ""
+            item_url = ""
             
-            # Nur Einträge mit 'MTA' im Titel hinzufügen
-            if plan_url and ('MTA' in plan_title or not plan_title):  # Falls kein Titel vorhanden ist, nehmen wir auch den Plan
-                logger.info(f"Gefundener Plan: {plan_title}")
-                timetable_entries.append({"url": plan_url, "title": plan_title})
-                
-        if not timetable_entries:
-            # Versuche es mit den Neuigkeiten, falls es keine Pläne gibt
-            news = await loop.run_in_executor(None, dsb_client.get_news)
-            logger.info(f"Anzahl gefundener Neuigkeiten: {len(news)}")
+            if isinstance(item, dict):
+                if 'url' in item:
+                    item_url = item['url']
+                if 'title' in item:
+                    item_title = item['title']
+            elif hasattr(item, 'url'):
+                item_url = item.url
+                if hasattr(item, 'title'):
+                    item_title = item.title
             
-            for item in news:
-                item_title = ""
-                item_url = ""
-                
-                if isinstance(item, dict):
-                    if 'url' in item:
-                        item_url = item['url']
-                    if 'title' in item:
-                        item_title = item['title']
-                elif hasattr(item, 'url'):
-                    item_url = item.url
-                    if hasattr(item, 'title'):
-                        item_title = item.title
-                
-                # Nur Einträge mit 'MTA' im Titel für Stundenplan hinzufügen
-                if item_url and 'MTA' in item_title:
-                    logger.info(f"Gefundene Neuigkeit mit MTA: {item_title}")
-                    timetable_entries.append({"url": item_url, "title": item_title})
+            # Nur Einträge mit 'MTA' im Titel für Stundenplan hinzufügen
+            if item_url and 'MTA' in item_title:
+                logger.info(f"Gefundene Neuigkeit mit MTA: {item_title}")
+                timetable_entries.append({"url": item_url, "title": item_title})
+    
+    if not timetable_entries:
+        logger.warning("Keine Stundenplan-URLs mit MTA im Titel gefunden")
+        return []
         
+    # Alle gefundenen Pläne loggen
+    logger.info(f"Gefundene Timetable-Einträge: {len(timetable_entries)}")
+    for idx, entry in enumerate(timetable_entries):
+        title = entry.get('title', 'Kein Titel')
+        logger.info(f"Plan {idx+1}: {title}")
+    
+    # Alle gefundenen Pläne auf dem dsb_client Objekt speichern, damit sie später abgerufen werden können
+    dsb_client.available_plans = timetable_entries
+    return timetable_entries
+
+async def _download_entry(dsb_client, entry: Dict, semaphore: asyncio.Semaphore,
+                          timeout: float) -> Tuple[Dict, Optional[bytes]]:
+    """Lädt einen Plan unter dem gemeinsamen Limit herunter; bei Fehlern wird None zurückgegeben."""
+    plan_url = entry.get('url', '')
+    plan_title = entry.get('title') or plan_url
+    async with semaphore:
+        try:
+            status_code, image_data = await asyncio.wait_for(download_plan(plan_url), timeout)
+        except asyncio.TimeoutError:
+            record_upstream_error("plan_download")
+            logger.error(f"Zeitüberschreitung beim Herunterladen von {plan_title} (>{timeout:.0f}s)")
+            return entry, None
+        except Exception as e:
+            logger.error(f"Fehler beim Herunterladen von {plan_title}: {str(e)}")
+            return entry, None
+    if status_code in (401, 403):
+        invalidate_session(dsb_client)
+    if status_code != 200:
+        logger.error(f"Fehler beim Herunterladen von {plan_title}: HTTP {status_code}")
+        return entry, None
+    return entry, image_data
+
+async def iter_plan_images(dsb_client, concurrency: Optional[int] = None,
+                           timeout: Optional[float] = None) -> AsyncIterator[Tuple[Dict, bytes]]:
+    """
+    Lädt alle verfügbaren Stundenpläne eines Kontos gleichzeitig herunter.
+    
+    Die Pläne werden in der Reihenfolge geliefert, in der ihre Downloads
+    abschließen, sodass die Weiterverarbeitung (OCR) beginnen kann, während
+    die übrigen Pläne noch übertragen werden.
+    
+    Args:
+        dsb_client: Das PyDSB-Objekt
+        concurrency: Maximale Anzahl gleichzeitiger Downloads (Standard: PLAN_DOWNLOAD_CONCURRENCY)
+        timeout: Zeitlimit je Download in Sekunden (Standard: PLAN_DOWNLOAD_TIMEOUT)
+        
+    Returns:
+        Tupel aus Planeintrag ({"url", "title"}) und Bilddaten (Pläne mit Downloadfehler fehlen)
+    """
+    timetable_entries = await find_timetable_plans(dsb_client)
+    if not timetable_entries:
+        return
+    
+    concurrency = concurrency or int(os.getenv("PLAN_DOWNLOAD_CONCURRENCY", DEFAULT_DOWNLOAD_CONCURRENCY))
+    timeout = timeout or float(os.getenv("PLAN_DOWNLOAD_TIMEOUT", DEFAULT_DOWNLOAD_TIMEOUT))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = [
+        asyncio.ensure_future(_download_entry(dsb_client, entry, semaphore, timeout))
+        for entry in timetable_entries
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            entry, image_data = await next_done
+            if image_data is not None:
+                yield entry, image_data
+    finally:
+        # Bricht der Aufrufer ab, werden die noch laufenden Downloads beendet
+        for task in tasks:
+            task.cancel()
+
+async def get_all_plan_images(dsb_client) -> Dict[str, bytes]:
+    """
+    Lädt die Bilder aller verfügbaren Stundenpläne eines Kontos gleichzeitig herunter.
+    
+    Args:
+        dsb_client: Das PyDSB-Objekt
+        
+    Returns:
+        Die Bilddaten der Pläne, nach Plantitel geordnet (Pläne mit Downloadfehler fehlen)
+    """
+    downloaded = {}
+    async for entry, image_data in iter_plan_images(dsb_client):
+        downloaded[entry.get('title') or entry.get('url', '')] = image_data
+    
+    # Reihenfolge der Planliste beibehalten (neuester Plan zuerst)
+    timetable_entries = getattr(dsb_client, "available_plans", [])
+    titles = [entry.get('title') or entry.get('url', '') for entry in timetable_entries]
+    images = {title: downloaded[title] for title in titles if title in downloaded}
+    
+    logger.info(f"{len(images)} von {len(timetable_entries)} Plänen heruntergeladen")
+    return images
+
+async def get_timetable(dsb_client) -> Optional[bytes]:
+    """
+    Lädt den aktuellen Stundenplan von DSBmobile herunter.
+    
+    Args:
+        dsb_client: Das PyDSB-Objekt
+        
+    Returns:
+        Die Bilddaten des Stundenplans als Bytes oder None, wenn kein Plan gefunden wurde
+    """
+    try:
+        timetable_entries = await find_timetable_plans(dsb_client)
         if not timetable_entries:
-            logger.warning("Keine Stundenplan-URLs mit MTA im Titel gefunden")
             return None
-            
-        # Alle gefundenen Pläne loggen
-        logger.info(f"Gefundene Timetable-Einträge: {len(timetable_entries)}")
-        for idx, entry in enumerate(timetable_entries):
-            title = entry.get('title', 'Kein Titel')
-            logger.info(f"Plan {idx+1}: {title}")
-        
-        # Alle gefundenen Pläne auf dem dsb_client Objekt speichern, damit sie später abgerufen werden können
-        dsb_client.available_plans = timetable_entries
         
         # Neuesten Stundenplan verwenden
         latest_timetable = timetable_entries[0]
@@ -174,19 +399,20 @@ async def get_timetable(dsb_client) -> Optional[bytes]:
             return None
             
         # Download des Bildes durchführen
-        async with httpx.AsyncClient() as client:
-            response = await client.get(plan_url)
-            if response.status_code != 200:
-                logger.error(f"Fehler beim Herunterladen des Stundenplans: HTTP {response.status_code}")
-                return None
-                
-            image_data = response.content
-            logger.info(f"Stundenplan erfolgreich heruntergeladen: {len(image_data)} Bytes")
+        status_code, image_data = await download_plan(plan_url)
+        if status_code in (401, 403):
+            invalidate_session(dsb_client)
+        if status_code != 200:
+            logger.error(f"Fehler beim Herunterladen des Stundenplans: HTTP {status_code}")
+            return None
             
-            # Umwandlung in Base64 für einfache Speicherung und Übertragung
-            base64_data = base64.b64encode(image_data)
-            return base64_data
+        logger.info(f"Stundenplan erfolgreich heruntergeladen: {len(image_data)} Bytes")
+        
+        # Rohdaten unverändert weitergeben, Base64 wird nur an der HTTP-Schnittstelle verwendet
+        return image_data
             
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Fehler beim Abrufen des Stundenplans: {str(e)}")
         return None
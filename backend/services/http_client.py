@@ -0,0 +1,218 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import httpx
+from collections import OrderedDict
+from loguru import logger
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from services.metrics import record_cache
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Standardwerte für den gemeinsamen HTTP-Client
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_TIMEOUT = 15.0
+# Anzahl der Plan-URLs, deren Validatoren im Speicher gehalten werden
+DEFAULT_MAX_VALIDATORS = 512
+# Gesamtgröße der im Speicher gehaltenen Plan-Inhalte (64 MB)
+DEFAULT_MAX_CONTENT_BYTES = 64 * 1024 * 1024
+
+
+class ValidatorStore:
+    """
+    Speichert ETag/Last-Modified und den zuletzt geladenen Inhalt je Plan-URL.
+
+    Damit kann ein unveränderter Plan mit einem bedingten GET (304) bestätigt
+    werden, statt das Bild erneut vollständig zu übertragen. Mit cache_dir
+    werden die Einträge zusätzlich auf der Festplatte abgelegt.
+
+    Im Speicher ist der Tier sowohl nach Anzahl der URLs als auch nach der
+    Gesamtgröße der Inhalte begrenzt, da einzelne Plan-Bilder mehrere MB groß sind.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = DEFAULT_MAX_VALIDATORS,
+                 max_bytes: int = DEFAULT_MAX_CONTENT_BYTES):
+        self.cache_dir = cache_dir or None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        """Gibt die Pfade für Metadaten und Inhalt einer URL zurück."""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.bin")
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Gibt die gespeicherten Validatoren und den Inhalt einer URL zurück.
+
+        Returns:
+            Ein Dictionary mit etag, last_modified und content oder None
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+
+        if self.cache_dir:
+            meta_path, content_path = self._paths(url)
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                with open(content_path, "rb") as f:
+                    content = f.read()
+                entry = {"etag": meta.get("etag"), "last_modified": meta.get("last_modified"), "content": content}
+                self._remember(url, entry)
+                return entry
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Validatoren für {url} konnten nicht gelesen werden: {str(e)}")
+        return None
+
+    def _remember(self, url: str, entry: Dict[str, Any]) -> None:
+        """Legt einen Eintrag im Speicher ab und verdrängt die ältesten bei Bedarf."""
+        size = len(entry["content"])
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self._current_bytes -= len(previous["content"])
+            if size > self.max_bytes:
+                # Zu große Inhalte nur auf der Festplatte halten
+                return
+            self._entries[url] = entry
+            self._current_bytes += size
+            while len(self._entries) > self.max_entries or self._current_bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._current_bytes -= len(old["content"])
+
+    @property
+    def current_bytes(self) -> int:
+        """Gesamtgröße der im Speicher gehaltenen Inhalte."""
+        return self._current_bytes
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], content: bytes) -> None:
+        """Speichert Validatoren und Inhalt einer erfolgreich geladenen URL."""
+        entry = {"etag": etag, "last_modified": last_modified, "content": content}
+        self._remember(url, entry)
+
+        if self.cache_dir:
+            meta_path, content_path = self._paths(url)
+            # Temporäre Dateien je Prozess und Thread, damit sich Worker nicht gegenseitig halbe Dateien unterschieben
+            suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(f"{content_path}.{suffix}", "wb") as f:
+                    f.write(content)
+                os.replace(f"{content_path}.{suffix}", content_path)
+                with open(f"{meta_path}.{suffix}", "w", encoding="utf-8") as f:
+                    json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f)
+                os.replace(f"{meta_path}.{suffix}", meta_path)
+            except Exception as e:
+                logger.warning(f"Validatoren für {url} konnten nicht gespeichert werden: {str(e)}")
+
+
+# Gemeinsamer HTTP-Client für die gesamte Laufzeit der Anwendung
+_client: Optional[httpx.AsyncClient] = None
+_validators: Optional[ValidatorStore] = None
+_stats = {"requests": 0, "not_modified": 0, "full_downloads": 0, "bytes_saved": 0}
+
+def start_http_client() -> httpx.AsyncClient:
+    """
+    Erstellt den gemeinsamen HTTP-Client mit Connection-Pooling und Keep-Alive.
+    Wird im Startup-Hook von main.py aufgerufen.
+    """
+    global _client
+    if _client is None:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE)),
+        )
+        timeout = httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", DEFAULT_TIMEOUT)))
+        _client = httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True)
+        logger.info("Gemeinsamer HTTP-Client gestartet")
+    return _client
+
+async def close_http_client() -> None:
+    """Schließt den gemeinsamen HTTP-Client. Wird im Shutdown-Hook von main.py aufgerufen."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Gemeinsamer HTTP-Client geschlossen")
+
+def get_http_client() -> httpx.AsyncClient:
+    """Gibt den gemeinsamen HTTP-Client zurück (und erstellt ihn, falls der Startup-Hook nicht lief)."""
+    return _client if _client is not None else start_http_client()
+
+def get_validator_store() -> ValidatorStore:
+    """
+    Gibt den Validator-Speicher zurück.
+    Verzeichnis und Speichergrenze werden über PLAN_CACHE_DIR und PLAN_CACHE_MAX_BYTES gesteuert.
+    """
+    global _validators
+    if _validators is None:
+        _validators = ValidatorStore(
+            cache_dir=os.getenv("PLAN_CACHE_DIR", ""),
+            max_bytes=int(os.getenv("PLAN_CACHE_MAX_BYTES", DEFAULT_MAX_CONTENT_BYTES)),
+        )
+    return _validators
+
+async def conditional_get(url: str) -> Tuple[int, bytes]:
+    """
+    Lädt eine URL mit bedingtem GET (If-None-Match / If-Modified-Since).
+
+    Antwortet der Server mit 304, wird der gespeicherte Inhalt zurückgegeben,
+    sodass ein unveränderter Plan nur eine leere Antwort kostet.
+
+    Args:
+        url: Die URL des Plan-Bildes
+
+    Returns:
+        Ein Tupel aus HTTP-Statuscode (200 auch bei 304) und Inhalt
+    """
+    store = get_validator_store()
+    # Der Validator-Speicher liest und schreibt die Festplatte, daher im ThreadPool
+    loop = asyncio.get_event_loop()
+    cached = await loop.run_in_executor(None, store.get, url)
+
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = await get_http_client().get(url, headers=headers)
+    _stats["requests"] += 1
+
+    if response.status_code == 304 and cached is not None:
+        _stats["not_modified"] += 1
+        record_cache("plan_download", True)
+        _stats["bytes_saved"] += len(cached["content"])
+        logger.info(f"Plan unverändert (304): {url}")
+        return 200, cached["content"]
+
+    if response.status_code == 200:
+        _stats["full_downloads"] += 1
+        record_cache("plan_download", False)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            await loop.run_in_executor(None, store.put, url, etag, last_modified, response.content)
+
+    return response.status_code, response.content
+
+def get_http_stats() -> Dict[str, int]:
+    """Gibt die Zähler der bedingten Downloads zurück."""
+    return dict(_stats)
@@ -0,0 +1,84 @@
+import io
+import os
+import math
+import numpy as np
+from PIL import Image
+from typing import Optional, Tuple, Union
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Längste Bildseite in Pixeln, oberhalb der große Pläne verkleinert dekodiert werden
+# (A4 mit 300 dpi wird so auf 150 dpi reduziert, was für die Erkennung genügt; 0 = nie verkleinern)
+DEFAULT_MAX_SIDE = 2600
+
+ImageBytes = Union[bytes, bytearray, memoryview]
+
+
+class InvalidImage(ValueError):
+    """Wird ausgelöst, wenn die Bilddaten kein lesbares Bild enthalten."""
+
+
+def _open(image_data: ImageBytes) -> Image.Image:
+    """Öffnet die Bilddaten; Pillow liest dabei zunächst nur den Header, dekodiert wird erst bei load()."""
+    try:
+        return Image.open(io.BytesIO(image_data))
+    except Exception as e:
+        raise InvalidImage(f"Kein gültiges Bild: {str(e)}") from e
+
+
+def probe_image(image_data: ImageBytes) -> Tuple[str, Tuple[int, int]]:
+    """
+    Prüft, ob die Bilddaten ein Bild enthalten, ohne es zu dekodieren.
+
+    Args:
+        image_data: Die Bilddaten des Stundenplans
+
+    Returns:
+        Das Format (z.B. "JPEG") und die Größe (Breite, Höhe)
+    """
+    with _open(image_data) as image:
+        return image.format, image.size
+
+
+def max_image_side() -> int:
+    """Gibt die längste Bildseite für die Dekodierung zurück (OCR_MAX_IMAGE_SIDE)."""
+    return int(os.getenv("OCR_MAX_IMAGE_SIDE", DEFAULT_MAX_SIDE))
+
+
+def decode_gray(image_data: ImageBytes, max_side: Optional[int] = None) -> np.ndarray:
+    """
+    Dekodiert ein Plan-Bild genau einmal direkt in ein Graustufen-Array.
+
+    JPEGs werden über den Draft-Modus von libjpeg schon beim Dekodieren in
+    Graustufen umgewandelt und, falls größer als max_side, um den Faktor 2, 4
+    oder 8 verkleinert; das volle Farbbild entsteht dabei nie und es entfällt ein
+    eigener Verkleinerungsschritt. Andere Formate werden nach der Umwandlung
+    einmal ganzzahlig verkleinert (reduce legt dafür ein neues Bild an).
+    np.asarray kopiert die Pixel anschließend in das Array für die OCR.
+
+    Args:
+        image_data: Die Bilddaten (bytes oder memoryview)
+        max_side: Längste Bildseite in Pixeln (Standard: OCR_MAX_IMAGE_SIDE, 0 = nie verkleinern)
+
+    Returns:
+        Das Graustufenbild als 2D-Array (uint8)
+    """
+    max_side = max_image_side() if max_side is None else max_side
+    with _open(image_data) as image:
+        width, height = image.size
+        factor = math.ceil(max(width, height) / max_side) if max_side and max(width, height) > max_side else 1
+
+        if image.format == "JPEG":
+            # draft wählt den kleinsten DCT-Maßstab, der mindestens die angefragte Größe liefert
+            image.draft("L", (math.ceil(width / factor), math.ceil(height / factor)))
+        try:
+            image.load()
+        except Exception as e:
+            raise InvalidImage(f"Bild konnte nicht dekodiert werden: {str(e)}") from e
+
+        gray = image if image.mode == "L" else image.convert("L")
+        if max_side and max(gray.size) > max_side:
+            gray = gray.reduce(math.ceil(max(gray.size) / max_side))
+        return np.asarray(gray)
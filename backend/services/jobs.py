@@ -0,0 +1,271 @@
+import os
+import json
+import math
+import time
+import uuid
+import asyncio
+from loguru import logger
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from services.shared_cache import get_shared_cache
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Standardwerte: 2 parallele Jobs, 32 Plätze in der Warteschlange, Ergebnisse 10 Minuten aufbewahren
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_RESULT_TTL = 600
+
+
+class JobQueueFull(Exception):
+    """Wird ausgelöst, wenn die Job-Warteschlange voll ist."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job-Warteschlange voll, erneut versuchen in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    """Ein asynchron verarbeiteter Auftrag samt Status und Ergebnis."""
+
+    def __init__(self, kind: str, func: Callable[[], Awaitable[Any]]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.status = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Gibt den Job in der Form der Status-Abfrage zurück."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+            "status_code": self.status_code,
+        }
+
+
+class JobQueue:
+    """
+    Begrenzte Warteschlange für OCR-lastige Anfragen.
+
+    Aufträge werden sofort mit einer Job-ID bestätigt und von einer festen Anzahl
+    Worker-Tasks abgearbeitet. Status und Ergebnis können abgefragt werden,
+    abgeschlossene Jobs werden nach result_ttl Sekunden verworfen.
+
+    Ist der gemeinsame Cache konfiguriert (SHARED_CACHE_PATH), wird jeder
+    Statuswechsel dort abgelegt, sodass jeder uvicorn-Worker den Job kennt,
+    nicht nur der Worker, der ihn angenommen hat.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE,
+                 result_ttl: float = DEFAULT_RESULT_TTL):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._avg_duration = 5.0
+        self._reserved = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def start(self) -> None:
+        """Startet die Worker-Tasks (im laufenden Event-Loop)."""
+        if not self._tasks:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+            logger.info(f"Job-Warteschlange gestartet ({self.workers} Worker, {self.max_queue} Plätze)")
+
+    async def stop(self) -> None:
+        """Beendet die Worker-Tasks, noch wartende Jobs werden verworfen."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def retry_after(self) -> int:
+        """Schätzt in Sekunden, wann wieder ein Platz in der Warteschlange frei wird."""
+        depth = self._queue.qsize() if self._queue is not None else 0
+        return max(1, math.ceil((depth + 1) * self._avg_duration / max(1, self.workers)))
+
+    async def submit(self, kind: str, func: Callable[[], Awaitable[Any]]) -> Job:
+        """
+        Stellt einen Auftrag in die Warteschlange.
+
+        Der Stand "queued" wird im gemeinsamen Cache abgelegt, bevor ein Worker-Task
+        den Job übernehmen kann. Sonst könnte dieses Schreiben nach dem Stand
+        "running" ankommen und ihn überschreiben.
+
+        Args:
+            kind: Art des Auftrags (z.B. "parse-plan")
+            func: Parameterlose Coroutine-Funktion, die das Ergebnis liefert
+
+        Returns:
+            Der angelegte Job
+
+        Raises:
+            JobQueueFull: Wenn die Warteschlange voll ist
+        """
+        self.start()
+        self._purge()
+        # Plätze, die während des Teilens schon vergeben sind, zählen mit
+        if self._queue.qsize() + self._reserved >= self.max_queue:
+            self.rejected += 1
+            raise JobQueueFull(self.retry_after())
+        job = Job(kind, func)
+        self._reserved += 1
+        try:
+            await self.publish(job)
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job)
+        self._jobs[job.id] = job
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Gibt einen Job dieses Workers zurück oder None, wenn er unbekannt oder abgelaufen ist."""
+        self._purge()
+        return self._jobs.get(job_id)
+
+    async def publish(self, job: Job) -> None:
+        """Legt den aktuellen Stand eines Jobs im gemeinsamen Cache ab (falls konfiguriert)."""
+        shared = get_shared_cache()
+        if shared is None:
+            return
+        state = job.to_dict()
+        payload = json.dumps(state, ensure_ascii=False).encode("utf-8")
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, shared.put, _job_key(job.id), state, payload)
+
+    async def lookup(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Gibt den Stand eines Jobs zurück, auch wenn ihn ein anderer Worker angenommen hat.
+
+        Returns:
+            Der Job in der Form von Job.to_dict oder None, wenn er unbekannt oder abgelaufen ist
+        """
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        shared = get_shared_cache()
+        if shared is None:
+            return None
+        loop = asyncio.get_event_loop()
+        state = await loop.run_in_executor(None, shared.get, _job_key(job_id), json.loads)
+        if state is None:
+            return None
+        if state["finished"] is not None and time.time() - state["finished"] > self.result_ttl:
+            await loop.run_in_executor(None, shared.invalidate, _job_key(job_id))
+            return None
+        return state
+
+    def _purge(self) -> None:
+        """Verwirft abgeschlossene Jobs, deren Aufbewahrungszeit abgelaufen ist."""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished is not None and now - job.finished > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.expired += len(expired)
+
+    async def _worker_loop(self) -> None:
+        """Arbeitet die Jobs der Warteschlange nacheinander ab."""
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started = time.time()
+            try:
+                await self._publish_quietly(job)
+                job.result = await job.func()
+                job.status = "done"
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # HTTPExceptions der Endpunkte behalten ihren Statuscode
+                job.status = "failed"
+                job.status_code = getattr(e, "status_code", 500)
+                job.error = str(getattr(e, "detail", e))
+                self.failed += 1
+                logger.error(f"Job {job.id} ({job.kind}) fehlgeschlagen: {job.error}")
+            finally:
+                job.func = None  # Zugangsdaten nicht länger als nötig halten
+                job.finished = time.time()
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (job.finished - job.started)
+                self._queue.task_done()
+            await self._publish_quietly(job)
+
+    async def _publish_quietly(self, job: Job) -> None:
+        """Wie publish, ein nicht erreichbarer gemeinsamer Cache bricht den Job aber nicht ab."""
+        try:
+            await self.publish(job)
+        except Exception as e:
+            logger.warning(f"Stand von Job {job.id} konnte nicht geteilt werden: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt Warteschlangentiefe und Zähler der Job-Verarbeitung zurück."""
+        statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "running": statuses.count("running"),
+            "stored_jobs": len(statuses),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "avg_duration": round(self._avg_duration, 3),
+            "result_ttl": self.result_ttl,
+        }
+
+
+def _job_key(job_id: str) -> str:
+    """Schlüssel eines Jobs im gemeinsamen Cache."""
+    return f"job:{job_id}"
+
+
+# Globale Job-Warteschlange
+_job_queue = None
+
+def get_job_queue() -> JobQueue:
+    """
+    Gibt die globale Job-Warteschlange zurück.
+    Größe und Aufbewahrungszeit werden über JOB_WORKERS, JOB_QUEUE_SIZE und JOB_RESULT_TTL gesteuert.
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            workers=int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS)),
+            max_queue=int(os.getenv("JOB_QUEUE_SIZE", DEFAULT_MAX_QUEUE)),
+            result_ttl=float(os.getenv("JOB_RESULT_TTL", DEFAULT_RESULT_TTL)),
+        )
+    return _job_queue
+
+async def stop_job_queue() -> None:
+    """Beendet die globale Job-Warteschlange."""
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.stop()
+        _job_queue = None
@@ -0,0 +1,210 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from services.profiling import record_stage
+
+# Grenzen der Latenz-Histogramme in Sekunden (von Cache-Treffern bis zu langen OCR-Läufen)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    """Maskiert einen Label-Wert für das Prometheus-Textformat."""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    """Formatiert Labels als {name="wert",...} (leer, wenn es keine gibt)."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Formatiert einen Messwert (ganze Zahlen ohne Nachkommastellen)."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """Gemeinsame Basis: Name, Beschreibung, Label-Namen und Sperre für Zugriffe aus Threads."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monoton steigender Zähler."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """Messwert, der steigen und fallen kann (z.B. laufende Anfragen, Warteschlangentiefe)."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """Verteilung von Messwerten in kumulativen Buckets samt Summe und Anzahl."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], Dict] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][index] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry["count"] if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, {"buckets": list(entry["buckets"]), "sum": entry["sum"], "count": entry["count"]})
+                           for key, entry in self._values.items())
+        lines = self._header()
+        for key, entry in items:
+            for bound, bucket_count in zip(self.buckets, entry["buckets"]):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {entry['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(entry['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Sammelt alle Metriken und gibt sie im Prometheus-Textformat aus."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Globale Registry und die Metriken der Verarbeitungskette
+_registry = MetricsRegistry()
+
+STAGE_DURATION = _registry.register(Histogram(
+    "dsb_stage_duration_seconds",
+    "Dauer der einzelnen Verarbeitungsschritte (auth, get_plans, download, decode, ocr, ...)",
+    ["stage"],
+))
+CACHE_REQUESTS = _registry.register(Counter(
+    "dsb_cache_requests_total",
+    "Cache-Abfragen nach Cache und Ergebnis (hit/miss)",
+    ["cache", "result"],
+))
+UPSTREAM_ERRORS = _registry.register(Counter(
+    "dsb_upstream_errors_total",
+    "Fehler bei Aufrufen an DSBmobile und den Bild-Host",
+    ["upstream"],
+))
+QUEUE_DEPTH = _registry.register(Gauge(
+    "dsb_queue_depth",
+    "Wartende Aufträge je Warteschlange (ocr, jobs, prefetch)",
+    ["queue"],
+))
+REQUESTS_IN_FLIGHT = _registry.register(Gauge(
+    "dsb_http_requests_in_flight",
+    "Gerade laufende HTTP-Anfragen",
+    ["method"],
+))
+REQUEST_DURATION = _registry.register(Histogram(
+    "dsb_http_request_duration_seconds",
+    "Dauer der HTTP-Anfragen je Route und Statuscode",
+    ["method", "path", "status"],
+))
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Erfasst die Dauer eines Verarbeitungsschritts (und im Profil der Anfrage, falls profiliert wird)."""
+    STAGE_DURATION.observe(seconds, stage=stage)
+    record_stage(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Misst die Dauer des Blocks als Verarbeitungsschritt (auch bei Fehlern)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Erfasst einen Treffer oder Fehlschlag eines Caches."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_upstream_error(upstream: str) -> None:
+    """Erfasst einen fehlgeschlagenen Aufruf an DSBmobile oder den Bild-Host."""
+    UPSTREAM_ERRORS.inc(upstream=upstream)
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Gibt die globale Registry zurück."""
+    return _registry
@@ -0,0 +1,191 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from loguru import logger
+from typing import Dict, Optional, Any
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Standardgröße des In-Memory-Tiers (64 MB serialisierte OCR-Ergebnisse)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def image_hash(image_data: bytes) -> str:
+    """
+    Berechnet den inhaltsbasierten Schlüssel eines Plan-Bildes.
+
+    Args:
+        image_data: Die Bilddaten des Stundenplans
+
+    Returns:
+        Der SHA-256-Hash der Bilddaten als Hex-String
+    """
+    return hashlib.sha256(image_data).hexdigest()
+
+
+class OCRResultCache:
+    """
+    Zweistufiger Cache für OCR-Ergebnisse, adressiert über den Hash der Bilddaten.
+
+    Die erste Stufe ist ein LRU-Cache im Speicher, der nach der Größe der
+    serialisierten Ergebnisse verdrängt. Die optionale zweite Stufe legt die
+    Ergebnisse als JSON-Dateien auf der Festplatte ab und übersteht damit
+    Neustarts des Servers.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, cache_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir or None
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._durations: Dict[str, float] = {}
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+        # Zähler für die Auswertung der Cache-Wirkung
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            logger.info(f"OCR-Cache auf Festplatte aktiviert: {self.cache_dir}")
+
+    def _disk_path(self, key: str) -> str:
+        """Gibt den Dateipfad für einen Schlüssel zurück (mit Unterordner pro Präfix)."""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, payload: bytes, duration: float) -> None:
+        """Legt ein serialisiertes Ergebnis im Speicher ab und verdrängt alte Einträge."""
+        if len(payload) > self.max_bytes:
+            # Einträge, die größer als der gesamte Cache sind, nicht im Speicher halten
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._current_bytes -= len(previous)
+
+            self._entries[key] = payload
+            self._durations[key] = duration
+            self._current_bytes += len(payload)
+
+            # Älteste Einträge entfernen, bis die Größengrenze eingehalten wird
+            while self._current_bytes > self.max_bytes and self._entries:
+                old_key, old_payload = self._entries.popitem(last=False)
+                self._durations.pop(old_key, None)
+                self._current_bytes -= len(old_payload)
+                self.evictions += 1
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Sucht ein OCR-Ergebnis zuerst im Speicher und danach auf der Festplatte.
+
+        Args:
+            key: Der Hash der Bilddaten
+
+        Returns:
+            Eine Kopie des gespeicherten Ergebnisses oder None bei einem Cache-Miss
+        """
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                self.saved_seconds += self._durations.get(key, 0.0)
+                return json.loads(payload)
+
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    stored = json.loads(f.read())
+                duration = stored.get("duration", 0.0)
+                result = stored["result"]
+                self._remember(key, json.dumps(result).encode("utf-8"), duration)
+                with self._lock:
+                    self.disk_hits += 1
+                    self.saved_seconds += duration
+                return result
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"OCR-Cache-Datei für {key} konnte nicht gelesen werden: {str(e)}")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, result: Dict, duration: float = 0.0) -> None:
+        """
+        Speichert ein OCR-Ergebnis in allen aktiven Cache-Stufen.
+
+        Args:
+            key: Der Hash der Bilddaten
+            result: Das strukturierte OCR-Ergebnis
+            duration: Die Dauer der OCR-Verarbeitung in Sekunden
+        """
+        payload = json.dumps(result).encode("utf-8")
+        self._remember(key, payload, duration)
+
+        if self.cache_dir:
+            try:
+                path = self._disk_path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Erst in eine temporäre Datei schreiben, damit keine halben Einträge entstehen
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(json.dumps({"duration": duration, "result": result}).encode("utf-8"))
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.warning(f"OCR-Ergebnis konnte nicht auf der Festplatte gespeichert werden: {str(e)}")
+
+        with self._lock:
+            self.stores += 1
+
+    def clear(self) -> None:
+        """Leert den In-Memory-Tier (die Dateien auf der Festplatte bleiben erhalten)."""
+        with self._lock:
+            self._entries.clear()
+            self._durations.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt die Trefferzähler und die aktuelle Belegung des Caches zurück."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_enabled": bool(self.cache_dir),
+                "saved_ocr_seconds": round(self.saved_seconds, 3),
+            }
+
+
+# Globaler OCR-Cache (wird nur einmal initialisiert)
+_ocr_cache = None
+
+def get_ocr_cache() -> OCRResultCache:
+    """
+    Gibt den globalen OCR-Cache zurück und legt ihn beim ersten Aufruf an.
+    Die Größe und das Verzeichnis werden über OCR_CACHE_MAX_BYTES und OCR_CACHE_DIR gesteuert.
+    """
+    global _ocr_cache
+    if _ocr_cache is None:
+        max_bytes = int(os.getenv("OCR_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        cache_dir = os.getenv("OCR_CACHE_DIR", "")
+        _ocr_cache = OCRResultCache(max_bytes=max_bytes, cache_dir=cache_dir)
+    return _ocr_cache
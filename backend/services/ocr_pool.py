@@ -0,0 +1,314 @@
+import os
+import math
+import time
+import asyncio
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from loguru import logger
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from services.table_segmentation import detect_grid, recognize_cells
+from services.image_ingest import decode_gray
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# EasyOCR Reader des Worker-Prozesses (wird beim Start des Prozesses geladen)
+_worker_reader = None
+
+
+class OCRQueueFull(Exception):
+    """Wird ausgelöst, wenn die Warteschlange des OCR-Pools voll ist."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"OCR-Warteschlange voll, erneut versuchen in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _init_worker(languages: List[str], torch_threads: int) -> None:
+    """
+    Initialisiert einen Worker-Prozess: begrenzt die Torch-Threads und lädt den EasyOCR Reader einmalig.
+    """
+    global _worker_reader
+    import torch
+    import easyocr
+
+    torch.set_num_threads(torch_threads)
+    _worker_reader = easyocr.Reader(languages)
+    logger.info(f"OCR-Worker {os.getpid()} bereit ({torch_threads} Torch-Threads)")
+
+
+def _to_plain(result) -> List:
+    """Wandelt ein EasyOCR-Ergebnis in einfache Python-Typen um (Box, Text, Konfidenz)."""
+    box, text, confidence = result
+    return [[[int(x), int(y)] for x, y in box], text, float(confidence)]
+
+
+def _ocr_grid(reader, gray: np.ndarray) -> Optional[Dict]:
+    """Erkennt nur die Rasterzellen, falls das MTL-Wochenraster gefunden wird."""
+    grid = detect_grid(gray)
+    if grid is None:
+        return None
+    cells, results = recognize_cells(reader, gray, grid)
+    return {"layout": "grid", "cells": cells, "results": results}
+
+
+def run_page_ocr(reader, image_data: bytes) -> Dict:
+    """
+    Dekodiert ein Plan-Bild und führt die Texterkennung mit dem übergebenen Reader durch.
+
+    Wird das Wochenraster gefunden, laufen nur kleine Erkennungen auf den Zellen,
+    andernfalls die Textdetektion über die ganze Seite.
+
+    Args:
+        reader: Der EasyOCR Reader
+        image_data: Die Bilddaten des Stundenplans
+
+    Returns:
+        Ein Dictionary mit layout ("grid" oder "page"), den Zellen (nur bei "grid"),
+        allen OCR-Ergebnissen als Liste von [Box, Text, Konfidenz] und den
+        Laufzeiten von Dekodierung und Erkennung (timings)
+    """
+    started = time.perf_counter()
+    gray = decode_gray(image_data)
+    decoded = time.perf_counter()
+    page = _ocr_grid(reader, gray)
+    if page is None:
+        page = {"layout": "page", "results": [_to_plain(result) for result in reader.readtext(gray)]}
+    page["timings"] = {"decode": decoded - started, "ocr": time.perf_counter() - decoded}
+    return page
+
+
+def run_pages_ocr_batched(reader, images: List[bytes]) -> List[Dict]:
+    """
+    Erkennt mehrere Plan-Bilder; Seiten ohne erkanntes Raster laufen durch die
+    gebündelte Inferenz von EasyOCR.
+
+    readtext_batched verlangt gleich große Bilder, daher wird je Bildgröße ein
+    Batch gebildet. Pläne derselben Schule haben in der Regel dieselbe Größe,
+    sodass meist ein einziger Durchlauf genügt.
+
+    Args:
+        reader: Der EasyOCR Reader
+        images: Die Bilddaten der Stundenpläne
+
+    Returns:
+        Die OCR-Ergebnisse je Bild (wie bei run_page_ocr), in der Reihenfolge der Eingabe
+    """
+    started = time.perf_counter()
+    arrays = [decode_gray(image_data) for image_data in images]
+    decoded = time.perf_counter()
+    pages: List[Optional[Dict]] = [_ocr_grid(reader, array) for array in arrays]
+
+    # Übrige Bilder nach Größe gruppieren und je Gruppe einen Batch erkennen
+    groups: Dict[tuple, List[int]] = {}
+    for index, array in enumerate(arrays):
+        if pages[index] is None:
+            groups.setdefault(array.shape, []).append(index)
+
+    for indices in groups.values():
+        batch = reader.readtext_batched([arrays[index] for index in indices], batch_size=len(indices))
+        for index, results in zip(indices, batch):
+            pages[index] = {"layout": "page", "results": [_to_plain(result) for result in results]}
+
+    # Die Laufzeiten des Batches werden gleichmäßig auf die Seiten verteilt
+    finished = time.perf_counter()
+    for page in pages:
+        page["timings"] = {"decode": (decoded - started) / len(pages), "ocr": (finished - decoded) / len(pages)}
+    return pages
+
+
+def warmup_job() -> int:
+    """Führt eine Probe-Erkennung auf einem leeren Bild aus, damit die Modelle vollständig geladen sind."""
+    _worker_reader.readtext(np.full((32, 128), 255, dtype=np.uint8))
+    return os.getpid()
+
+
+def page_ocr_job(image_data: bytes) -> Dict:
+    """Führt run_page_ocr mit dem Reader des Worker-Prozesses aus."""
+    return run_page_ocr(_worker_reader, image_data)
+
+
+def page_ocr_batch_job(images: List[bytes]) -> List[Dict]:
+    """Führt run_pages_ocr_batched mit dem Reader des Worker-Prozesses aus."""
+    return run_pages_ocr_batched(_worker_reader, images)
+
+
+class OCRPool:
+    """
+    Pool aus OCR-Worker-Prozessen mit vorgeladenen EasyOCR-Modellen.
+
+    Die Anzahl gleichzeitig angenommener Aufträge ist auf workers + queue_size
+    begrenzt. Ist die Warteschlange voll, wird sofort OCRQueueFull ausgelöst,
+    statt weitere mehrsekündige OCR-Läufe anzustauen.
+    """
+
+    def __init__(self, workers: int, queue_size: int, torch_threads: int, languages: Optional[List[str]] = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.torch_threads = torch_threads
+        self.languages = languages or ['de']
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._avg_duration = 5.0  # Schätzwert bis zur ersten gemessenen OCR-Dauer
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def start(self) -> None:
+        """Startet die Worker-Prozesse (spawn, damit Torch nicht in einen geforkten Prozess gerät)."""
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.languages, self.torch_threads),
+        )
+        logger.info(f"OCR-Pool gestartet: {self.workers} Prozesse, Warteschlange {self.queue_size}")
+
+    def shutdown(self) -> None:
+        """Beendet die Worker-Prozesse."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("OCR-Pool beendet")
+
+    @property
+    def capacity(self) -> int:
+        """Maximale Anzahl gleichzeitig angenommener Aufträge (laufend und wartend)."""
+        return self.workers + self.queue_size
+
+    @property
+    def queue_depth(self) -> int:
+        """Anzahl der Aufträge, die noch auf einen freien Worker warten."""
+        return max(0, self._pending - self.workers)
+
+    def retry_after(self) -> int:
+        """Schätzt, nach wie vielen Sekunden wieder ein Platz in der Warteschlange frei ist."""
+        waves = math.ceil(max(1, self._pending - self.workers + 1) / self.workers)
+        return max(1, math.ceil(waves * self._avg_duration))
+
+    async def submit(self, func: Callable, *args: Any) -> Any:
+        """
+        Führt eine Funktion in einem Worker-Prozess aus.
+
+        Args:
+            func: Eine auf Modulebene definierte Funktion, z.B. page_ocr_job
+            *args: Die Argumente der Funktion
+
+        Returns:
+            Das Ergebnis der Funktion
+
+        Raises:
+            OCRQueueFull: Wenn die Warteschlange voll ist
+        """
+        if self._pending >= self.capacity:
+            self.rejected += 1
+            raise OCRQueueFull(self.retry_after())
+
+        with self._pending_lock:
+            self._pending += 1
+        started = time.perf_counter()
+        executor = self._executor
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            # Ein Worker ist abgestürzt (z.B. OOM), der Pool nimmt nichts mehr an: neu aufbauen
+            self._restart(executor)
+            try:
+                future = self._executor.submit(func, *args)
+            except BaseException:
+                self._release(None)
+                raise
+        except BaseException:
+            self._release(None)
+            raise
+        # Erst freigeben, wenn der Worker tatsächlich fertig ist, nicht wenn der Aufrufer aufgibt
+        future.add_done_callback(lambda done: self._release(done, started))
+
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def _release(self, future: Optional[Future], started: float = 0.0) -> None:
+        """Gibt den Platz eines beendeten Auftrags frei und zählt sein Ergebnis (auch aus dem Executor-Thread)."""
+        with self._pending_lock:
+            self._pending -= 1
+            if future is None or future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failed += 1
+                return
+            # Gleitender Mittelwert der OCR-Dauer für die Retry-After-Schätzung
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.perf_counter() - started)
+            self.completed += 1
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """Ersetzt einen defekten Prozess-Pool (nur einmal, auch wenn mehrere Aufträge den Defekt bemerken)."""
+        if self._executor is not broken:
+            return
+        logger.error("OCR-Pool defekt (Worker-Prozess abgestürzt), starte Worker neu")
+        self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.start()
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt Auslastung und Zähler des Pools zurück."""
+        return {
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "capacity": self.capacity,
+            "in_progress": min(self._pending, self.workers),
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_duration": round(self._avg_duration, 3),
+        }
+
+
+# Globaler OCR-Pool (None, solange kein Pool gestartet wurde)
+_ocr_pool = None
+
+def start_ocr_pool() -> Optional[OCRPool]:
+    """
+    Startet den globalen OCR-Pool anhand der Umgebungsvariablen.
+    OCR_WORKERS=0 deaktiviert den Pool, OCR läuft dann im API-Prozess.
+    """
+    global _ocr_pool
+    workers = int(os.getenv("OCR_WORKERS", 1))
+    if workers <= 0:
+        logger.info("OCR-Pool deaktiviert, OCR läuft im API-Prozess")
+        return None
+    if _ocr_pool is None:
+        default_threads = max(1, (os.cpu_count() or 1) // workers)
+        _ocr_pool = OCRPool(
+            workers=workers,
+            queue_size=int(os.getenv("OCR_QUEUE_SIZE", 8)),
+            torch_threads=int(os.getenv("OCR_TORCH_THREADS", default_threads)),
+        )
+        _ocr_pool.start()
+    return _ocr_pool
+
+def stop_ocr_pool() -> None:
+    """Beendet den globalen OCR-Pool."""
+    global _ocr_pool
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown()
+        _ocr_pool = None
+
+def get_ocr_pool() -> Optional[OCRPool]:
+    """Gibt den globalen OCR-Pool zurück oder None, wenn OCR im API-Prozess läuft."""
+    return _ocr_pool
@@ -1,19 +1,32 @@
 import easyocr
 import asyncio
 import base64
-import io
 import numpy as np
-from PIL import Image
 from loguru import logger
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 import re
 import ssl
 import os
 import certifi
+import time
+
+from services.ocr_cache import get_ocr_cache, image_hash
+from services.singleflight import get_flights
+from services.metrics import observe_stage, stage_timer, record_cache
+from services.profiling import profiled_call
+from services.class_index import build_class_index
+from services.table_segmentation import DAYS, PERIODS
+from services.ocr_pool import OCRQueueFull, get_ocr_pool, page_ocr_job, page_ocr_batch_job, run_page_ocr, run_pages_ocr_batched, warmup_job
+
+# Ausführliches Logging der einzelnen OCR-Texte (nur zur Diagnose, kostet auf dem Hot Path sonst nichts)
+VERBOSE_OCR_LOGGING = os.getenv("OCR_VERBOSE_LOGGING", "false").lower() in ("1", "true", "yes")
 
 # Globales EasyOCR Reader-Objekt (wird nur einmal initialisiert)
 _reader = None
 
+# Zustand des Aufwärmens beim Start (für den /ready-Endpunkt)
+_warmup_state = {"ready": False, "error": None, "duration": None}
+
 # Umgebungsvariable setzen, um SSL-Probleme zu vermeiden (für macOS)
 def fix_ssl_cert():
     """
@@ -45,54 +58,232 @@ def get_reader():
             _reader = None  # Setze auf None zurück, damit beim nächsten Aufruf ein neuer Versuch gestartet wird
     return _reader
 
+async def warm_up_ocr() -> None:
+    """
+    Lädt die OCR-Modelle beim Start und führt eine Probe-Erkennung durch, damit
+    der erste Benutzer nach einem Deployment nicht auf das Laden der Modelle wartet.
+    """
+    started = time.perf_counter()
+    logger.info("Wärme OCR-Modelle auf...")
+    try:
+        pool = get_ocr_pool()
+        if pool is not None:
+            # Je Worker einen Probe-Auftrag, damit alle Prozesse ihre Modelle laden
+            await asyncio.gather(*[pool.submit(warmup_job) for _ in range(pool.workers)])
+        else:
+            loop = asyncio.get_event_loop()
+            reader = await loop.run_in_executor(None, get_reader)
+            if reader is None:
+                raise RuntimeError("EasyOCR Reader konnte nicht initialisiert werden")
+            await loop.run_in_executor(None, reader.readtext, np.full((32, 128), 255, dtype=np.uint8))
+        
+        _warmup_state["ready"] = True
+        _warmup_state["error"] = None
+        _warmup_state["duration"] = round(time.perf_counter() - started, 3)
+        logger.info(f"OCR-Modelle bereit nach {_warmup_state['duration']}s")
+    except Exception as e:
+        _warmup_state["error"] = str(e)
+        logger.error(f"Fehler beim Aufwärmen der OCR-Modelle: {str(e)}")
+
+def skip_warm_up() -> None:
+    """Markiert die OCR als bereit, ohne aufzuwärmen (Modelle werden dann beim ersten Aufruf geladen)."""
+    _warmup_state["ready"] = True
+
+def get_warmup_state() -> Dict:
+    """Gibt zurück, ob die OCR-Modelle aufgewärmt und einsatzbereit sind."""
+    return dict(_warmup_state)
+
 async def process_ocr(image_data: bytes) -> Dict:
     """Verarbeitet ein Stundenplan-Bild mit OCR"""
     try:
         logger.info("Starte OCR-Verarbeitung...")
         
-        # Bild laden und vorverarbeiten
-        try:
-            image = Image.open(io.BytesIO(image_data))
-            # Kontrast erhöhen und in Graustufen umwandeln
-            image = image.convert('L')
-        except Exception as img_err:
-            logger.error(f"Fehler bei der Bildverarbeitung: {str(img_err)}")
-            return create_placeholder_timetable()
-            
-        # OCR-Reader holen
-        reader = await get_reader()
+        # Bereits erkannte Pläne direkt aus dem Cache beantworten
+        cache = get_ocr_cache()
+        cache_key = image_hash(image_data)
+        cached_result = cache.get(cache_key)
+        record_cache("ocr", cached_result is not None)
+        if cached_result is not None:
+            logger.info(f"OCR-Ergebnis aus dem Cache geladen ({cache_key[:12]})")
+            return cached_result
         
-        # OCR-Ergebnisse extrahieren
+        # Gleichzeitige Anfragen für dasselbe Bild teilen sich einen OCR-Lauf
+        return await get_flights().do(("ocr", cache_key), lambda: _run_ocr(image_data, cache_key))
+    except OCRQueueFull:
+        # Überlastung an die API weiterreichen, damit sie mit 503 antworten kann
+        raise
+    except Exception as e:
+        logger.error(f"Fehler bei der OCR-Verarbeitung: {str(e)}")
+        # Statt Absturz einen Platzhalter-Stundenplan zurückgeben
+        return create_placeholder_timetable()
+
+async def _run_ocr(image_data: bytes, cache_key: str) -> Dict:
+    """Führt die eigentliche OCR-Erkennung durch und legt das Ergebnis im Cache ab"""
+    ocr_started = time.perf_counter()
+    
+    # Mit laufendem OCR-Pool wird das Bild im Worker-Prozess dekodiert und erkannt
+    pool = get_ocr_pool()
+    if pool is not None:
         try:
-            # OCR in einem ThreadPool ausführen, da EasyOCR nicht nativ asynchron ist
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None, 
-                lambda: reader.readtext(np.array(image))
-            )
-            logger.info(f"OCR abgeschlossen. {len(result)} Textbereiche erkannt.")
+            page = await pool.submit(page_ocr_job, image_data)
+        except OCRQueueFull:
+            raise
         except Exception as ocr_err:
-            logger.error(f"Fehler bei der OCR-Textextraktion: {str(ocr_err)}")
+            logger.error(f"Fehler bei der OCR-Verarbeitung im Worker: {str(ocr_err)}")
             return create_placeholder_timetable()
-        # Extrahiere Klassen-Informationen direkt aus den OCR-Ergebnissen
-        class_names = extract_class_info(result)
-        if class_names:
-            logger.info(f"Gefundene Klassen in OCR: {class_names}")
-        else:
-            logger.info("Keine Klassen in OCR-Ergebnissen gefunden, verwende Standardklassen")
-            class_names = ["MTL 01", "MTL 02"]
+        return _build_timetable(page, cache_key, ocr_started)
         
-        # Parsing der OCR-Ergebnisse in eine strukturierte Tabelle
-        timetable = parse_timetable(result)
+    # OCR-Reader holen (das Laden der Modelle blockiert, daher im ThreadPool)
+    loop = asyncio.get_event_loop()
+    reader = await loop.run_in_executor(None, get_reader)
+    if reader is None:
+        return create_placeholder_timetable()
+    
+    # OCR-Ergebnisse extrahieren
+    try:
+        # Dekodierung und OCR in einem ThreadPool ausführen, da EasyOCR nicht nativ asynchron ist
+        page = await loop.run_in_executor(None, profiled_call(run_page_ocr, reader, image_data))
+    except Exception as ocr_err:
+        logger.error(f"Fehler bei der OCR-Textextraktion: {str(ocr_err)}")
+        return create_placeholder_timetable()
+    return _build_timetable(page, cache_key, ocr_started)
+
+async def process_ocr_batch(images: Dict[str, bytes]) -> Dict[str, Dict]:
+    """
+    Verarbeitet mehrere Stundenplan-Bilder in einem gebündelten OCR-Durchlauf.
+    
+    Bereits erkannte Bilder werden aus dem Cache beantwortet, identische Bilder
+    nur einmal erkannt. Die übrigen Bilder laufen gemeinsam durch die gebündelte
+    Inferenz von EasyOCR, statt für jeden Plan den vollen Modell-Overhead zu zahlen.
+    
+    Args:
+        images: Die Bilddaten der Pläne, nach Plantitel geordnet
+        
+    Returns:
+        Die strukturierten Stundenpläne, nach Plantitel geordnet
+    """
+    logger.info(f"Starte gebündelte OCR-Verarbeitung für {len(images)} Pläne...")
+    cache = get_ocr_cache()
+    results: Dict[str, Dict] = {}
+    missing: Dict[str, bytes] = {}
+    keys = {title: image_hash(image_data) for title, image_data in images.items()}
+    
+    for title, image_data in images.items():
+        cached_result = cache.get(keys[title])
+        record_cache("ocr", cached_result is not None)
+        if cached_result is not None:
+            results[title] = cached_result
+        elif keys[title] not in missing:
+            missing[keys[title]] = image_data
+    
+    if missing:
+        logger.info(f"{len(missing)} Pläne nicht im Cache, starte Batch-OCR")
         
-        # Füge Klassen-Informationen dem Timetable hinzu
-        timetable['class_names'] = class_names
+        # Bilder, die bereits einzeln (process_ocr) oder in einem anderen Batch erkannt
+        # werden, warten auf diesen Lauf; nur die übrigen gehen gemeinsam in den Batch
+        async def run_batch(flight_keys: List[tuple]) -> Dict[tuple, Dict]:
+            batch_keys = [key for _, key in flight_keys]
+            timetables = await _run_ocr_batch([missing[key] for key in batch_keys], batch_keys)
+            return {("ocr", key): timetable for key, timetable in timetables.items()}
         
-        return timetable
-    except Exception as e:
-        logger.error(f"Fehler bei der OCR-Verarbeitung: {str(e)}")
-        # Statt Absturz einen Platzhalter-Stundenplan zurückgeben
-        return create_placeholder_timetable()
+        try:
+            flights = await get_flights().do_many([("ocr", key) for key in missing], run_batch)
+            timetables = {key: timetable for (_, key), timetable in flights.items()}
+        except OCRQueueFull:
+            raise
+        except Exception as e:
+            logger.error(f"Fehler bei der gebündelten OCR-Verarbeitung: {str(e)}")
+            timetables = {key: create_placeholder_timetable() for key in missing}
+        
+        for title in images:
+            if title not in results:
+                results[title] = timetables[keys[title]]
+    
+    return results
+
+async def process_ocr_pipelined(images: AsyncIterator[Tuple[str, bytes]]) -> Dict[str, Dict]:
+    """
+    Erkennt Stundenpläne, während sie noch heruntergeladen werden.
+    
+    Jedes Bild wird sofort nach seinem Eintreffen an process_ocr übergeben,
+    sodass sich die Download-Latenz mehrerer Pläne mit der OCR überlappt.
+    
+    Args:
+        images: Die eintreffenden Bilder als (Plantitel, Bilddaten)
+        
+    Returns:
+        Die strukturierten Stundenpläne, nach Plantitel in Reihenfolge des Eintreffens
+    """
+    tasks: Dict[str, asyncio.Future] = {}
+    try:
+        async for title, image_data in images:
+            logger.info(f"Plan eingetroffen, starte OCR: {title}")
+            tasks[title] = asyncio.ensure_future(process_ocr(image_data))
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        # Bei Überlastung oder Abbruch keine verwaisten OCR-Läufe zurücklassen
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return dict(zip(tasks.keys(), results))
+
+async def _run_ocr_batch(images: List[bytes], cache_keys: List[str]) -> Dict[str, Dict]:
+    """Führt die gebündelte Texterkennung durch und legt die Ergebnisse im Cache ab"""
+    ocr_started = time.perf_counter()
+    
+    pool = get_ocr_pool()
+    if pool is not None:
+        pages = await pool.submit(page_ocr_batch_job, images)
+    else:
+        loop = asyncio.get_event_loop()
+        reader = await loop.run_in_executor(None, get_reader)
+        if reader is None:
+            raise RuntimeError("EasyOCR Reader konnte nicht initialisiert werden")
+        pages = await loop.run_in_executor(None, profiled_call(run_pages_ocr_batched, reader, images))
+    logger.info(f"Batch-OCR abgeschlossen: {len(pages)} Pläne in {time.perf_counter() - ocr_started:.2f}s")
+    
+    # Die Laufzeit des Batches wird für die Cache-Statistik gleichmäßig auf die Pläne verteilt
+    timetables = {}
+    for cache_key, page in zip(cache_keys, pages):
+        timetables[cache_key] = _build_timetable(page, cache_key, ocr_started, share=len(pages))
+    return timetables
+
+def _build_timetable(page: Dict, cache_key: str, ocr_started: float, share: int = 1) -> Dict:
+    """Wandelt die OCR-Ergebnisse in den Stundenplan um und legt ihn im Cache ab"""
+    result = page["results"]
+    logger.info(f"OCR abgeschlossen ({page['layout']}). {len(result)} Textbereiche erkannt.")
+    
+    # Dekodierung und Erkennung wurden im Worker gemessen, ocr_total enthält zusätzlich die Wartezeit
+    for stage, seconds in page.get("timings", {}).items():
+        observe_stage(stage, seconds)
+    observe_stage("ocr_total", (time.perf_counter() - ocr_started) / share)
+    
+    # Extrahiere Klassen-Informationen direkt aus den OCR-Ergebnissen
+    with stage_timer("class_extraction"):
+        class_names = extract_class_info(result)
+    if class_names:
+        logger.info(f"Gefundene Klassen in OCR: {class_names}")
+    else:
+        logger.info("Keine Klassen in OCR-Ergebnissen gefunden, verwende Standardklassen")
+        class_names = ["MTL 01", "MTL 02"]
+    
+    # Parsing der OCR-Ergebnisse in eine strukturierte Tabelle
+    with stage_timer("parse"):
+        if page["layout"] == "grid":
+            timetable = parse_grid_cells(page["cells"])
+        else:
+            timetable = parse_timetable(result)
+    
+    # Füge Klassen-Informationen und den Index Klasse -> Einträge dem Timetable hinzu,
+    # damit Anfragen mit ?class= nicht erneut über alle Einträge suchen müssen
+    timetable['class_names'] = class_names
+    timetable['class_index'] = build_class_index(timetable)
+    
+    # Nur echte Erkennungen cachen, Platzhalter nicht (sonst überdauern sie bessere Parser)
+    if not timetable.get("is_placeholder"):
+        get_ocr_cache().put(cache_key, timetable, (time.perf_counter() - ocr_started) / share)
+    
+    return timetable
 
 def extract_class_info(ocr_results) -> List[str]:
     """Extrahiert Klasseninformationen aus OCR-Ergebnissen."""
@@ -114,7 +305,8 @@ def extract_class_info(ocr_results) -> List[str]:
             matches = class_pattern.findall(text)
             if matches:
                 # Debug-Info
-                logger.info(f"Klasse gefunden in Text: '{text}', Matches: {matches}")
+                if VERBOSE_OCR_LOGGING:
+                    logger.info(f"Klasse gefunden in Text: '{text}', Matches: {matches}")
                 
                 # Entferne Leerzeichen und normalisiere Format
                 normalized_matches = [re.sub(r'\s+', ' ', match).strip() for match in matches]
@@ -237,21 +429,60 @@ def parse_timetable(ocr_results) -> Dict:
     Returns:
         Ein Dictionary mit den Wochentagen, Zeitslots und Einträgen
     """
-    # Protokollieren aller erkannten Textblöcke zur Diagnose
-    try:
-        logger.info(f"OCR-Ergebnisse gefunden: {len(ocr_results)}")
-        for i, result in enumerate(ocr_results[:10]):
-            try:
-                if isinstance(result, list) and len(result) > 1:
-                    logger.info(f"OCR-Text {i+1}: {result[1]}")
-                else:
-                    logger.info(f"OCR-Text {i+1}: {result}")
-            except Exception as e:
-                logger.error(f"Fehler beim Logging von OCR-Ergebnis {i+1}: {str(e)}")
-    except Exception as e:
-        logger.error(f"Fehler beim Logging der OCR-Ergebnisse: {str(e)}")
+    # Protokollieren der ersten erkannten Textblöcke zur Diagnose (nur mit OCR_VERBOSE_LOGGING)
+    if VERBOSE_OCR_LOGGING:
+        try:
+            logger.info(f"OCR-Ergebnisse gefunden: {len(ocr_results)}")
+            for i, result in enumerate(ocr_results[:10]):
+                try:
+                    if isinstance(result, list) and len(result) > 1:
+                        logger.info(f"OCR-Text {i+1}: {result[1]}")
+                    else:
+                        logger.info(f"OCR-Text {i+1}: {result}")
+                except Exception as e:
+                    logger.error(f"Fehler beim Logging von OCR-Ergebnis {i+1}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Fehler beim Logging der OCR-Ergebnisse: {str(e)}")
     
     # Da die generische OCR-Erkennung nicht optimal für dieses Format funktioniert,
     # verwenden wir den spezialisierten MTL-Stundenplan statt OCR-Parsing
     logger.info("Verwende spezialisierten MTL-Stundenplan statt OCR-Parsing")
     return create_placeholder_timetable()
+
+# Muster für die Bestandteile eines Zelleintrags, z.B. "LF 04.6 (Mich) Raum 423"
+SUBJECT_PATTERN = re.compile(r'LF\s*\d+(?:\.\d+)*', re.IGNORECASE)
+ROOM_PATTERN = re.compile(r'Raum\s*(\w+)|\b(Labor)\b', re.IGNORECASE)
+
+def parse_grid_cells(cells: List[Dict]) -> Dict:
+    """
+    Wandelt die erkannten Rasterzellen in Stundenplan-Einträge um.
+    
+    Args:
+        cells: Die Zellen aus der Tabellensegmentierung mit day, period und lines
+        
+    Returns:
+        Ein Dictionary mit den Wochentagen, Zeitslots und Einträgen
+    """
+    entries = []
+    for cell in cells:
+        text = " ".join(line.strip() for line in cell["lines"] if line.strip())
+        if not text:
+            continue
+        
+        subject_match = SUBJECT_PATTERN.search(text)
+        room_match = ROOM_PATTERN.search(text)
+        entries.append({
+            "day": cell["day"],
+            "period": cell["period"],
+            "subject": re.sub(r'\s+', ' ', subject_match.group(0)) if subject_match else cell["lines"][0].strip(),
+            "room": (room_match.group(1) or room_match.group(2)) if room_match else "",
+            "text": text
+        })
+    
+    logger.info(f"{len(entries)} Einträge aus den Rasterzellen erkannt")
+    return {
+        "days": list(DAYS),
+        "periods": list(PERIODS),
+        "entries": entries,
+        "is_placeholder": False
+    }
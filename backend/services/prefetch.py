@@ -0,0 +1,247 @@
+import os
+import hmac
+import time
+import random
+import asyncio
+from loguru import logger
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from services.dsb_service import authenticate_user, get_all_plan_images
+from services.ocr_cache import image_hash
+from services.ocr_service import process_ocr_batch
+from services.db import store_timetable
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Standardwerte: alle 10 Minuten prüfen, ±60 Sekunden Streuung
+DEFAULT_INTERVAL = 600
+DEFAULT_JITTER = 60
+DEFAULT_MAX_QUEUE = 100
+
+
+class PrefetchAccount:
+    """Ein registriertes Konto samt Zustand der letzten Vorab-Verarbeitung."""
+
+    def __init__(self, username: str, password: str):
+        self.username = username
+        self.password = password
+        self.next_due = time.monotonic()
+        self.queued = False
+        self.plan_hashes: Dict[str, str] = {}
+        self.last_run: Optional[float] = None
+        self.last_change: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+
+class PrefetchScheduler:
+    """
+    Fragt DSBmobile für registrierte Konten periodisch ab und führt OCR vorab aus.
+
+    Neue oder geänderte Pläne werden erkannt (Hash der Bilddaten), gebündelt
+    erkannt und gespeichert, sodass /parse-plan und /latest aus vorberechneten
+    Ergebnissen antworten können. Die Intervalle werden gestreut, damit nicht
+    alle Konten gleichzeitig abgefragt werden.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, jitter: float = DEFAULT_JITTER,
+                 max_queue: int = DEFAULT_MAX_QUEUE):
+        self.interval = interval
+        self.jitter = jitter
+        self.accounts: Dict[str, PrefetchAccount] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queue)
+        self._tasks: List[asyncio.Task] = []
+
+        self.runs = 0
+        self.changes = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def _next_delay(self) -> float:
+        """Intervall bis zur nächsten Abfrage, zufällig um ±jitter gestreut."""
+        return max(1.0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    def register(self, username: str, password: str) -> None:
+        """Registriert ein Konto (oder aktualisiert dessen Passwort) und plant es sofort ein."""
+        account = self.accounts.get(username)
+        if account is None:
+            self.accounts[username] = PrefetchAccount(username, password)
+            logger.info(f"Konto für Vorab-Verarbeitung registriert: {username}")
+        else:
+            account.password = password
+
+    def unregister(self, username: str, password: str) -> bool:
+        """
+        Entfernt ein Konto aus der Vorab-Verarbeitung, wenn das Passwort zum registrierten Konto passt.
+
+        Returns:
+            False, wenn das Konto nicht registriert ist oder das Passwort nicht passt
+        """
+        account = self.accounts.get(username)
+        # Auch für unbekannte Konten vergleichen, damit die Laufzeit nichts über die Registrierung verrät
+        expected = account.password if account is not None else ""
+        matches = hmac.compare_digest(expected.encode("utf-8"), (password or "").encode("utf-8"))
+        if account is None or not matches:
+            return False
+        del self.accounts[username]
+        logger.info(f"Konto aus der Vorab-Verarbeitung entfernt: {username}")
+        return True
+
+    def is_fresh(self, username: str) -> bool:
+        """Gibt zurück, ob für das Konto ein Ergebnis aus dem aktuellen Intervall vorliegt."""
+        account = self.accounts.get(username)
+        if account is None or account.last_run is None or account.last_error:
+            return False
+        return time.monotonic() - account.last_run < self.interval + self.jitter
+
+    def start(self) -> None:
+        """Startet Planungs- und Verarbeitungs-Task."""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._schedule_loop()), asyncio.create_task(self._worker_loop())]
+            logger.info(f"Vorab-Verarbeitung gestartet (Intervall {self.interval}s ±{self.jitter}s)")
+
+    async def stop(self) -> None:
+        """Beendet die Tasks der Vorab-Verarbeitung."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _schedule_loop(self) -> None:
+        """Stellt fällige Konten in die Warteschlange."""
+        while True:
+            now = time.monotonic()
+            for account in list(self.accounts.values()):
+                if account.queued or account.next_due > now:
+                    continue
+                try:
+                    self._queue.put_nowait(account.username)
+                    account.queued = True
+                except asyncio.QueueFull:
+                    logger.warning("Warteschlange der Vorab-Verarbeitung voll")
+                    break
+            await asyncio.sleep(1.0)
+
+    async def _worker_loop(self) -> None:
+        """Verarbeitet die Konten aus der Warteschlange nacheinander."""
+        while True:
+            username = await self._queue.get()
+            account = self.accounts.get(username)
+            try:
+                if account is not None:
+                    # Verzögerung zwischen Fälligkeit und tatsächlicher Verarbeitung
+                    self.last_lag = max(0.0, time.monotonic() - account.next_due)
+                    self.max_lag = max(self.max_lag, self.last_lag)
+                    await self.refresh(account)
+            finally:
+                if account is not None:
+                    account.queued = False
+                    account.next_due = time.monotonic() + self._next_delay()
+                self._queue.task_done()
+
+    async def refresh(self, account: PrefetchAccount) -> bool:
+        """
+        Lädt die Pläne eines Kontos und verarbeitet neue oder geänderte Pläne vorab.
+
+        Args:
+            account: Das registrierte Konto
+
+        Returns:
+            True, wenn sich mindestens ein Plan geändert hat
+        """
+        self.runs += 1
+        try:
+            dsb_client = await authenticate_user(account.username, account.password)
+            if not dsb_client:
+                raise RuntimeError("Authentifizierung fehlgeschlagen")
+
+            images = await get_all_plan_images(dsb_client)
+            hashes = {title: image_hash(image_data) for title, image_data in images.items()}
+            account.last_run = time.monotonic()
+            account.last_error = None
+            if not images or hashes == account.plan_hashes:
+                return False
+
+            changed = [title for title, key in hashes.items() if account.plan_hashes.get(title) != key]
+            logger.info(f"Vorab-Verarbeitung für {account.username}: {len(changed)} neue/geänderte Pläne")
+
+            # Der neueste Plan (erster Eintrag) wird als aktueller Stundenplan gespeichert,
+            # ist er unverändert, kommt sein Ergebnis direkt aus dem OCR-Cache
+            latest_title = next(iter(images))
+            batch = {title: images[title] for title in changed}
+            batch.setdefault(latest_title, images[latest_title])
+            timetables = await process_ocr_batch(batch)
+            latest = timetables[latest_title]
+
+            available_plans = getattr(dsb_client, "available_plans", [])
+            await store_timetable(
+                account.username,
+                latest,
+                images[latest_title],
+                time.strftime("%Y-%m-%d %H:%M:%S"),
+                available_plans,
+                latest.get("class_names", []),
+                plan=latest_title
+            )
+
+            account.plan_hashes = hashes
+            account.last_change = time.monotonic()
+            self.changes += 1
+            return True
+        except Exception as e:
+            self.errors += 1
+            account.last_error = str(e)
+            logger.error(f"Fehler bei der Vorab-Verarbeitung für {account.username}: {str(e)}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt Warteschlangentiefe, Verzögerung und Zähler der Vorab-Verarbeitung zurück."""
+        now = time.monotonic()
+        overdue = [now - account.next_due for account in self.accounts.values() if account.next_due <= now]
+        return {
+            "accounts": len(self.accounts),
+            "queue_depth": self._queue.qsize(),
+            "overdue_accounts": len(overdue),
+            "current_lag": round(max(overdue), 3) if overdue else 0.0,
+            "last_lag": round(self.last_lag, 3),
+            "max_lag": round(self.max_lag, 3),
+            "runs": self.runs,
+            "changes": self.changes,
+            "errors": self.errors,
+            "interval": self.interval,
+            "jitter": self.jitter,
+        }
+
+
+# Globaler Scheduler (None, solange die Vorab-Verarbeitung deaktiviert ist)
+_scheduler = None
+
+def start_prefetch_scheduler() -> Optional[PrefetchScheduler]:
+    """
+    Startet die Vorab-Verarbeitung, falls PREFETCH_ENABLED gesetzt ist.
+    Intervall und Streuung werden über PREFETCH_INTERVAL und PREFETCH_JITTER gesteuert.
+    """
+    global _scheduler
+    if os.getenv("PREFETCH_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    if _scheduler is None:
+        _scheduler = PrefetchScheduler(
+            interval=float(os.getenv("PREFETCH_INTERVAL", DEFAULT_INTERVAL)),
+            jitter=float(os.getenv("PREFETCH_JITTER", DEFAULT_JITTER)),
+            max_queue=int(os.getenv("PREFETCH_MAX_QUEUE", DEFAULT_MAX_QUEUE)),
+        )
+        _scheduler.start()
+    return _scheduler
+
+async def stop_prefetch_scheduler() -> None:
+    """Beendet die Vorab-Verarbeitung."""
+    global _scheduler
+    if _scheduler is not None:
+        await _scheduler.stop()
+        _scheduler = None
+
+def get_prefetch_scheduler() -> Optional[PrefetchScheduler]:
+    """Gibt den Scheduler zurück oder None, wenn die Vorab-Verarbeitung deaktiviert ist."""
+    return _scheduler
@@ -0,0 +1,212 @@
+import os
+import io
+import json
+import time
+import uuid
+import random
+import pstats
+import cProfile
+import threading
+import contextvars
+from loguru import logger
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Profil der aktuellen Anfrage (None, wenn die Anfrage nicht profiliert wird)
+_current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+class RequestProfile:
+    """
+    Profil einer einzelnen Anfrage: cProfile-Daten des Event-Loops, der
+    OCR-Threads sowie die Dauer der einzelnen Verarbeitungsschritte.
+    """
+
+    def __init__(self, request_id: str, method: str, path: str, trigger: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started = time.time()
+        self.stages: List[Dict[str, Any]] = []
+        self.profiler = cProfile.Profile()
+        self._thread_stats: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        self.stages.append({"stage": stage, "seconds": round(seconds, 6)})
+
+    def add_thread_profile(self, profiler: cProfile.Profile) -> None:
+        with self._lock:
+            self._thread_stats.append(profiler)
+
+    def stats(self) -> pstats.Stats:
+        """Fasst die Daten des Event-Loops und aller Threads zusammen."""
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        with self._lock:
+            for profiler in self._thread_stats:
+                stats.add(profiler)
+        return stats
+
+
+class Profiler:
+    """
+    Entscheidet, welche Anfragen profiliert werden, und speichert die Profile.
+
+    Profiliert wird, wenn der Header X-Profile das Admin-Token enthält oder eine
+    Anfrage mit sample_rate zufällig ausgewählt wird. Ohne Token und mit
+    sample_rate=0 bleibt die Profilierung vollständig ausgeschaltet.
+
+    Es läuft höchstens ein Profil gleichzeitig, da cProfile nur einen aktiven
+    Profiler je Thread erlaubt. Gleichzeitig laufende Anfragen auf dem
+    Event-Loop erscheinen daher mit im Profil.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.0, admin_token: str = "", max_files: int = 200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.admin_token = admin_token
+        self.max_files = max_files
+        self.captured = 0
+        self.active = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.admin_token)
+
+    def trigger(self, profile_header: Optional[str]) -> Optional[str]:
+        """
+        Gibt den Auslöser zurück ("header" oder "sample") oder None, wenn nicht profiliert wird.
+        """
+        if self.active:
+            return None
+        if self.admin_token and profile_header == self.admin_token:
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def save(self, profile: RequestProfile, status: int, duration: float) -> str:
+        """
+        Speichert das Profil (pstats-Datei) und die Metadaten (JSON) im Profilverzeichnis.
+
+        Returns:
+            Der Pfad der Profildatei
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{profile.request_id}")
+        stats = profile.stats()
+        stats.dump_stats(f"{base}.prof")
+
+        summary = io.StringIO()
+        stats.stream = summary
+        stats.sort_stats("cumulative").print_stats(25)
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "request_id": profile.request_id,
+                "method": profile.method,
+                "path": profile.path,
+                "trigger": profile.trigger,
+                "status": status,
+                "duration": round(duration, 6),
+                "started": profile.started,
+                "stages": profile.stages,
+                "top_functions": summary.getvalue(),
+            }, f, indent=2)
+
+        self.captured += 1
+        self._prune()
+        logger.info(f"Profil gespeichert: {base}.prof")
+        return f"{base}.prof"
+
+    def _prune(self) -> None:
+        """Löscht die ältesten Profile, sobald mehr als max_files vorhanden sind."""
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith(".prof"))
+        for name in profiles[:max(0, len(profiles) - self.max_files)]:
+            for suffix in (".prof", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-len(".prof")] + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def new_request_id(header_value: Optional[str]) -> str:
+    """Übernimmt eine vom Client gesendete Request-ID oder erzeugt eine neue."""
+    if header_value and len(header_value) <= 64 and header_value.replace("-", "").isalnum():
+        return header_value
+    return uuid.uuid4().hex
+
+
+def start_request_profile(profile: RequestProfile) -> contextvars.Token:
+    """Macht das Profil für die aktuelle Anfrage verfügbar und startet den Profiler."""
+    token = _current_profile.set(profile)
+    profile.profiler.enable()
+    return token
+
+
+def stop_request_profile(profile: RequestProfile, token: contextvars.Token) -> None:
+    """Stoppt den Profiler der Anfrage."""
+    profile.profiler.disable()
+    _current_profile.reset(token)
+
+
+def get_current_profile() -> Optional[RequestProfile]:
+    """Gibt das Profil der aktuellen Anfrage zurück oder None."""
+    return _current_profile.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Hängt die Dauer eines Verarbeitungsschritts an das Profil der Anfrage an (falls profiliert wird)."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record_stage(stage, seconds)
+
+
+def profiled_call(func: Callable, *args: Any) -> Callable[[], Any]:
+    """
+    Bereitet einen Aufruf für run_in_executor vor.
+
+    Wird die aktuelle Anfrage profiliert, läuft die Funktion im Thread unter
+    einem eigenen cProfile, dessen Daten dem Profil der Anfrage hinzugefügt
+    werden. Sonst wird die Funktion unverändert aufgerufen.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return lambda: func(*args)
+
+    def run():
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Ab Python 3.12 ist nur ein Profiler je Prozess aktiv, der der Anfrage erfasst den Thread bereits
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profiler.disable()
+            profile.add_thread_profile(profiler)
+    return run
+
+
+# Globaler Profiler
+_profiler = None
+
+def get_profiler() -> Profiler:
+    """
+    Gibt den globalen Profiler zurück.
+    Gesteuert über PROFILE_SAMPLE_RATE, PROFILE_ADMIN_TOKEN und PROFILE_DIR.
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(
+            directory=os.getenv("PROFILE_DIR", "data/profiles"),
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+            admin_token=os.getenv("PROFILE_ADMIN_TOKEN", ""),
+        )
+    return _profiler
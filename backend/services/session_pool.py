@@ -0,0 +1,177 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from loguru import logger
+from typing import Dict, List, Optional, Any
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Standardwerte: Sitzungen 10 Minuten, Planlisten 2 Minuten wiederverwenden
+DEFAULT_SESSION_TTL = 600
+DEFAULT_PLANS_TTL = 120
+DEFAULT_MAX_SESSIONS = 256
+
+
+def session_key(username: str, password: str) -> str:
+    """
+    Bildet den Pool-Schlüssel aus Benutzername und einem Hash der Zugangsdaten.
+    Das Passwort selbst wird dabei nicht im Klartext gespeichert.
+    """
+    credential_hash = hashlib.sha256(f"{username}\0{password}".encode("utf-8")).hexdigest()
+    return f"{username}:{credential_hash}"
+
+
+class DSBSession:
+    """Ein authentifizierter PyDSB-Client samt zwischengespeicherter Planliste."""
+
+    def __init__(self, key: str, username: str, client: Any, plans: Optional[List] = None):
+        self.key = key
+        self.username = username
+        self.client = client
+        self.created_at = time.monotonic()
+        self.plans = plans
+        self.plans_fetched_at = time.monotonic() if plans is not None else None
+
+
+class SessionPool:
+    """
+    Pool authentifizierter DSBmobile-Sitzungen.
+
+    Wiederholte Anfragen mit denselben Zugangsdaten innerhalb der TTL überspringen
+    die erneute Anmeldung und den erneuten Abruf der Planliste.
+    """
+
+    def __init__(self, session_ttl: float = DEFAULT_SESSION_TTL, plans_ttl: float = DEFAULT_PLANS_TTL,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self.session_ttl = session_ttl
+        self.plans_ttl = plans_ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, DSBSession]" = OrderedDict()
+        # Zuletzt erfolgreich angemeldete Zugangsdaten je Benutzer (überdauern das Ablaufen der Sitzung)
+        self._verified: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, username: str, password: str) -> Optional[DSBSession]:
+        """
+        Gibt eine noch gültige Sitzung für die Zugangsdaten zurück.
+
+        Args:
+            username: DSBmobile Benutzername
+            password: DSBmobile Passwort
+
+        Returns:
+            Die Sitzung oder None, wenn keine (gültige) Sitzung vorhanden ist
+        """
+        key = session_key(username, password)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - session.created_at > self.session_ttl:
+                del self._sessions[key]
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(key)
+            self.hits += 1
+            return session
+
+    def put(self, username: str, password: str, client: Any, plans: Optional[List] = None) -> DSBSession:
+        """Legt eine neu authentifizierte Sitzung im Pool ab und verdrängt die älteste bei Bedarf."""
+        key = session_key(username, password)
+        session = DSBSession(key, username, client, plans)
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._verified[username] = key
+            self._verified.move_to_end(username)
+            while len(self._verified) > self.max_sessions * 4:
+                self._verified.popitem(last=False)
+        return session
+
+    def is_verified(self, username: str, password: str) -> bool:
+        """
+        Gibt zurück, ob sich der Benutzer zuletzt mit genau diesen Zugangsdaten erfolgreich angemeldet hat.
+
+        Erlaubt es, bei nicht erreichbarem DSBmobile gespeicherte Daten auszuliefern,
+        ohne die Zugangsdaten erneut prüfen zu können.
+        """
+        with self._lock:
+            return self._verified.get(username) == session_key(username, password)
+
+    def get_plans(self, session: DSBSession) -> Optional[List]:
+        """Gibt die zwischengespeicherte Planliste zurück, solange sie nicht abgelaufen ist."""
+        if session.plans is None or session.plans_fetched_at is None:
+            return None
+        if time.monotonic() - session.plans_fetched_at > self.plans_ttl:
+            return None
+        return session.plans
+
+    def set_plans(self, session: DSBSession, plans: List) -> None:
+        """Aktualisiert die Planliste einer Sitzung."""
+        session.plans = plans
+        session.plans_fetched_at = time.monotonic()
+
+    def invalidate(self, key: str) -> None:
+        """
+        Entfernt eine Sitzung explizit aus dem Pool, z.B. nach einem Authentifizierungsfehler.
+
+        Args:
+            key: Der Pool-Schlüssel der Sitzung
+        """
+        with self._lock:
+            if self._sessions.pop(key, None) is not None:
+                self.invalidations += 1
+                logger.info(f"DSB-Sitzung verworfen: {key.split(':', 1)[0]}")
+
+    def invalidate_user(self, username: str) -> None:
+        """Entfernt alle Sitzungen eines Benutzers (unabhängig vom Passwort)."""
+        with self._lock:
+            keys = [key for key, session in self._sessions.items() if session.username == username]
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self) -> None:
+        """Leert den Pool vollständig."""
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt die Kennzahlen des Pools zurück."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "session_ttl": self.session_ttl,
+                "plans_ttl": self.plans_ttl,
+            }
+
+
+# Globaler Sitzungs-Pool (wird nur einmal initialisiert)
+_session_pool = None
+
+def get_session_pool() -> SessionPool:
+    """
+    Gibt den globalen Sitzungs-Pool zurück und legt ihn beim ersten Aufruf an.
+    Die Laufzeiten werden über DSB_SESSION_TTL und DSB_PLANS_TTL gesteuert.
+    """
+    global _session_pool
+    if _session_pool is None:
+        _session_pool = SessionPool(
+            session_ttl=float(os.getenv("DSB_SESSION_TTL", DEFAULT_SESSION_TTL)),
+            plans_ttl=float(os.getenv("DSB_PLANS_TTL", DEFAULT_PLANS_TTL)),
+            max_sessions=int(os.getenv("DSB_SESSION_POOL_SIZE", DEFAULT_MAX_SESSIONS)),
+        )
+    return _session_pool
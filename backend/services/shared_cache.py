@@ -0,0 +1,335 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from loguru import logger
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Einträge, die jeder Worker-Prozess dekodiert im eigenen Speicher hält
+DEFAULT_LOCAL_ENTRIES = 1024
+# Aufbewahrung der Änderungsmeldungen in Sekunden (länger untätige Worker leeren ihren Speicher vollständig)
+DEFAULT_NOTICE_TTL = 3600
+# Obergrenze der gemeinsamen Datei in Bytes (älteste Einträge werden zuerst verworfen)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Eigenes Byte-Budget der Job-Stände (Schlüssel "job:..."), damit sie keine Stundenpläne verdrängen
+DEFAULT_JOB_MAX_BYTES = 16 * 1024 * 1024
+# Höchstalter eines Eintrags in Sekunden (0 = unbegrenzt)
+DEFAULT_ENTRY_TTL = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_updated ON entries (updated);
+CREATE TABLE IF NOT EXISTS notices (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    origin TEXT NOT NULL,            -- Kennung des schreibenden Workers
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notices_key_seq ON notices (key, seq);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SharedCache:
+    """
+    Cache, den sich alle Worker-Prozesse einer Maschine teilen.
+
+    Die Einträge liegen in einer gemeinsamen SQLite-Datei (z.B. unter /dev/shm),
+    jeder Worker hält zusätzlich die zuletzt gelesenen Einträge dekodiert im
+    eigenen Speicher. Schreibt ein Worker einen Eintrag neu oder verwirft ihn,
+    legt er eine Änderungsmeldung ab. Vor jedem Lesen übernimmt ein Worker die
+    neuen Meldungen und verwirft die betroffenen lokalen Einträge, sodass kein
+    Worker einen veralteten Stand ausliefert.
+    """
+
+    def __init__(self, path: str, local_entries: int = DEFAULT_LOCAL_ENTRIES,
+                 notice_ttl: float = DEFAULT_NOTICE_TTL, max_bytes: int = DEFAULT_MAX_BYTES,
+                 entry_ttl: float = DEFAULT_ENTRY_TTL, budgets: Optional[Dict[str, int]] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.local_entries = local_entries
+        self.notice_ttl = notice_ttl
+        self.max_bytes = max_bytes
+        self.entry_ttl = entry_ttl
+        # Präfix (Teil vor dem ersten ":") -> eigenes Byte-Budget; alle übrigen Schlüssel teilen sich max_bytes
+        self.budgets = dict(budgets or {})
+        self.origin = uuid.uuid4().hex
+        self._local: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Ältere Meldungen betreffen diesen (leeren) Worker nicht
+        self._seen = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM notices").fetchone()[0]
+        self._stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0, "writes": 0}
+        logger.info(f"Gemeinsamer Cache geöffnet: {path}")
+
+    def close(self) -> None:
+        """Schließt die Verbindung zur gemeinsamen Datei."""
+        with self._lock:
+            self._conn.close()
+
+    def sync(self) -> None:
+        """Übernimmt die Änderungsmeldungen anderer Worker und verwirft die betroffenen lokalen Einträge."""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self) -> None:
+        oldest = self._conn.execute("SELECT MIN(seq) FROM notices").fetchone()[0]
+        if oldest is not None and oldest > self._seen + 1:
+            # Meldungen wurden bereits aufgeräumt, ohne dass dieser Worker sie gesehen hat
+            self._stats["invalidations"] += len(self._local)
+            self._local.clear()
+        rows = self._conn.execute(
+            "SELECT seq, key, origin FROM notices WHERE seq > ? ORDER BY seq", (self._seen,)
+        ).fetchall()
+        for seq, key, origin in rows:
+            self._seen = seq
+            if origin != self.origin and self._local.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def get(self, key: str, loads: Callable[[bytes], Any]) -> Optional[Any]:
+        """
+        Gibt einen Eintrag aus dem lokalen Speicher oder der gemeinsamen Datei zurück.
+
+        Args:
+            key: Der Schlüssel des Eintrags
+            loads: Dekodiert den gespeicherten Inhalt (nur bei Treffern in der gemeinsamen Datei)
+
+        Returns:
+            Der Eintrag oder None
+        """
+        with self._lock:
+            self._sync_locked()
+            if key in self._local:
+                self._local.move_to_end(key)
+                self._stats["local_hits"] += 1
+                return self._local[key]
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND updated >= ?", (key, self._expired_before())
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["shared_hits"] += 1
+            value = loads(bytes(row[0]))
+            self._remember_locked(key, value)
+            return value
+
+    @property
+    def seen(self) -> int:
+        """Nummer der zuletzt übernommenen Änderungsmeldung (Stand vor einem Lesen aus dem Speicher-Backend)."""
+        with self._lock:
+            return self._seen
+
+    def remember(self, key: str, value: Any, since: int, payload: Optional[bytes] = None) -> None:
+        """
+        Legt einen aus dem Speicher-Backend gelesenen Eintrag im lokalen Speicher ab
+        und, mit payload, auch in der gemeinsamen Datei für die übrigen Worker.
+
+        Wurde der Eintrag seit since (Wert von seen vor dem Lesen) als geändert
+        gemeldet, ist der gelesene Stand womöglich veraltet und wird verworfen.
+        Prüfung und Schreiben laufen in einer Transaktion, eine Änderung eines
+        anderen Workers kann also nicht dazwischen liegen. Der gelesene Stand
+        selbst wird nicht gemeldet, er ändert für die übrigen Worker nichts.
+        """
+        with self._lock:
+            if payload is None:
+                changed = self._conn.execute(
+                    "SELECT 1 FROM notices WHERE key = ? AND seq > ? LIMIT 1", (key, since)
+                ).fetchone()
+                if changed is None:
+                    self._remember_locked(key, value)
+                return
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = self._conn.execute(
+                    "SELECT 1 FROM notices WHERE key = ? AND seq > ? LIMIT 1", (key, since)
+                ).fetchone()
+                evicted = []
+                if changed is None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, updated) VALUES (?, ?, ?)", (key, payload, now)
+                    )
+                    evicted = self._evict_locked(now, key)
+                    self._conn.executemany(
+                        "INSERT INTO notices (key, origin, created) VALUES (?, ?, ?)",
+                        [(gone, self.origin, now) for gone in evicted],
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for gone in evicted:
+                self._local.pop(gone, None)
+            if changed is None and key not in evicted:
+                self._remember_locked(key, value)
+                self._stats["writes"] += 1
+
+    def _remember_locked(self, key: str, value: Any) -> None:
+        self._local[key] = value
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_entries:
+            self._local.popitem(last=False)
+
+    def put(self, key: str, value: Any, payload: bytes) -> None:
+        """
+        Speichert einen Eintrag für alle Worker und meldet die Änderung.
+
+        Args:
+            key: Der Schlüssel des Eintrags
+            value: Der Eintrag für den lokalen Speicher
+            payload: Der serialisierte Eintrag für die gemeinsame Datei
+        """
+        with self._lock:
+            self._write_locked(key, payload)
+            self._remember_locked(key, value)
+            self._stats["writes"] += 1
+
+    def invalidate(self, key: str) -> None:
+        """Verwirft einen Eintrag in allen Workern (z.B. nach einer neuen Version im Speicher-Backend)."""
+        with self._lock:
+            self._write_locked(key, None)
+            self._local.pop(key, None)
+
+    def _write_locked(self, key: str, payload: Optional[bytes]) -> None:
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if payload is None:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, updated) VALUES (?, ?, ?)", (key, payload, now)
+                )
+            evicted = self._evict_locked(now, key)
+            self._conn.executemany(
+                "INSERT INTO notices (key, origin, created) VALUES (?, ?, ?)",
+                [(changed, self.origin, now) for changed in (key, *evicted)],
+            )
+            self._conn.execute("DELETE FROM notices WHERE created < ?", (now - self.notice_ttl,))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        for changed in evicted:
+            self._local.pop(changed, None)
+
+    def _expired_before(self, now: Optional[float] = None) -> float:
+        """Schreibzeitpunkt, vor dem ein Eintrag als abgelaufen gilt."""
+        if self.entry_ttl <= 0:
+            return 0.0
+        return (now if now is not None else time.time()) - self.entry_ttl
+
+    def _evict_locked(self, now: float, key: str) -> List[str]:
+        """
+        Entfernt abgelaufene Einträge und die ältesten, solange das Budget des geschriebenen
+        Schlüssels überschritten ist. Präfixe mit eigenem Budget (budgets) werden getrennt
+        von den übrigen Einträgen gezählt, die sich max_bytes teilen.
+        Die Schlüssel werden gemeldet, damit kein Worker die Einträge weiter lokal ausliefert.
+        """
+        evicted = [row[0] for row in self._conn.execute(
+            "SELECT key FROM entries WHERE updated < ?", (self._expired_before(now),)
+        )]
+        self._conn.execute("DELETE FROM entries WHERE updated < ?", (self._expired_before(now),))
+
+        prefix = key.split(":", 1)[0]
+        if prefix in self.budgets:
+            budget = self.budgets[prefix]
+            # Bereichsabfrage über den Primärschlüssel (";" folgt auf ":")
+            scope, params = "key >= ? AND key < ?", (f"{prefix}:", f"{prefix};")
+        else:
+            budget = self.max_bytes
+            scope, params = "1", ()
+            for other in self.budgets:
+                scope += " AND NOT (key >= ? AND key < ?)"
+                params += (f"{other}:", f"{other};")
+
+        total = self._conn.execute(
+            f"SELECT COALESCE(SUM(length(value)), 0) FROM entries WHERE {scope}", params
+        ).fetchone()[0]
+        if total > budget:
+            for old_key, size in self._conn.execute(
+                f"SELECT key, length(value) FROM entries WHERE {scope} ORDER BY updated, key", params
+            ).fetchall():
+                if total <= budget:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                evicted.append(old_key)
+                total -= size
+        return evicted
+
+    def next_id(self, name: str) -> int:
+        """Gibt die nächste Nummer eines prozessübergreifenden Zählers zurück (z.B. für Versions-IDs)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO counters (name, value) VALUES (?, 1) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+                )
+                value = self._conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt Treffer, Fehlschläge, verworfene Einträge und die Größe des lokalen Speichers zurück."""
+        with self._lock:
+            return {
+                "path": self.path,
+                "pid": os.getpid(),
+                "local_entries": len(self._local),
+                "last_notice": self._seen,
+                **self._stats,
+            }
+
+
+# Gemeinsamer Cache des Prozesses (None, wenn SHARED_CACHE_PATH nicht gesetzt ist)
+_shared_cache: Optional[SharedCache] = None
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """
+    Gibt den gemeinsamen Cache zurück oder None, wenn er nicht konfiguriert ist.
+    Gesteuert über SHARED_CACHE_PATH, SHARED_CACHE_LOCAL_ENTRIES, SHARED_CACHE_MAX_BYTES,
+    SHARED_CACHE_JOB_MAX_BYTES und SHARED_CACHE_ENTRY_TTL.
+    """
+    global _shared_cache
+    path = os.getenv("SHARED_CACHE_PATH", "")
+    if not path:
+        return None
+    if _shared_cache is None or _shared_cache.path != path:
+        _shared_cache = SharedCache(
+            path,
+            local_entries=int(os.getenv("SHARED_CACHE_LOCAL_ENTRIES", DEFAULT_LOCAL_ENTRIES)),
+            max_bytes=int(os.getenv("SHARED_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            entry_ttl=float(os.getenv("SHARED_CACHE_ENTRY_TTL", DEFAULT_ENTRY_TTL)),
+            budgets={"job": int(os.getenv("SHARED_CACHE_JOB_MAX_BYTES", DEFAULT_JOB_MAX_BYTES))},
+        )
+    return _shared_cache
+
+def close_shared_cache() -> None:
+    """Schließt den gemeinsamen Cache. Wird im Shutdown-Hook von main.py aufgerufen."""
+    global _shared_cache
+    if _shared_cache is not None:
+        _shared_cache.close()
+        _shared_cache = None
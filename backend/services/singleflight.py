@@ -0,0 +1,111 @@
+import asyncio
+from loguru import logger
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+
+class SingleFlight:
+    """
+    Fasst gleichzeitige, identische Arbeit zu einem einzigen laufenden Task zusammen.
+
+    Alle Aufrufer, die mit demselben Schlüssel warten, teilen sich den Task und
+    erhalten dessen Ergebnis bzw. dessen Exception. Nach Abschluss wird der
+    Schlüssel sofort wieder freigegeben, ein Fehler blockiert spätere Versuche also nicht.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Führt func für den Schlüssel aus oder wartet auf die bereits laufende Ausführung.
+
+        Args:
+            key: Der Schlüssel der Arbeit, z.B. ("download", plan_url)
+            func: Eine Funktion, die die eigentliche Coroutine erzeugt
+
+        Returns:
+            Das Ergebnis der (geteilten) Ausführung
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"Warte auf laufende Verarbeitung für {key[0] if isinstance(key, tuple) else key}")
+        else:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            self.started += 1
+            task.add_done_callback(lambda done, key=key: self._finish(key, done))
+
+        # shield verhindert, dass der Abbruch eines Wartenden den geteilten Task beendet
+        return await asyncio.shield(task)
+
+    async def do_many(self, keys: List[Hashable],
+                      func: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]) -> Dict[Hashable, Any]:
+        """
+        Wie do für mehrere Schlüssel, deren Arbeit sich gebündelt erledigen lässt.
+
+        Bereits laufende Ausführungen einzelner Schlüssel werden mitgenutzt, nur die
+        übrigen Schlüssel gehen gemeinsam an func. Während der gebündelte Lauf
+        läuft, ist jeder seiner Schlüssel einzeln belegt, sodass auch Aufrufe von
+        do für denselben Schlüssel auf ihn warten.
+
+        Args:
+            keys: Die Schlüssel der Arbeit, z.B. [("ocr", hash), ...]
+            func: Erzeugt aus den nicht laufenden Schlüsseln die Coroutine, die je Schlüssel ein Ergebnis liefert
+
+        Returns:
+            Die Ergebnisse nach Schlüssel
+
+        Raises:
+            Die erste Exception der beteiligten Ausführungen
+        """
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in self._inflight]
+        self.coalesced += len(keys) - len(missing)
+        if missing:
+            batch = asyncio.ensure_future(func(missing))
+            self.started += 1
+
+            async def pick(key: Hashable) -> Any:
+                return (await batch)[key]
+
+            for key in missing:
+                task = asyncio.ensure_future(pick(key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda done, key=key: self._finish(key, done))
+
+        tasks = [self._inflight[key] for key in keys]
+        results = await asyncio.gather(*[asyncio.shield(task) for task in tasks], return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return dict(zip(keys, results))
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        """Gibt den Schlüssel nach Abschluss frei."""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Exception als abgerufen markieren, falls alle Wartenden abgebrochen wurden
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Gibt die Anzahl gestarteter und zusammengefasster Ausführungen zurück."""
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+# Globale SingleFlight-Gruppe (wird nur einmal initialisiert)
+_flights = None
+
+def get_flights() -> SingleFlight:
+    """Gibt die globale SingleFlight-Gruppe für Planlisten, Downloads und OCR zurück."""
+    global _flights
+    if _flights is None:
+        _flights = SingleFlight()
+    return _flights
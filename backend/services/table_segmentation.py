@@ -0,0 +1,219 @@
+import os
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Aufbau des MTL-Wochenplans: eine Spalte je Wochentag, eine Zeile je Unterrichtsblock
+DAYS = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag"]
+PERIODS = ["I", "II", "III", "IV", "bb - V"]
+
+# Pixel unterhalb dieses Grauwerts gelten als Tinte
+DARK_THRESHOLD = 128
+# Anteil dunkler Pixel, ab dem eine Pixelzeile/-spalte als Tabellenlinie zählt
+LINE_FRACTION = 0.5
+# Anteil dunkler Pixel, unter dem eine Zelle als leer gilt
+EMPTY_CELL_FRACTION = 0.002
+# Zusätzlicher Rand um jede erkannte Textzeile (in Pixeln)
+LINE_PADDING = 2
+# Textzeilen je Inferenzschritt der Erkennung (ein Plan hat meist 20-60 beschriftete Zeilen)
+DEFAULT_BATCH_SIZE = 32
+
+
+class Grid:
+    """Die gefundenen Tabellenlinien eines Plans als (Start, Ende)-Pixelbereiche."""
+
+    def __init__(self, rows: List[Tuple[int, int]], cols: List[Tuple[int, int]]):
+        self.rows = rows
+        self.cols = cols
+
+    @property
+    def top(self) -> int:
+        """Oberkante der Tabelle (erste horizontale Linie)."""
+        return self.rows[0][0]
+
+
+def _group_runs(indices: np.ndarray, max_gap: int = 1) -> List[Tuple[int, int]]:
+    """Fasst aufeinanderfolgende Indizes zu (Start, Ende)-Bereichen zusammen."""
+    if indices.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) > max_gap)
+    starts = np.concatenate(([indices[0]], indices[breaks + 1]))
+    ends = np.concatenate((indices[breaks], [indices[-1]]))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _ruling_lines(dark: np.ndarray, axis: int, line_fraction: float) -> List[Tuple[int, int]]:
+    """Findet durchgehende Linien über das Profil dunkler Pixel entlang einer Achse."""
+    profile = dark.mean(axis=axis)
+    return _group_runs(np.flatnonzero(profile >= line_fraction))
+
+
+def detect_grid(gray: np.ndarray, dark_threshold: int = DARK_THRESHOLD,
+                line_fraction: float = LINE_FRACTION) -> Optional[Grid]:
+    """
+    Sucht die Linien des MTL-Wochenrasters in einem Graustufenbild.
+
+    Zuerst werden die horizontalen Linien über die ganze Breite gesucht, danach die
+    vertikalen Linien nur innerhalb der Tabellenhöhe und abschließend die horizontalen
+    Linien erneut innerhalb der Tabellenbreite, damit Überschriften das Profil nicht verfälschen.
+
+    Args:
+        gray: Das Graustufenbild als 2D-Array
+        dark_threshold: Grauwert, unter dem ein Pixel als dunkel gilt
+        line_fraction: Mindestanteil dunkler Pixel für eine Linie
+
+    Returns:
+        Das gefundene Raster oder None, wenn kein passendes Raster erkannt wurde
+    """
+    dark = gray < dark_threshold
+
+    rows = _ruling_lines(dark, axis=1, line_fraction=line_fraction)
+    if len(rows) < len(PERIODS) + 1:
+        return None
+
+    top, bottom = rows[0][0], rows[-1][1] + 1
+    cols = _ruling_lines(dark[top:bottom], axis=0, line_fraction=line_fraction)
+    if len(cols) < len(DAYS) + 1:
+        return None
+
+    left, right = cols[0][0], cols[-1][1] + 1
+    rows = _ruling_lines(dark[:, left:right], axis=1, line_fraction=line_fraction)
+
+    # Erlaubt ist höchstens eine Kopfzeile (Wochentage) und eine Kopfspalte (Blöcke)
+    if not (len(PERIODS) <= len(rows) - 1 <= len(PERIODS) + 1):
+        return None
+    if not (len(DAYS) <= len(cols) - 1 <= len(DAYS) + 1):
+        return None
+    return Grid(rows, cols)
+
+
+def grid_cells(grid: Grid) -> List[Dict]:
+    """
+    Ordnet die Zellen des Rasters Wochentag und Unterrichtsblock zu.
+
+    Die letzten fünf Spalten sind die Wochentage, die letzten fünf Zeilen die
+    Blöcke I–V. Eine vorangestellte Kopfzeile bzw. -spalte wird übersprungen.
+
+    Returns:
+        Die Zellen mit day, period und den Pixelgrenzen x0, x1, y0, y1 (ohne Linien)
+    """
+    row_offset = len(grid.rows) - 1 - len(PERIODS)
+    col_offset = len(grid.cols) - 1 - len(DAYS)
+
+    cells = []
+    for period_index, period in enumerate(PERIODS):
+        upper = grid.rows[row_offset + period_index]
+        lower = grid.rows[row_offset + period_index + 1]
+        for day_index, day in enumerate(DAYS):
+            left = grid.cols[col_offset + day_index]
+            right = grid.cols[col_offset + day_index + 1]
+            cells.append({
+                "day": day,
+                "period": period,
+                "x0": left[1] + 1,
+                "x1": right[0],
+                "y0": upper[1] + 1,
+                "y1": lower[0],
+            })
+    return cells
+
+
+def text_line_boxes(dark: np.ndarray, x0: int, y0: int, padding: int = LINE_PADDING) -> List[List[int]]:
+    """
+    Teilt einen Bildausschnitt über das Zeilenprofil in einzelne Textzeilen.
+
+    Args:
+        dark: Die Tintenmaske des Ausschnitts
+        x0: Linke Kante des Ausschnitts im Gesamtbild
+        y0: Obere Kante des Ausschnitts im Gesamtbild
+        padding: Zusätzlicher Rand um jede Zeile
+
+    Returns:
+        Die Zeilen als EasyOCR-Boxen [x_min, x_max, y_min, y_max] in Bildkoordinaten
+    """
+    height, width = dark.shape
+    boxes = []
+    for start, end in _group_runs(np.flatnonzero(dark.any(axis=1))):
+        ink_cols = np.flatnonzero(dark[start:end + 1].any(axis=0))
+        if end - start < 2 or ink_cols.size == 0:
+            # Einzelne Störpixel ignorieren
+            continue
+        boxes.append([
+            x0 + max(0, int(ink_cols[0]) - padding),
+            x0 + min(width, int(ink_cols[-1]) + 1 + padding),
+            y0 + max(0, start - padding),
+            y0 + min(height, end + 1 + padding),
+        ])
+    return boxes
+
+
+def recognition_batch_size() -> int:
+    """Gibt die Anzahl der Textzeilen je Inferenzschritt zurück (OCR_BATCH_SIZE)."""
+    return int(os.getenv("OCR_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+
+
+def recognize_cells(reader, gray: np.ndarray, grid: Grid, dark_threshold: int = DARK_THRESHOLD,
+                    batch_size: Optional[int] = None) -> Tuple[List[Dict], List]:
+    """
+    Erkennt nur den Text innerhalb der Rasterzellen und der Überschrift über der Tabelle.
+
+    Statt einer Textdetektion über die ganze Seite werden die Textzeilen jeder Zelle
+    direkt aus dem Zeilenprofil bestimmt und gemeinsam mit reader.recognize erkannt.
+    Ohne batch_size erkennt EasyOCR jede Zeile in einem eigenen Inferenzschritt.
+
+    Args:
+        reader: Der EasyOCR Reader
+        gray: Das Graustufenbild
+        grid: Das gefundene Raster
+        batch_size: Textzeilen je Inferenzschritt (Standard: OCR_BATCH_SIZE)
+
+    Returns:
+        Die nicht leeren Zellen mit ihren erkannten Zeilen sowie alle Ergebnisse
+        als Liste von [Box, Text, Konfidenz]
+    """
+    dark = gray < dark_threshold
+    cells = grid_cells(grid)
+
+    boxes: List[List[int]] = []
+    # Überschrift oberhalb der Tabelle (enthält z.B. die Klassenbezeichnung)
+    boxes.extend(text_line_boxes(dark[:grid.top], 0, 0))
+
+    for cell in cells:
+        region = dark[cell["y0"]:cell["y1"], cell["x0"]:cell["x1"]]
+        if region.size == 0 or region.mean() < EMPTY_CELL_FRACTION:
+            continue
+        boxes.extend(text_line_boxes(region, cell["x0"], cell["y0"]))
+
+    if not boxes:
+        return [], []
+
+    batch_size = recognition_batch_size() if batch_size is None else batch_size
+    raw = reader.recognize(gray, horizontal_list=boxes, free_list=[], detail=1, batch_size=batch_size)
+
+    results = []
+    lines: Dict[int, List[Tuple[int, str, float]]] = {}
+    for box, text, confidence in raw:
+        plain_box = [[int(x), int(y)] for x, y in box]
+        results.append([plain_box, text, float(confidence)])
+
+        # Zeile über ihren Mittelpunkt der Zelle zuordnen
+        center_x = (plain_box[0][0] + plain_box[2][0]) / 2
+        center_y = (plain_box[0][1] + plain_box[2][1]) / 2
+        for index, cell in enumerate(cells):
+            if cell["x0"] <= center_x < cell["x1"] and cell["y0"] <= center_y < cell["y1"]:
+                lines.setdefault(index, []).append((plain_box[0][1], text, float(confidence)))
+                break
+
+    recognized = []
+    for index in sorted(lines):
+        cell_lines = sorted(lines[index])
+        recognized.append({
+            "day": cells[index]["day"],
+            "period": cells[index]["period"],
+            "lines": [text for _, text, _ in cell_lines],
+            "confidence": round(sum(conf for _, _, conf in cell_lines) / len(cell_lines), 4),
+        })
+    return recognized, results
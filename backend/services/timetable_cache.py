@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from loguru import logger
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Standardwerte: 32 MB serialisierte Stundenpläne, 5 Minuten frisch, danach 1 Stunde veraltet nutzbar
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL = 300
+DEFAULT_GRACE = 3600
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+class TimetableCache:
+    """
+    Größenbegrenzter Cache der erkannten Stundenpläne je Benutzer mit Ablaufzeit.
+
+    Ein Eintrag ist bis ttl Sekunden nach dem Abruf frisch und wird direkt
+    ausgeliefert. Danach gilt er für weitere grace Sekunden als veraltet: er
+    wird weiterhin ausgeliefert, während im Hintergrund neu abgerufen wird
+    (stale-while-revalidate). Ältere Einträge werden verworfen. Verdrängt wird
+    nach der Größe der serialisierten Einträge in Bytes, nicht nach ihrer Anzahl.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL, grace: float = DEFAULT_GRACE):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.grace = grace
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._current_bytes = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "refreshes": 0}
+
+    def state(self, fetched_at: float, now: Optional[float] = None) -> Optional[str]:
+        """Gibt FRESH, STALE oder None (abgelaufen) für einen Abrufzeitpunkt zurück."""
+        age = (now if now is not None else time.time()) - fetched_at
+        if age < self.ttl:
+            return FRESH
+        if age < self.ttl + self.grace:
+            return STALE
+        return None
+
+    def get(self, username: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Sucht den zwischengespeicherten Stundenplan eines Benutzers.
+
+        Returns:
+            Ein Tupel aus Eintrag (wie bei put) und Zustand (FRESH/STALE) oder (None, None)
+        """
+        with self._lock:
+            cached = self._entries.get(username)
+            if cached is None:
+                self._stats["misses"] += 1
+                return None, None
+            fetched_at, payload = cached
+            state = self.state(fetched_at)
+            if state is None:
+                self._drop_locked(username)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None, None
+            self._entries.move_to_end(username)
+            self._stats[f"{state}_hits"] += 1
+        return json.loads(payload), state
+
+    def put(self, username: str, entry: Dict[str, Any], fetched_at: Optional[float] = None) -> None:
+        """
+        Speichert den Stundenplan eines Benutzers und verdrängt bei Bedarf die ältesten Einträge.
+
+        Args:
+            username: Der Benutzername
+            entry: timetable, available_plans, available_classes und last_updated
+            fetched_at: Zeitpunkt des Abrufs bei DSBmobile (Standard: jetzt)
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        if self.state(fetched_at) is None:
+            return
+        payload = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._drop_locked(username)
+            self._entries[username] = (fetched_at, payload)
+            self._current_bytes += len(payload)
+            while self._current_bytes > self.max_bytes and self._entries:
+                old_username = next(iter(self._entries))
+                self._drop_locked(old_username)
+                self._stats["evictions"] += 1
+
+    def _drop_locked(self, username: str) -> None:
+        cached = self._entries.pop(username, None)
+        if cached is not None:
+            self._current_bytes -= len(cached[1])
+
+    def begin_refresh(self, username: str) -> bool:
+        """Meldet eine Hintergrund-Aktualisierung an; False, wenn für den Benutzer bereits eine läuft."""
+        with self._lock:
+            if username in self._refreshing:
+                return False
+            self._refreshing.add(username)
+            self._stats["refreshes"] += 1
+            return True
+
+    def end_refresh(self, username: str) -> None:
+        """Meldet das Ende einer Hintergrund-Aktualisierung."""
+        with self._lock:
+            self._refreshing.discard(username)
+
+    def clear(self) -> None:
+        """Leert den Cache."""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt Treffer, Fehlschläge, Verdrängungen sowie die aktuelle Größe zurück."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "grace": self.grace,
+                "refreshing": len(self._refreshing),
+                **self._stats,
+            }
+
+
+# Globaler Cache (wird nur einmal initialisiert)
+_timetable_cache = None
+
+def get_timetable_cache() -> TimetableCache:
+    """
+    Gibt den globalen Stundenplan-Cache zurück.
+    Gesteuert über TIMETABLE_CACHE_MAX_BYTES, TIMETABLE_CACHE_TTL und TIMETABLE_CACHE_GRACE.
+    """
+    global _timetable_cache
+    if _timetable_cache is None:
+        _timetable_cache = TimetableCache(
+            max_bytes=int(os.getenv("TIMETABLE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            ttl=float(os.getenv("TIMETABLE_CACHE_TTL", DEFAULT_TTL)),
+            grace=float(os.getenv("TIMETABLE_CACHE_GRACE", DEFAULT_GRACE)),
+        )
+        logger.info(
+            f"Stundenplan-Cache: {_timetable_cache.max_bytes} Bytes, "
+            f"TTL {_timetable_cache.ttl:.0f}s, Gnadenfrist {_timetable_cache.grace:.0f}s"
+        )
+    return _timetable_cache
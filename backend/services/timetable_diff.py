@@ -0,0 +1,90 @@
+from typing import Any, Dict, List, Tuple
+
+from services.table_segmentation import DAYS, PERIODS
+
+# Felder eines Eintrags, deren Änderung als "geändert" gilt
+COMPARED_FIELDS = ("subject", "room", "text")
+
+EntryKey = Tuple[str, str, str, int]
+
+
+def _default_class(timetable: Dict) -> str:
+    """Klasse eines Plans, falls er genau einer Klasse gehört (MTL-Pläne gelten je Klasse)."""
+    class_names = timetable.get("class_names") or []
+    return class_names[0] if len(class_names) == 1 else ""
+
+
+def index_entries(timetable: Dict) -> Dict[EntryKey, Dict]:
+    """
+    Ordnet die Einträge eines Stundenplans nach (Klasse, Tag, Block).
+
+    Mehrere Einträge im selben Block werden über ihre Reihenfolge unterschieden.
+
+    Returns:
+        Die Einträge nach Schlüssel (Klasse, Tag, Block, laufende Nummer)
+    """
+    default_class = _default_class(timetable)
+    indexed: Dict[EntryKey, Dict] = {}
+    counts: Dict[Tuple[str, str, str], int] = {}
+    for entry in timetable.get("entries", []):
+        slot = (entry.get("class") or default_class, entry.get("day", ""), entry.get("period", ""))
+        occurrence = counts.get(slot, 0)
+        counts[slot] = occurrence + 1
+        indexed[slot + (occurrence,)] = entry
+    return indexed
+
+
+def _sort_key(key: EntryKey) -> Tuple[Any, ...]:
+    """Sortiert nach Klasse, Wochentag und Block in der Reihenfolge des Plans."""
+    class_name, day, period, occurrence = key
+    day_index = DAYS.index(day) if day in DAYS else len(DAYS)
+    period_index = PERIODS.index(period) if period in PERIODS else len(PERIODS)
+    return class_name, day_index, day, period_index, period, occurrence
+
+
+def _located(key: EntryKey, entry: Dict) -> Dict:
+    """Gibt einen Eintrag mit seiner Klasse zurück."""
+    return {**entry, "class": key[0]}
+
+
+def diff_timetables(old: Dict, new: Dict) -> Dict[str, Any]:
+    """
+    Berechnet die Änderungen zwischen zwei Versionen eines Stundenplans.
+
+    Args:
+        old: Die ältere Version
+        new: Die neuere Version
+
+    Returns:
+        Ein Dictionary mit added, removed und changed (je Klasse/Tag/Block)
+        sowie der Anzahl unveränderter Einträge
+    """
+    old_entries = index_entries(old)
+    new_entries = index_entries(new)
+
+    added = [_located(key, new_entries[key]) for key in sorted(new_entries.keys() - old_entries.keys(), key=_sort_key)]
+    removed = [_located(key, old_entries[key]) for key in sorted(old_entries.keys() - new_entries.keys(), key=_sort_key)]
+
+    changed = []
+    unchanged = 0
+    for key in sorted(old_entries.keys() & new_entries.keys(), key=_sort_key):
+        before, after = old_entries[key], new_entries[key]
+        fields = [field for field in COMPARED_FIELDS if before.get(field) != after.get(field)]
+        if not fields:
+            unchanged += 1
+            continue
+        changed.append({
+            "class": key[0],
+            "day": key[1],
+            "period": key[2],
+            "fields": fields,
+            "before": before,
+            "after": after,
+        })
+
+    return {"added": added, "removed": removed, "changed": changed, "unchanged": unchanged}
+
+
+def is_empty(diff: Dict[str, Any]) -> bool:
+    """Gibt zurück, ob sich zwischen den Versionen nichts geändert hat."""
+    return not (diff["added"] or diff["removed"] or diff["changed"])
@@ -0,0 +1,303 @@
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+import threading
+from loguru import logger
+from typing import Dict, List, Optional, Any
+
+# Aufbewahrte Versionen je Benutzer (ältere werden samt nicht mehr referenzierter Bilder gelöscht)
+DEFAULT_MAX_VERSIONS = 50
+
+# Schema der lokalen Ersatz-Tabelle für die Supabase-Tabelle "timetables"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timetables (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    data BLOB NOT NULL,              -- zlib-komprimiertes JSON
+    image_hash TEXT,                 -- Verweis in den Blob-Speicher
+    available_plans BLOB,            -- zlib-komprimiertes JSON
+    available_classes BLOB,          -- zlib-komprimiertes JSON
+    response BLOB,                   -- fertig serialisierte Antwort für /latest
+    etag TEXT,                       -- starker ETag der Antwort
+    payload_hash TEXT,               -- Hash von Daten, Bild und Planliste (erkennt unveränderte Abrufe)
+    plan_key TEXT,                   -- Titel (sonst URL) des Plans, zu dem die Version gehört
+    checked_at TEXT                  -- letzter Abruf, der diese Version unverändert bestätigt hat
+);
+CREATE INDEX IF NOT EXISTS idx_timetables_username_timestamp
+    ON timetables (username, timestamp DESC, id DESC);
+CREATE TABLE IF NOT EXISTS class_responses (
+    timetable_id INTEGER NOT NULL,   -- Version, zu der die Antwort gehört
+    class_name TEXT NOT NULL,        -- normalisierte Klasse, z.B. "MTL 01"
+    response BLOB NOT NULL,          -- fertig serialisierte Antwort für /latest?class=
+    etag TEXT NOT NULL,              -- starker ETag der Antwort
+    PRIMARY KEY (timetable_id, class_name)
+);
+"""
+
+# Erst nach der Migration anlegen, da ältere Datenbanken plan_key noch nicht kennen
+PLAN_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_timetables_username_plan_timestamp
+    ON timetables (username, plan_key, timestamp DESC, id DESC);
+"""
+
+
+def _pack(value: Any) -> bytes:
+    """Serialisiert einen Wert als komprimiertes JSON."""
+    return zlib.compress(json.dumps(value).encode("utf-8"))
+
+
+def _unpack(value: Optional[bytes]) -> Any:
+    """Liest einen mit _pack gespeicherten Wert."""
+    if value is None:
+        return None
+    return json.loads(zlib.decompress(value).decode("utf-8"))
+
+
+class BlobStore:
+    """
+    Inhaltsadressierter Speicher für Plan-Bilder.
+
+    Jedes Bild wird unter dem SHA-256 seines Inhalts genau einmal abgelegt,
+    unabhängig davon, wie viele Benutzer oder Versionen darauf verweisen.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, content: bytes) -> str:
+        """Speichert den Inhalt (falls noch nicht vorhanden) und gibt seinen Hash zurück."""
+        key = hashlib.sha256(content).hexdigest()
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return key
+
+    def delete(self, key: str) -> None:
+        """Löscht den Inhalt zu einem Hash (falls vorhanden)."""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Gibt den Inhalt zu einem Hash zurück oder None, wenn er nicht existiert."""
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class SQLiteTimetableStore:
+    """
+    Persistenter Speicher für Stundenpläne auf Basis von SQLite.
+
+    Hält die Historie je Benutzer (Index auf username, timestamp), speichert die
+    Nutzdaten komprimiert und die Bilder im BlobStore. Unveränderte Abrufe legen
+    keine neue Version an, und je Benutzer bleiben höchstens max_versions
+    Versionen erhalten (0 = unbegrenzt).
+    """
+
+    def __init__(self, db_path: str, blob_dir: str, max_versions: int = DEFAULT_MAX_VERSIONS):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.max_versions = max_versions
+        self.blobs = BlobStore(blob_dir)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(PLAN_INDEX)
+        self._conn.commit()
+        logger.info(f"SQLite-Speicher geöffnet: {db_path}")
+
+    def _migrate(self) -> None:
+        """Ergänzt Spalten, die in älteren Datenbanken noch fehlen."""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(timetables)")}
+        for column, column_type in (("response", "BLOB"), ("etag", "TEXT"), ("payload_hash", "TEXT"),
+                                    ("plan_key", "TEXT"), ("checked_at", "TEXT")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE timetables ADD COLUMN {column} {column_type}")
+
+    def close(self) -> None:
+        """Schließt die Datenbankverbindung."""
+        with self._lock:
+            self._conn.close()
+
+    def insert(self, username: str, data: Dict, image_data: Optional[bytes], timestamp: str,
+               available_plans: List, available_classes: List,
+               response: Optional[bytes] = None, etag: Optional[str] = None, plan_key: Optional[str] = None,
+               class_responses: Optional[Dict[str, Dict]] = None) -> int:
+        """
+        Speichert eine neue Version des Stundenplans eines Benutzers, optional zusammen
+        mit der vorab serialisierten Antwort, ihrem ETag und den Antworten je Klasse.
+
+        Stimmen Plan, Daten, Bild und Planliste mit der neuesten Version überein,
+        wird keine neue Version angelegt, sondern nur ihr checked_at aktualisiert.
+
+        Alles läuft in einer Schreibtransaktion (BEGIN IMMEDIATE). Die Sperre gilt
+        für alle Prozesse, sodass das Aufräumen eines anderen Workers kein Bild
+        löschen kann, das hier gerade abgelegt und referenziert wird.
+
+        Returns:
+            Die ID der neuen (bzw. der unveränderten neuesten) Version
+        """
+        packed = (_pack(data), _pack(available_plans), _pack(available_classes))
+        image_key = hashlib.sha256(image_data).hexdigest() if image_data else None
+        digest = hashlib.sha256()
+        for part in (*packed, (image_key or "").encode("utf-8"), (plan_key or "").encode("utf-8")):
+            digest.update(hashlib.sha256(part).digest())
+        payload_hash = digest.hexdigest()
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                latest = self._conn.execute(
+                    "SELECT id, payload_hash FROM timetables WHERE username = ? "
+                    "ORDER BY timestamp DESC, id DESC LIMIT 1",
+                    (username,),
+                ).fetchone()
+                if latest is not None and latest["payload_hash"] == payload_hash:
+                    self._conn.execute("UPDATE timetables SET checked_at = ? WHERE id = ?", (timestamp, latest["id"]))
+                    self._conn.commit()
+                    return latest["id"]
+
+                image_hash = self.blobs.put(image_data) if image_data else None
+                cursor = self._conn.execute(
+                    "INSERT INTO timetables "
+                    "(username, timestamp, data, image_hash, available_plans, available_classes, response, etag, "
+                    "payload_hash, plan_key, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (username, timestamp, packed[0], image_hash, packed[1], packed[2], response, etag, payload_hash,
+                     plan_key, timestamp),
+                )
+                self._conn.executemany(
+                    "INSERT INTO class_responses (timetable_id, class_name, response, etag) VALUES (?, ?, ?, ?)",
+                    [(cursor.lastrowid, name, rendered["body"], rendered["etag"])
+                     for name, rendered in (class_responses or {}).items()],
+                )
+                self._prune_locked(username)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            return cursor.lastrowid
+
+    def _prune_locked(self, username: str) -> None:
+        """
+        Löscht die Versionen eines Benutzers über max_versions und nicht mehr referenzierte Bilder.
+        Läuft in der Schreibtransaktion von insert, damit kein anderer Prozess ein Bild
+        zwischen Prüfung und Löschen erneut verwendet.
+        """
+        if self.max_versions <= 0:
+            return
+        rows = self._conn.execute(
+            "SELECT id, image_hash FROM timetables WHERE username = ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?",
+            (username, self.max_versions),
+        ).fetchall()
+        if not rows:
+            return
+        self._conn.executemany("DELETE FROM timetables WHERE id = ?", [(row["id"],) for row in rows])
+        self._conn.executemany("DELETE FROM class_responses WHERE timetable_id = ?", [(row["id"],) for row in rows])
+        for image_hash in {row["image_hash"] for row in rows if row["image_hash"]}:
+            referenced = self._conn.execute(
+                "SELECT 1 FROM timetables WHERE image_hash = ? LIMIT 1", (image_hash,)
+            ).fetchone()
+            if referenced is None:
+                self.blobs.delete(image_hash)
+        logger.info(f"{len(rows)} alte Stundenplan-Versionen von Benutzer {username} gelöscht")
+
+    def _row_to_entry(self, row: sqlite3.Row) -> Dict:
+        """Wandelt eine Tabellenzeile in das Format von get_latest_timetable um."""
+        return {
+            "id": row["id"],
+            "data": json.dumps(_unpack(row["data"])),
+            "image_hash": row["image_hash"],
+            "timestamp": row["timestamp"],
+            "available_plans": _unpack(row["available_plans"]) or [],
+            "available_classes": _unpack(row["available_classes"]) or [],
+            "plan": row["plan_key"],
+            "checked_at": row["checked_at"] or row["timestamp"],
+        }
+
+    def latest(self, username: str) -> Optional[Dict]:
+        """Gibt die neueste Version eines Benutzers zurück."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM timetables WHERE username = ? ORDER BY timestamp DESC, id DESC LIMIT 1",
+                (username,),
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def latest_response(self, username: str) -> Optional[Dict]:
+        """Gibt nur die vorab serialisierte Antwort der neuesten Version zurück (ohne Dekompression)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, response, etag FROM timetables WHERE username = ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT 1",
+                (username,),
+            ).fetchone()
+        if row is None or row["response"] is None:
+            return None
+        return {"id": row["id"], "body": bytes(row["response"]), "etag": row["etag"]}
+
+    def class_response(self, version_id: int, class_name: str) -> Optional[Dict]:
+        """Gibt die vorab serialisierte Antwort einer Klasse für eine Version zurück."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, etag FROM class_responses WHERE timetable_id = ? AND class_name = ?",
+                (version_id, class_name),
+            ).fetchone()
+        return {"body": bytes(row["response"]), "etag": row["etag"]} if row else None
+
+    def class_responses(self, version_id: int) -> Dict[str, Dict]:
+        """Gibt die vorab serialisierten Antworten aller Klassen einer Version zurück."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT class_name, response, etag FROM class_responses WHERE timetable_id = ?",
+                (version_id,),
+            ).fetchall()
+        return {row["class_name"]: {"body": bytes(row["response"]), "etag": row["etag"]} for row in rows}
+
+    def version(self, username: str, version_id: int) -> Optional[Dict]:
+        """Gibt eine bestimmte Version eines Benutzers zurück (None, falls sie nicht existiert)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM timetables WHERE username = ? AND id = ?",
+                (username, version_id),
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def history(self, username: str, limit: int = 10) -> List[Dict]:
+        """Gibt die letzten Versionen eines Benutzers zurück, neueste zuerst."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM timetables WHERE username = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (username, limit),
+            ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def plan_history(self, username: str, plan_key: Optional[str], limit: int = 10) -> List[Dict]:
+        """Gibt die letzten Versionen eines Plans eines Benutzers zurück, neueste zuerst."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM timetables WHERE username = ? AND plan_key IS ? "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (username, plan_key, limit),
+            ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
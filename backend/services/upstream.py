@@ -0,0 +1,332 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+import httpx
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+# Lade Umgebungsvariablen
+load_dotenv()
+
+# Standardwerte je Upstream-Host
+DEFAULT_RATE = 5.0               # Anfragen pro Sekunde im Mittel
+DEFAULT_BURST = 10               # kurzfristig zusätzlich erlaubte Anfragen
+DEFAULT_CONCURRENCY = 8          # gleichzeitige Aufrufe
+DEFAULT_TIMEOUT = 10.0           # Zeitlimit je Versuch in Sekunden
+DEFAULT_RETRIES = 2              # Wiederholungen idempotenter Aufrufe
+DEFAULT_BACKOFF = 0.2            # Basis der exponentiellen Wartezeit in Sekunden
+DEFAULT_BACKOFF_MAX = 2.0        # maximale Wartezeit zwischen zwei Versuchen
+DEFAULT_FAILURE_THRESHOLD = 5    # Fehler in Folge, nach denen der Schutzschalter öffnet
+DEFAULT_RESET_TIMEOUT = 30.0     # Sekunden, bis ein geöffneter Schutzschalter einen Probeaufruf zulässt
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Wird ausgelöst, wenn ein Upstream-Host nicht erreichbar ist: Schutzschalter
+    offen, Ratenlimit ausgeschöpft oder alle Versuche vorübergehend fehlgeschlagen.
+    """
+
+    def __init__(self, host: str, reason: str, retry_after: int):
+        super().__init__(f"{host} nicht verfügbar ({reason}), erneut versuchen in {retry_after}s")
+        self.host = host
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Gibt zurück, ob ein Fehler auf ein vorübergehendes Problem des Upstreams hindeutet
+    (Zeitüberschreitung, Verbindungsfehler) und eine Wiederholung sinnvoll ist.
+
+    Fehlerhafte JSON-Antworten von DSBmobile bedeuten in der Regel ein abgelaufenes
+    Token, falsche Zugangsdaten eine Ablehnung; beides wird nicht wiederholt.
+    """
+    if isinstance(error, requests.exceptions.InvalidJSONError):
+        return False
+    return isinstance(error, (asyncio.TimeoutError, requests.RequestException, httpx.TransportError))
+
+
+class TokenBucket:
+    """Ratenlimit: rate Token pro Sekunde, höchstens burst Token angespart."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        Reserviert ein Token.
+
+        Returns:
+            Die Wartezeit in Sekunden, bis das Token verfügbar ist, oder None,
+            wenn sie max_wait überschreiten würde (dann wird nichts reserviert)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """
+    Schutzschalter: öffnet nach failure_threshold vorübergehenden Fehlern in Folge
+    und lässt dann alle Aufrufe sofort scheitern. Nach reset_timeout wird ein
+    einzelner Probeaufruf zugelassen (halb offen); gelingt er, schließt der Schalter.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Gibt zurück, ob ein Aufruf durchgelassen wird."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self) -> int:
+        """Sekunden, bis wieder ein Probeaufruf möglich ist."""
+        return max(1, int(round(self.reset_timeout - (time.monotonic() - self.opened_at))))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Schutzschalter geschlossen, Upstream wieder erreichbar")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                    logger.warning(f"Schutzschalter geöffnet nach {self.failures} Fehlern in Folge")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class UpstreamGateway:
+    """
+    Zugang zu einem Upstream-Host (DSBmobile-API bzw. Bild-Host) mit Ratenlimit,
+    begrenzter Parallelität, Zeitlimit je Versuch, Wiederholungen mit zufällig
+    gestreuter Wartezeit und Schutzschalter.
+
+    Blockierende Aufrufe (pydsb) laufen in einem eigenen, begrenzten ThreadPool,
+    damit hängende Upstream-Aufrufe nicht den Standard-Executor der Anwendung füllen.
+    Ein Thread, dessen Aufruf das Zeitlimit überschritten hat, gilt bis zu seinem
+    tatsächlichen Ende als belegt.
+    """
+
+    def __init__(self, host: str, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 max_concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.host = host
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"upstream-{host}")
+        # Threads, deren Aufruf nach Ablauf des Zeitlimits noch läuft
+        self._abandoned = 0
+        self._abandoned_lock = threading.Lock()
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        self._stats = {"calls": 0, "retries": 0, "timeouts": 0, "failures": 0, "rejected": 0, "rate_limited": 0}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Semaphore der laufenden Event-Loop (asyncio-Primitive sind an eine Loop gebunden)."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Wartezeit vor dem nächsten Versuch (exponentiell, vollständig zufällig gestreut)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+    async def call(self, func: Callable[[], Awaitable[Any]], idempotent: bool = True,
+                   is_failure: Optional[Callable[[Any], bool]] = None, retry_timeouts: bool = True) -> Any:
+        """
+        Führt einen Upstream-Aufruf unter den Regeln des Hosts aus.
+
+        Args:
+            func: Erzeugt die Coroutine des Aufrufs (wird je Versuch neu aufgerufen)
+            idempotent: Nur idempotente Aufrufe (GET) werden wiederholt
+            is_failure: Erkennt fehlgeschlagene Ergebnisse (z.B. HTTP 503), die wie Fehler
+                        gezählt und wiederholt werden; nach dem letzten Versuch wird das
+                        Ergebnis trotzdem zurückgegeben
+            retry_timeouts: Ob Zeitüberschreitungen wiederholt werden (nicht bei Aufrufen,
+                            die nach dem Zeitlimit weiterlaufen und ihren Thread belegen)
+
+        Returns:
+            Das Ergebnis des Aufrufs
+
+        Raises:
+            UpstreamUnavailable: Schutzschalter offen, Ratenlimit erschöpft oder alle Versuche vorübergehend fehlgeschlagen
+        """
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self._stats["rejected"] += 1
+                raise UpstreamUnavailable(self.host, "Schutzschalter offen", self.breaker.retry_after())
+            wait = self.bucket.reserve(max_wait=self.timeout)
+            if wait is None:
+                self._stats["rate_limited"] += 1
+                raise UpstreamUnavailable(self.host, "Ratenlimit erreicht", max(1, int(self.timeout)))
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            self._stats["calls"] += 1
+            if attempt > 0:
+                self._stats["retries"] += 1
+            try:
+                async with self._semaphore():
+                    result = await asyncio.wait_for(func(), self.timeout)
+            except Exception as e:
+                if not is_transient(e):
+                    # Der Upstream hat geantwortet (z.B. Zugangsdaten abgelehnt), er ist also erreichbar
+                    self.breaker.record_success()
+                    raise
+                if isinstance(e, asyncio.TimeoutError):
+                    self._stats["timeouts"] += 1
+                error, result = e, None
+            else:
+                if is_failure is None or not is_failure(result):
+                    self.breaker.record_success()
+                    return result
+                error = None
+
+            self._stats["failures"] += 1
+            self.breaker.record_failure()
+            if isinstance(error, asyncio.TimeoutError) and not retry_timeouts:
+                break
+            if attempt + 1 < attempts:
+                delay = self._backoff_delay(attempt)
+                logger.warning(f"Aufruf an {self.host} fehlgeschlagen (Versuch {attempt + 1}/{attempts}), "
+                               f"wiederhole in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        if error is None:
+            return result
+        raise UpstreamUnavailable(self.host, f"{type(error).__name__}", self.breaker.retry_after()) from error
+
+    async def run_sync(self, func: Callable, *args: Any, idempotent: bool = True) -> Any:
+        """
+        Führt einen blockierenden Aufruf (pydsb) im ThreadPool des Hosts unter den Regeln von call aus.
+
+        Ein Thread lässt sich nach dem Zeitlimit nicht abbrechen. Zeitüberschreitungen
+        werden daher nicht wiederholt, und sind alle Threads durch solche Aufrufe
+        belegt, wird sofort abgelehnt, statt weitere Aufrufe dahinter einzureihen.
+        """
+        with self._abandoned_lock:
+            exhausted = self._abandoned >= self.max_concurrency
+        if exhausted:
+            self._stats["rejected"] += 1
+            raise UpstreamUnavailable(self.host, "alle Threads durch hängende Aufrufe belegt", max(1, int(self.timeout)))
+
+        async def attempt() -> Any:
+            future = self._executor.submit(func, *args)
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # Zeitlimit (wait_for) oder Abbruch des Aufrufers: der Thread läuft weiter
+                if not future.cancel():
+                    self._abandon(future)
+                raise
+
+        return await self.call(attempt, idempotent=idempotent, retry_timeouts=False)
+
+    def _abandon(self, future) -> None:
+        """Zählt einen weiterlaufenden Thread als belegt, bis sein Aufruf tatsächlich endet."""
+        with self._abandoned_lock:
+            self._abandoned += 1
+        future.add_done_callback(lambda _: self._release_abandoned())
+
+    def _release_abandoned(self) -> None:
+        with self._abandoned_lock:
+            self._abandoned -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Gibt Zustand des Schutzschalters und die Zähler des Hosts zurück."""
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened,
+            "abandoned_threads": self._abandoned,
+            **self._stats,
+        }
+
+
+# Gateways je Host (werden beim ersten Aufruf angelegt)
+_gateways: Dict[str, UpstreamGateway] = {}
+_gateways_lock = threading.Lock()
+
+def get_gateway(host: str) -> UpstreamGateway:
+    """
+    Gibt das Gateway eines Upstream-Hosts zurück.
+    Gesteuert über UPSTREAM_RATE, UPSTREAM_BURST, UPSTREAM_CONCURRENCY, UPSTREAM_TIMEOUT,
+    UPSTREAM_RETRIES, UPSTREAM_BACKOFF, UPSTREAM_BACKOFF_MAX, UPSTREAM_FAILURE_THRESHOLD
+    und UPSTREAM_RESET_TIMEOUT (für alle Hosts gleich).
+    """
+    with _gateways_lock:
+        gateway = _gateways.get(host)
+        if gateway is None:
+            gateway = _gateways[host] = UpstreamGateway(
+                host,
+                rate=float(os.getenv("UPSTREAM_RATE", DEFAULT_RATE)),
+                burst=int(os.getenv("UPSTREAM_BURST", DEFAULT_BURST)),
+                max_concurrency=int(os.getenv("UPSTREAM_CONCURRENCY", DEFAULT_CONCURRENCY)),
+                timeout=float(os.getenv("UPSTREAM_TIMEOUT", DEFAULT_TIMEOUT)),
+                retries=int(os.getenv("UPSTREAM_RETRIES", DEFAULT_RETRIES)),
+                backoff=float(os.getenv("UPSTREAM_BACKOFF", DEFAULT_BACKOFF)),
+                backoff_max=float(os.getenv("UPSTREAM_BACKOFF_MAX", DEFAULT_BACKOFF_MAX)),
+                failure_threshold=int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+                reset_timeout=float(os.getenv("UPSTREAM_RESET_TIMEOUT", DEFAULT_RESET_TIMEOUT)),
+            )
+        return gateway
+
+def get_gateway_stats() -> Dict[str, Dict]:
+    """Gibt die Kennzahlen aller bisher verwendeten Upstream-Hosts zurück."""
+    with _gateways_lock:
+        gateways = dict(_gateways)
+    return {host: gateway.stats() for host, gateway in gateways.items()}
@@ -3,13 +3,17 @@ CREATE TABLE IF NOT EXISTS timetables (
     id SERIAL PRIMARY KEY,
     username TEXT NOT NULL,
     data TEXT NOT NULL, -- JSON-Daten als Text gespeichert
-    image TEXT NOT NULL, -- Base64-kodiertes Bild
+    image_hash TEXT, -- SHA-256 des Bildes, das Bild selbst liegt einmalig im Blob-Speicher
     timestamp TIMESTAMP WITH TIME ZONE DEFAULT now(),
     
     -- Index für schnelle Abfragen nach Benutzernamen
     CONSTRAINT idx_timetables_username UNIQUE (username, timestamp)
 );
 
+-- Index für die neueste Version und die Historie je Benutzer
+CREATE INDEX IF NOT EXISTS idx_timetables_username_timestamp
+    ON timetables (username, timestamp DESC);
+
 -- RLS (Row Level Security) für die Tabelle aktivieren
 ALTER TABLE timetables ENABLE ROW LEVEL SECURITY;
 
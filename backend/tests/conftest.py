@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import db
+
+@pytest.fixture(autouse=True)
+def isolated_storage(monkeypatch, tmp_path):
+    """Leitet den SQLite-Speicher jedes Tests in ein temporäres Verzeichnis statt nach backend/data um."""
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "timetables.db"))
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(db, "_sqlite_store", None)
+    yield
+    if db._sqlite_store is not None:
+        db._sqlite_store.close()
+        db._sqlite_store = None
@@ -17,8 +17,20 @@ def test_root_endpoint():
     assert response.status_code == 200
     assert response.json() == {"status": "online", "message": "DSB But Better API is running"}
 
-def test_invalid_credentials():
-    """Test mit ungültigen Anmeldeinformationen."""
+def test_ready_endpoint_before_warmup():
+    """Test, ob der Readiness-Check vor dem Aufwärmen der OCR-Modelle 503 liefert."""
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "warming_up"
+
+def test_invalid_credentials(monkeypatch):
+    """Test mit ungültigen Anmeldeinformationen (DSBmobile lehnt sie so ab wie pydsb es meldet)."""
+    import pydsb
+
+    def reject(username, password):
+        raise Exception("Invalid Credentials")
+
+    monkeypatch.setattr(pydsb, "PyDSB", reject)
     response = client.post(
         "/api/dsb/parse-plan",
         json={"username": "invalid_user", "password": "invalid_password"}
@@ -38,3 +50,99 @@ def test_valid_credentials():
     assert "last_updated" in data
     assert "status" in data
     assert data["status"] == "success"
+
+def test_latest_serves_prerendered_response_with_etag(monkeypatch):
+    """Test, ob /latest die gespeicherte Antwort mit ETag liefert und bei If-None-Match 304 antwortet."""
+    import asyncio
+    from services import db
+
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.setattr(db, "TIMETABLE_CACHE", {})
+    asyncio.run(db.store_timetable("392662", {"entries": [], "class_names": ["MTL 01"]}, b"bild", "2025-04-14 07:30:00"))
+
+    response = client.get("/api/dsb/latest", params={"username": "392662"})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.json() == {
+        "timetable": {"entries": [], "class_names": ["MTL 01"]},
+        "available_plans": [],
+        "available_classes": [],
+        "last_updated": "2025-04-14 07:30:00",
+        "status": "success",
+        "from_cache": True
+    }
+
+    not_modified = client.get("/api/dsb/latest", params={"username": "392662"}, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    missing = client.get("/api/dsb/latest", params={"username": "unbekannt"})
+    assert missing.status_code == 404
+
+def test_parse_plan_stream_sends_events_in_stages(monkeypatch):
+    """Test, ob der Stream Planliste, gespeicherten und frischen Stundenplan nacheinander sendet."""
+    from app.api import dsb as dsb_api
+
+    plans = [{"url": "https://example.invalid/plan.jpg", "title": "14.04.-18.04.25_MTA MTL 01"}]
+    stored = []
+
+    async def fake_authenticate(username, password):
+        return object()
+
+    async def fake_plans(auth_result):
+        return plans
+
+    async def fake_latest(username):
+        return {"data": json.dumps({"entries": ["alt"]}), "timestamp": "2025-04-13 07:30:00"}
+
+    async def fake_timetable(auth_result):
+        return b"bild"
+
+    async def fake_ocr(image_data):
+        return {"entries": ["neu"]}
+
+    async def fake_store(*args, **kwargs):
+        stored.append(args[0])
+        return True
+
+    monkeypatch.setattr(dsb_api, "authenticate_user", fake_authenticate)
+    monkeypatch.setattr(dsb_api, "find_timetable_plans", fake_plans)
+    monkeypatch.setattr(dsb_api, "get_latest_timetable", fake_latest)
+    monkeypatch.setattr(dsb_api, "get_timetable", fake_timetable)
+    monkeypatch.setattr(dsb_api, "process_ocr", fake_ocr)
+    monkeypatch.setattr(dsb_api, "store_timetable", fake_store)
+
+    response = client.post("/api/dsb/parse-plan/stream", json={"username": "392662", "password": "geheim"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for chunk in response.text.strip().split("\n\n"):
+        event_line, data_line = chunk.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+
+    assert [name for name, _ in events] == ["plans", "cached", "timetable", "done"]
+    assert events[0][1]["available_classes"] == ["MTL 01"]
+    assert events[1][1]["timetable"] == {"entries": ["alt"]}
+    assert events[2][1]["timetable"] == {"entries": ["neu"]} and events[2][1]["from_cache"] is False
+    assert stored == ["392662"]
+
+def test_unregister_prefetch_requires_password(monkeypatch):
+    """Test, ob ein Konto nur mit seinem Passwort abgemeldet werden kann und unbekannte Konten gleich beantwortet werden."""
+    from app.api import dsb
+    from services.prefetch import PrefetchScheduler
+
+    scheduler = PrefetchScheduler(interval=60, jitter=5)
+    scheduler.register("392662", "geheim")
+    monkeypatch.setattr(dsb, "get_prefetch_scheduler", lambda: scheduler)
+
+    without_password = client.delete("/api/dsb/prefetch/392662")
+    wrong_password = client.delete("/api/dsb/prefetch/392662", headers={"X-DSB-Password": "falsch"})
+    unknown = client.delete("/api/dsb/prefetch/unbekannt", headers={"X-DSB-Password": "geheim"})
+    assert without_password.status_code == wrong_password.status_code == unknown.status_code == 401
+    assert wrong_password.json() == unknown.json()
+    assert "392662" in scheduler.accounts
+
+    response = client.delete("/api/dsb/prefetch/392662", headers={"X-DSB-Password": "geheim"})
+    assert response.status_code == 200
+    assert "392662" not in scheduler.accounts
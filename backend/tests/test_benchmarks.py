@@ -0,0 +1,80 @@
+import os
+import sys
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic_plans import render_plan, encode
+from benchmarks import load
+from benchmarks.fakes import FakeReader, fake_dsb_backend
+from benchmarks.load import LoadRecorder
+from benchmarks.run import summarize, compare
+from services import ocr_service
+from services.image_ingest import decode_gray
+from services.table_segmentation import detect_grid
+from services.session_pool import get_session_pool
+from services.dsb_service import authenticate_user, get_timetable
+
+def test_synthetic_plans_have_detectable_grid():
+    """Test, ob die synthetischen Pläne das MTL-Raster enthalten (Kopfzeile/-spalte + 5x5 Zellen)."""
+    grid = detect_grid(decode_gray(encode(render_plan(1240, 877), "png")))
+    assert grid is not None
+    assert (len(grid.rows), len(grid.cols)) == (7, 7)
+
+def test_fake_backend_serves_plans_without_network():
+    """Test, ob Anmeldung, Planliste und Download gegen den lokalen Ersatz funktionieren."""
+    get_session_pool().clear()
+    images = {"14.04.-18.04.25_MTA MTL 01": b"plan"}
+
+    async def run():
+        with fake_dsb_backend(images, "benchmark", "geheim") as host:
+            rejected = await authenticate_user("benchmark", "falsch")
+            client = await authenticate_user("benchmark", "geheim")
+            image_data = await get_timetable(client)
+            return rejected, client, image_data, host.requests
+
+    rejected, client, image_data, requests = asyncio.run(run())
+    get_session_pool().clear()
+    assert rejected is None
+    assert client.available_plans[0]["title"] == "14.04.-18.04.25_MTA MTL 01"
+    assert image_data
+    assert requests == 1
+
+def test_compare_reports_slower_p50():
+    """Test, ob der Vergleich mit einem früheren Lauf Verlangsamungen über der Toleranz meldet."""
+    baseline = {"results": {"decode": {"png": summarize([0.010, 0.010, 0.010])}}}
+    current = {"results": {"decode": {"png": summarize([0.013, 0.013, 0.013])}}}
+    assert compare(current, baseline, tolerance=0.5) == []
+    assert compare(current, baseline, tolerance=0.2) == ["decode/png: p50 10.0ms -> 13.0ms"]
+
+def test_load_recorder_counts_errors_per_endpoint():
+    """Test, ob der Lasttest 304 als Erfolg, 4xx/5xx und Ausnahmen als Fehler zählt."""
+    recorder = LoadRecorder()
+    for status in ["200", "304", "503", "ReadTimeout"]:
+        recorder.record("GET /api/dsb/latest", status, 0.01)
+
+    report = recorder.report(elapsed=2.0)
+    stats = report["endpoints"]["GET /api/dsb/latest"]
+    assert (stats["errors"], stats["error_rate"]) == (2, 0.5)
+    assert report["throughput_rps"] == 2.0
+    assert "p99_ms" in stats
+
+def test_load_scenarios_run_against_fake_backend(monkeypatch):
+    """Test, ob die Lastszenarien gegen den lokalen Ersatz laufen und die OCR-Warteschlange abtasten."""
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.setattr(ocr_service, "_reader", FakeReader())
+    args = load.parse_args(["--users", "3", "--duration", "0.3", "--ramp-up", "0", "--think-time", "0.05",
+                            "--ocr-workers", "1", "--ocr-queue-size", "1", "--fake-seconds-per-box", "0",
+                            "--upstream-latency", "0"])
+
+    rush = asyncio.run(load.run_scenario("morning-rush", args, "fake"))
+    polling = asyncio.run(load.run_scenario("latest-polling", args, "fake"))
+    get_session_pool().clear()
+
+    assert rush["endpoints"][load.PARSE_PLAN]["status"].get("200", 0) > 0
+    # Gleichzeitige Erstanmeldungen werden nicht zusammengelegt; je nach Reihenfolge lädt mehr als ein Nutzer
+    assert rush["ocr_queue"]["pool"] and 1 <= rush["ocr_queue"]["completed"] <= args.users, rush["ocr_queue"]
+    assert 1 <= rush["upstream"]["image_requests"] <= args.users, rush["upstream"]
+    assert polling["endpoints"][load.LATEST]["status"].get("304", 0) > 0
+    assert polling["error_rate"] == 0.0
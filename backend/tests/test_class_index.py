@@ -0,0 +1,72 @@
+import os
+import sys
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import db
+from services.class_index import build_class_index, normalize_class, select_class
+
+TIMETABLE = {
+    "class_names": ["MTL 01", "MTL02"],
+    "entries": [
+        {"day": "Montag", "period": "I", "subject": "LF 04.6", "room": "423", "text": "LF 04.6 Raum 423"},
+        {"day": "Montag", "period": "II", "subject": "LF 02.2", "room": "Labor", "text": "MTL 02 LF 02.2 Labor"},
+        {"day": "Dienstag", "period": "I", "subject": "LF 01.1", "room": "207", "text": "LF 01.1", "class": "mtl1"},
+    ],
+}
+
+def test_index_assigns_entries_to_classes():
+    """Test, ob Einträge ihrer Klasse (Feld, Text oder alle Klassen des Plans) zugeordnet werden."""
+    assert normalize_class("MTL02") == "MTL 02"
+    assert build_class_index(TIMETABLE) == {"MTL 01": [0, 2], "MTL 02": [0, 1]}
+
+def test_select_class_uses_index():
+    """Test, ob nur die Einträge der gewünschten Klasse zurückgegeben werden."""
+    timetable = dict(TIMETABLE, class_index={"MTL 01": [2]})
+    selected = select_class(timetable, "MTL 01")
+    assert [entry["subject"] for entry in selected["entries"]] == ["LF 01.1"]
+    assert selected["selected_class"] == "MTL 01" and "class_index" not in selected
+    assert select_class(timetable, None) is timetable
+
+def test_latest_filters_by_class(monkeypatch):
+    """Test, ob /latest?class= nur die Einträge der Klasse liefert."""
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.setattr(db, "TIMETABLE_CACHE", {})
+    timetable = dict(TIMETABLE, class_index=build_class_index(TIMETABLE))
+    asyncio.run(db.store_timetable("392662", timetable, None, "2025-04-14 07:30:00"))
+
+    response = TestClient(app).get("/api/dsb/latest", params={"username": "392662", "class": "MTL 02"})
+    assert response.status_code == 200
+    entries = response.json()["timetable"]["entries"]
+    assert [entry["subject"] for entry in entries] == ["LF 04.6", "LF 02.2"]
+
+def test_latest_class_is_prerendered_with_own_etag(monkeypatch):
+    """Test, ob /latest?class= die beim Speichern erstellte Antwort mit eigenem ETag und 304 liefert."""
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    timetable = dict(TIMETABLE, class_index=build_class_index(TIMETABLE))
+    plans = [{"title": "14.04.-18.04.25_MTA MTL 01", "url": "https://example.invalid/plan.jpg"}]
+    asyncio.run(db.store_timetable("392662", timetable, None, "2025-04-14 07:30:00", plans, ["MTL 01", "MTL 02"]))
+
+    # Der gespeicherte Plan wird für die Klassen-Antwort nicht mehr gelesen und gefiltert
+    def fail(entry, class_name):
+        raise AssertionError("Klassen-Antwort nachträglich erstellt")
+    monkeypatch.setattr(db, "_render_class_response", fail)
+    client = TestClient(app)
+    first = client.get("/api/dsb/latest", params={"username": "392662", "class": "mtl1"})
+    second = client.get("/api/dsb/latest", params={"username": "392662", "class": "MTL 02"})
+    full = client.get("/api/dsb/latest", params={"username": "392662"})
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["available_plans"] == plans
+    assert [entry["subject"] for entry in first.json()["timetable"]["entries"]] == ["LF 04.6", "LF 01.1"]
+    assert len({first.headers["etag"], second.headers["etag"], full.headers["etag"]}) == 3
+
+    not_modified = client.get("/api/dsb/latest", params={"username": "392662", "class": "MTL 01"},
+                              headers={"If-None-Match": first.headers["etag"]})
+    assert not_modified.status_code == 304
+    asyncio.run(db.close_db())
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import db
+
+def test_sqlite_store_keeps_history_and_dedupes_images(monkeypatch, tmp_path):
+    """Test, ob Versionen erhalten bleiben und identische Bilder nur einmal gespeichert werden."""
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "timetables.db"))
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(db, "_sqlite_store", None)
+
+    async def run():
+        await db.init_db()
+        await db.store_timetable("392662", {"entries": [1]}, b"bild", "2025-04-14 07:30:00", [{"title": "A"}], ["MTL 01"])
+        await db.store_timetable("392662", {"entries": [2]}, b"bild", "2025-04-15 07:30:00")
+        latest = await db.get_latest_timetable("392662")
+        history = await db.get_timetable_history("392662")
+        image = await db.get_plan_image(latest["image_hash"])
+        missing = await db.get_latest_timetable("unbekannt")
+        await db.close_db()
+        return latest, history, image, missing
+
+    latest, history, image, missing = asyncio.run(run())
+    assert json.loads(latest["data"]) == {"entries": [2]}
+    assert [entry["timestamp"] for entry in history] == ["2025-04-15 07:30:00", "2025-04-14 07:30:00"]
+    assert history[1]["available_classes"] == ["MTL 01"]
+    assert image == b"bild"
+    assert missing is None
+    assert len(list((tmp_path / "blobs").rglob("*"))) == 2  # ein Präfix-Ordner + ein Bild
+
+    # Die Daten überstehen einen Neustart
+    monkeypatch.setattr(db, "_sqlite_store", None)
+    reopened = asyncio.run(db.get_latest_timetable("392662"))
+    assert reopened["timestamp"] == "2025-04-15 07:30:00"
+
+def test_store_prerenders_latest_response(monkeypatch, tmp_path):
+    """Test, ob beim Speichern Antwort-Bytes und ETag erzeugt werden und sich der ETag mit den Daten ändert."""
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "timetables.db"))
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(db, "_sqlite_store", None)
+
+    async def run():
+        await db.store_timetable("392662", {"entries": [1]}, None, "2025-04-14 07:30:00")
+        first = await db.get_latest_response("392662")
+        await db.store_timetable("392662", {"entries": [2]}, None, "2025-04-15 07:30:00")
+        second = await db.get_latest_response("392662")
+        await db.close_db()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert json.loads(first["body"])["timetable"] == {"entries": [1]}
+    assert first["etag"].startswith('"') and first["etag"] != second["etag"]
+    assert json.loads(second["body"])["last_updated"] == "2025-04-15 07:30:00"
+
+def test_unchanged_fetch_adds_no_version_and_history_is_capped(monkeypatch, tmp_path):
+    """Test, ob identische Abrufe keine neue Version anlegen und alte Versionen samt Bildern gelöscht werden."""
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_MAX_VERSIONS", "2")
+
+    async def run():
+        await db.store_timetable("392662", {"entries": [1]}, b"bild-1", "2025-04-14 07:30:00")
+        first = await db.get_latest_timetable("392662")
+        await db.store_timetable("392662", {"entries": [1]}, b"bild-1", "2025-04-14 07:40:00")
+        unchanged = await db.get_latest_timetable("392662")
+        await db.store_timetable("392662", {"entries": [2]}, b"bild-2", "2025-04-15 07:30:00")
+        await db.store_timetable("392662", {"entries": [3]}, b"bild-3", "2025-04-16 07:30:00")
+        history = await db.get_timetable_history("392662")
+        first_image = await db.get_plan_image(first["image_hash"])
+        return first, unchanged, history, first_image
+
+    first, unchanged, history, first_image = asyncio.run(run())
+    assert unchanged["id"] == first["id"]
+    assert unchanged["timestamp"] == "2025-04-14 07:30:00"
+    assert unchanged["checked_at"] == "2025-04-14 07:40:00"
+    assert [entry["timestamp"] for entry in history] == ["2025-04-16 07:30:00", "2025-04-15 07:30:00"]
+    assert first_image is None
@@ -0,0 +1,78 @@
+import os
+import sys
+import asyncio
+import httpx
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import http_client
+from services.http_client import ValidatorStore, conditional_get
+
+PLAN_URL = "https://light.dsbcontrol.de/DSBlightWebsite/Data/plan.jpg"
+
+def test_unchanged_plan_costs_one_304(monkeypatch, tmp_path):
+    """Test, ob ein unveränderter Plan per If-None-Match bestätigt und aus dem Speicher geliefert wird."""
+    seen_headers = []
+
+    def handler(request):
+        seen_headers.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=b"plan-bild", headers={"ETag": '"v1"'})
+
+    monkeypatch.setattr(http_client, "_validators", ValidatorStore(cache_dir=str(tmp_path)))
+    monkeypatch.setattr(http_client, "_stats", {"requests": 0, "not_modified": 0, "full_downloads": 0, "bytes_saved": 0})
+
+    async def run():
+        monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        first = await conditional_get(PLAN_URL)
+        second = await conditional_get(PLAN_URL)
+        await http_client.close_http_client()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == (200, b"plan-bild")
+    assert second == (200, b"plan-bild")
+    assert seen_headers == [None, '"v1"']
+    assert http_client.get_http_stats()["not_modified"] == 1
+
+    # Der Festplatten-Speicher übersteht einen Neustart
+    assert ValidatorStore(cache_dir=str(tmp_path)).get(PLAN_URL)["content"] == b"plan-bild"
+
+def test_validator_store_is_bounded_by_content_bytes():
+    """Test, ob der Speicher-Tier nach der Gesamtgröße der Inhalte verdrängt und zu große Inhalte auslässt."""
+    store = ValidatorStore(max_bytes=100)
+    store.put("https://plans/a.jpg", '"a"', None, b"a" * 60)
+    store.put("https://plans/b.jpg", '"b"', None, b"b" * 30)
+    store.put("https://plans/c.jpg", '"c"', None, b"c" * 30)
+
+    assert store.get("https://plans/a.jpg") is None
+    assert store.get("https://plans/c.jpg")["content"] == b"c" * 30
+    assert store.current_bytes == 60
+
+    store.put("https://plans/riesig.jpg", '"r"', None, b"r" * 500)
+    assert store.get("https://plans/riesig.jpg") is None
+    assert store.current_bytes == 60
+
+def test_concurrent_writers_do_not_share_temporary_files(tmp_path):
+    """Test, ob gleichzeitige Schreiber derselben URL vollständige Dateien und keine Reste hinterlassen."""
+    import threading
+
+    url = PLAN_URL
+    stores = [ValidatorStore(cache_dir=str(tmp_path)) for _ in range(2)]
+    contents = [bytes([index]) * 200_000 for index in range(4)]
+
+    def write(index):
+        for _ in range(20):
+            stores[index % 2].put(url, f'"{index}"', None, contents[index])
+
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    entry = ValidatorStore(cache_dir=str(tmp_path)).get(url)
+    assert entry["content"] in contents
+    assert not list(tmp_path.rglob("*.tmp"))
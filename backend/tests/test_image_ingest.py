@@ -0,0 +1,41 @@
+import os
+import sys
+import asyncio
+import pytest
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic_plans import render_plan, encode
+from services import dsb_service
+from services.image_ingest import InvalidImage, decode_gray, probe_image
+from services.table_segmentation import detect_grid
+
+def test_large_jpeg_is_decoded_reduced_in_grayscale():
+    """Test, ob große JPEGs direkt verkleinert in Graustufen dekodiert werden und das Raster erhalten bleibt."""
+    data = encode(render_plan(3508, 2480), "jpeg-q75")
+    assert probe_image(data) == ("JPEG", (3508, 2480))
+
+    gray = decode_gray(memoryview(data), max_side=2600)
+    assert gray.shape == (1240, 1754) and gray.dtype.name == "uint8"
+    assert detect_grid(gray) is not None
+    assert decode_gray(data, max_side=0).shape == (2480, 3508)
+
+def test_invalid_image_is_rejected():
+    """Test, ob ungültige Bilddaten als InvalidImage gemeldet werden."""
+    with pytest.raises(InvalidImage):
+        probe_image(b"<html>Fehler</html>")
+
+def test_get_timetable_returns_raw_bytes(monkeypatch):
+    """Test, ob get_timetable die Bilddaten unverändert (ohne Base64) zurückgibt."""
+    data = encode(render_plan(1240, 877), "png")
+
+    async def fake_find(dsb_client):
+        return [{"url": "https://example.org/plan.png", "title": "MTA MTL 01"}]
+
+    async def fake_download(plan_url):
+        return 200, data
+
+    monkeypatch.setattr(dsb_service, "find_timetable_plans", fake_find)
+    monkeypatch.setattr(dsb_service, "download_plan", fake_download)
+    assert asyncio.run(dsb_service.get_timetable(object())) is data
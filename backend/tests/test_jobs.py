@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import asyncio
+import pytest
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import HTTPException
+
+from services import shared_cache
+from services.jobs import JobQueue, JobQueueFull
+
+def test_jobs_report_status_result_and_errors():
+    """Test, ob Jobs abgearbeitet werden und Fehler samt Statuscode im Job landen."""
+    async def ok():
+        return {"timetable": {"entries": []}}
+
+    async def unauthorized():
+        raise HTTPException(status_code=401, detail="Authentifizierung fehlgeschlagen")
+
+    async def run():
+        queue = JobQueue(workers=1, max_queue=4)
+        done = await queue.submit("parse-plan", ok)
+        failed = await queue.submit("parse-plan", unauthorized)
+        assert done.status == "queued"
+        await asyncio.wait_for(queue._queue.join(), 1)
+        await queue.stop()
+        return queue, done, failed
+
+    queue, done, failed = asyncio.run(run())
+    assert done.to_dict()["status"] == "done"
+    assert done.result == {"timetable": {"entries": []}}
+    assert (failed.status, failed.status_code, failed.error) == ("failed", 401, "Authentifizierung fehlgeschlagen")
+    assert queue.stats()["completed"] == 1 and queue.stats()["failed"] == 1
+
+def test_queue_is_bounded_and_results_expire():
+    """Test, ob eine volle Warteschlange ablehnt und abgeschlossene Jobs nach der TTL verschwinden."""
+    release = None
+
+    async def blocked():
+        await release.wait()
+        return "fertig"
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        queue = JobQueue(workers=1, max_queue=1, result_ttl=0)
+        first = await queue.submit("parse-plan", blocked)
+        await asyncio.sleep(0)  # erster Job läuft, Warteschlange wieder leer
+        await queue.submit("parse-plan", blocked)
+        with pytest.raises(JobQueueFull) as full:
+            await queue.submit("parse-plan", blocked)
+        release.set()
+        await asyncio.wait_for(queue._queue.join(), 1)
+        await asyncio.sleep(0.01)
+        expired = queue.get(first.id)
+        await queue.stop()
+        return full.value, expired, queue
+
+    full, expired, queue = asyncio.run(run())
+    assert full.retry_after >= 1
+    assert expired is None
+    assert queue.stats()["rejected"] == 1 and queue.stats()["expired"] == 2
+
+def test_job_state_is_visible_to_other_workers(monkeypatch, tmp_path):
+    """Test, ob ein anderer Worker Status und Ergebnis eines Jobs über den gemeinsamen Cache sieht."""
+    monkeypatch.setenv("SHARED_CACHE_PATH", str(tmp_path / "shared.db"))
+    monkeypatch.setattr(shared_cache, "_shared_cache", None)
+
+    async def ok():
+        return {"timetable": {"entries": []}}
+
+    async def run():
+        accepting, other = JobQueue(workers=1), JobQueue(workers=1, result_ttl=0)
+        job = await accepting.submit("parse-plan", ok)
+        queued = await other.lookup(job.id)
+        await asyncio.wait_for(accepting._queue.join(), 1)
+        # Der Abschluss wird erst nach task_done im Executor geteilt
+        for _ in range(100):
+            done = await JobQueue(workers=1).lookup(job.id)
+            if done["status"] == "done":
+                break
+            await asyncio.sleep(0.01)
+        expired = await other.lookup(job.id)
+        missing = await other.lookup("unbekannt")
+        await accepting.stop()
+        return queued, done, expired, missing
+
+    queued, done, expired, missing = asyncio.run(run())
+    assert queued["status"] in ("queued", "running")
+    assert done["status"] == "done" and done["result"] == {"timetable": {"entries": []}}
+    assert expired is None and missing is None
+    shared_cache.close_shared_cache()
+
+def test_slow_queued_write_does_not_overwrite_later_states(monkeypatch, tmp_path):
+    """Test, ob ein verzögert geschriebener Stand "queued" den Abschluss des Jobs nicht überschreibt."""
+    monkeypatch.setenv("SHARED_CACHE_PATH", str(tmp_path / "shared.db"))
+    monkeypatch.setattr(shared_cache, "_shared_cache", None)
+    shared = shared_cache.get_shared_cache()
+    put = shared.put
+
+    def slow_put(key, value, payload):
+        if value["status"] == "queued":
+            time.sleep(0.05)
+        put(key, value, payload)
+
+    monkeypatch.setattr(shared, "put", slow_put)
+
+    async def ok():
+        return "fertig"
+
+    async def run():
+        accepting = JobQueue(workers=1)
+        job = await accepting.submit("parse-plan", ok)
+        await asyncio.wait_for(accepting._queue.join(), 1)
+        for _ in range(100):
+            state = await JobQueue(workers=1).lookup(job.id)
+            if state["status"] == "done":
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        state = await JobQueue(workers=1).lookup(job.id)
+        await accepting.stop()
+        return state
+
+    assert asyncio.run(run())["status"] == "done"
+    shared_cache.close_shared_cache()
@@ -0,0 +1,47 @@
+import os
+import sys
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services.metrics import Counter, Histogram, MetricsRegistry, STAGE_DURATION, stage_timer
+
+def test_registry_renders_prometheus_text_format():
+    """Test, ob Zähler und Histogramme im Prometheus-Textformat ausgegeben werden."""
+    registry = MetricsRegistry()
+    hits = registry.register(Counter("test_cache_total", "Cache-Abfragen", ["result"]))
+    latency = registry.register(Histogram("test_stage_seconds", "Dauer", ["stage"], buckets=(0.1, 1.0)))
+    hits.inc(result="hit")
+    hits.inc(result="hit")
+    latency.observe(0.5, stage="ocr")
+
+    text = registry.render()
+    assert "# TYPE test_cache_total counter" in text
+    assert 'test_cache_total{result="hit"} 2' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="0.1"} 0' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="1"} 1' in text
+    assert 'test_stage_seconds_bucket{stage="ocr",le="+Inf"} 1' in text
+    assert 'test_stage_seconds_count{stage="ocr"} 1' in text
+
+def test_metrics_endpoint_reports_stages_queues_and_requests():
+    """Test, ob /metrics Schrittdauern, Warteschlangen und Anfragen je Route enthält."""
+    before = STAGE_DURATION.count(stage="test")
+    with stage_timer("test"):
+        pass
+    assert STAGE_DURATION.count(stage="test") == before + 1
+
+    client = TestClient(app)
+    client.get("/api/dsb/jobs/unbekannt")
+    # Ein Parameterwert, der einem anderen Pfadabschnitt gleicht, ändert das Label nicht
+    client.delete("/api/dsb/prefetch/dsb")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'dsb_stage_duration_seconds_count{stage="test"}' in response.text
+    assert 'dsb_queue_depth{queue="ocr"} 0' in response.text
+    assert 'path="/api/dsb/jobs/{job_id}",status="404"' in response.text
+    assert 'path="/api/dsb/prefetch/{username}",status="401"' in response.text
+    assert 'dsb_http_requests_in_flight{method="GET"} 1' in response.text
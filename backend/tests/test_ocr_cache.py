@@ -0,0 +1,42 @@
+import os
+import sys
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.ocr_cache import OCRResultCache, image_hash
+
+def test_memory_tier_hit_and_miss():
+    """Test, ob ein gespeichertes Ergebnis wiedergefunden und gezählt wird."""
+    cache = OCRResultCache(max_bytes=1024 * 1024)
+    key = image_hash(b"plan-bild")
+
+    assert cache.get(key) is None
+    cache.put(key, {"entries": [{"day": "Montag"}]}, duration=2.5)
+
+    assert cache.get(key) == {"entries": [{"day": "Montag"}]}
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["saved_ocr_seconds"] == 2.5
+
+def test_size_based_eviction():
+    """Test, ob die ältesten Einträge bei Überschreitung der Bytegrenze verdrängt werden."""
+    cache = OCRResultCache(max_bytes=150)
+    cache.put("a", {"text": "x" * 40})
+    cache.put("b", {"text": "y" * 40})
+    cache.get("a")  # "a" wird dadurch zuletzt verwendet
+    cache.put("c", {"text": "z" * 40})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Test, ob der Festplatten-Tier Ergebnisse über eine neue Cache-Instanz hinweg liefert."""
+    key = image_hash(b"14.04.-18.04.25_MTA")
+    OCRResultCache(cache_dir=str(tmp_path)).put(key, {"class_names": ["MTL 01"]})
+
+    restarted = OCRResultCache(cache_dir=str(tmp_path))
+    assert restarted.get(key) == {"class_names": ["MTL 01"]}
+    assert restarted.stats()["disk_hits"] == 1
@@ -0,0 +1,92 @@
+import os
+import io
+import sys
+import time
+import asyncio
+import pytest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.ocr_pool import OCRPool, OCRQueueFull, run_pages_ocr_batched
+
+def test_full_queue_is_rejected_immediately():
+    """Test, ob ein voller Pool neue Aufträge sofort mit Retry-After-Hinweis ablehnt."""
+    pool = OCRPool(workers=2, queue_size=1, torch_threads=1)
+    pool._pending = pool.capacity  # alle Worker belegt, Warteschlange voll
+
+    with pytest.raises(OCRQueueFull) as excinfo:
+        asyncio.run(pool.submit(print, "nie ausgeführt"))
+
+    assert excinfo.value.retry_after >= 1
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["queue_depth"] == 1
+
+class _LocalPool(OCRPool):
+    """Pool mit einfachem Executor statt Worker-Prozessen mit EasyOCR."""
+    def __init__(self, make_executor, **kwargs):
+        super().__init__(torch_threads=1, **kwargs)
+        self.make_executor = make_executor
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self.make_executor()
+
+def test_cancelled_callers_keep_their_slot_until_the_job_ends():
+    """Test, ob ein abgebrochener Aufrufer seinen Platz erst freigibt, wenn der Worker fertig ist."""
+    pool = _LocalPool(lambda: ThreadPoolExecutor(max_workers=1), workers=1, queue_size=0)
+    pool.start()
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.submit(time.sleep, 0.3), 0.05)
+        assert pool._pending == 1
+        with pytest.raises(OCRQueueFull):
+            await pool.submit(time.sleep, 0)
+        await asyncio.sleep(0.4)
+        assert pool._pending == 0
+        return await pool.submit(abs, -3)
+
+    assert asyncio.run(run()) == 3
+    pool.shutdown()
+
+def test_broken_process_pool_is_rebuilt():
+    """Test, ob der Pool nach einem abgestürzten Worker-Prozess neu aufgebaut wird."""
+    pool = _LocalPool(lambda: ProcessPoolExecutor(max_workers=1), workers=1, queue_size=2)
+    pool.start()
+
+    async def run():
+        with pytest.raises(BrokenProcessPool):
+            await pool.submit(os._exit, 1)
+        return await pool.submit(abs, -3)
+
+    assert asyncio.run(run()) == 3
+    assert pool.stats()["restarts"] == 1 and pool._pending == 0
+    pool.shutdown()
+
+def _png(width, height):
+    """Erzeugt ein leeres PNG-Bild der angegebenen Größe."""
+    buffer = io.BytesIO()
+    Image.new('L', (width, height), color=255).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class FakeReader:
+    """Protokolliert die Batches statt echter Texterkennung."""
+    def __init__(self):
+        self.batches = []
+
+    def readtext_batched(self, arrays, batch_size=1):
+        self.batches.append([array.shape for array in arrays])
+        return [[([[0, 0], [1, 0], [1, 1], [0, 1]], f"{array.shape[1]}x{array.shape[0]}", 0.9)] for array in arrays]
+
+def test_batched_readtext_groups_by_image_size():
+    """Test, ob gleich große Pläne gemeinsam und die Ergebnisse in Eingabereihenfolge geliefert werden."""
+    reader = FakeReader()
+    results = run_pages_ocr_batched(reader, [_png(40, 30), _png(20, 10), _png(40, 30)])
+
+    assert sorted(len(batch) for batch in reader.batches) == [1, 2]
+    assert [page["results"][0][1] for page in results] == ["40x30", "20x10", "40x30"]
+    assert all(page["layout"] == "page" for page in results)
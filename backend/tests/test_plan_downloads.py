@@ -0,0 +1,74 @@
+import os
+import sys
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import dsb_service, ocr_service
+
+DELAYS = {"woche-1": 0.05, "woche-2": 0.01, "woche-3": 0.03, "woche-4": 5.0}
+
+class FakeClient:
+    pass
+
+def _patch_downloads(monkeypatch, events):
+    """Ersetzt Planliste und Downloads durch Pläne mit festen Latenzen."""
+    running = {"now": 0, "max": 0}
+
+    async def fake_find(dsb_client):
+        dsb_client.available_plans = [{"url": title, "title": title} for title in DELAYS]
+        return dsb_client.available_plans
+
+    async def fake_download(plan_url):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        try:
+            await asyncio.sleep(DELAYS[plan_url])
+        finally:
+            running["now"] -= 1
+        events.append(("download", plan_url))
+        return 200, plan_url.encode()
+
+    monkeypatch.setattr(dsb_service, "find_timetable_plans", fake_find)
+    monkeypatch.setattr(dsb_service, "download_plan", fake_download)
+    return running
+
+def test_downloads_are_bounded_and_time_out(monkeypatch):
+    """Test, ob höchstens concurrency Downloads gleichzeitig laufen und zu langsame Pläne fehlen."""
+    events = []
+    running = _patch_downloads(monkeypatch, events)
+
+    async def run():
+        return [entry["title"] async for entry, _ in dsb_service.iter_plan_images(FakeClient(), concurrency=2, timeout=0.5)]
+
+    arrived = asyncio.run(run())
+    assert arrived == ["woche-2", "woche-3", "woche-1"]
+    assert running["max"] == 2
+
+def test_get_all_plan_images_keeps_plan_order(monkeypatch):
+    """Test, ob die gleichzeitig geladenen Bilder in der Reihenfolge der Planliste zurückgegeben werden."""
+    _patch_downloads(monkeypatch, [])
+    monkeypatch.setenv("PLAN_DOWNLOAD_TIMEOUT", "0.5")
+    images = asyncio.run(dsb_service.get_all_plan_images(FakeClient()))
+    assert list(images) == ["woche-1", "woche-2", "woche-3"]
+
+def test_pipeline_starts_ocr_before_all_downloads_finish(monkeypatch):
+    """Test, ob die OCR eines Plans beginnt, während andere Pläne noch geladen werden."""
+    events = []
+    _patch_downloads(monkeypatch, events)
+
+    async def fake_ocr(image_data):
+        events.append(("ocr", image_data.decode()))
+        return {"entries": [], "source": image_data.decode()}
+
+    monkeypatch.setattr(ocr_service, "process_ocr", fake_ocr)
+
+    async def run():
+        images = ((entry["title"], data) async for entry, data in
+                  dsb_service.iter_plan_images(FakeClient(), concurrency=4, timeout=0.5))
+        return await ocr_service.process_ocr_pipelined(images)
+
+    results = asyncio.run(run())
+    assert results["woche-1"]["source"] == "woche-1" and "woche-4" not in results
+    assert events.index(("ocr", "woche-2")) < events.index(("download", "woche-1"))
@@ -0,0 +1,53 @@
+import os
+import sys
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import prefetch
+from services.prefetch import PrefetchAccount, PrefetchScheduler
+
+def test_refresh_only_processes_new_or_changed_plans(monkeypatch):
+    """Test, ob nur neue/geänderte Pläne erkannt und unveränderte Abrufe übersprungen werden."""
+    plans = {"14.04.-18.04.25_MTA": b"woche-1", "21.04.-25.04.25_MTA": b"woche-2"}
+    ocr_batches = []
+    stored = []
+
+    async def fake_authenticate(username, password):
+        return object()
+
+    async def fake_images(dsb_client):
+        return dict(plans)
+
+    async def fake_batch(images):
+        ocr_batches.append(sorted(images))
+        return {title: {"entries": [], "class_names": ["MTL 01"]} for title in images}
+
+    async def fake_store(username, data, image_data, timestamp, available_plans=None, available_classes=None, plan=None):
+        stored.append((username, image_data))
+        return True
+
+    monkeypatch.setattr(prefetch, "authenticate_user", fake_authenticate)
+    monkeypatch.setattr(prefetch, "get_all_plan_images", fake_images)
+    monkeypatch.setattr(prefetch, "process_ocr_batch", fake_batch)
+    monkeypatch.setattr(prefetch, "store_timetable", fake_store)
+
+    async def run():
+        scheduler = PrefetchScheduler(interval=60, jitter=5)
+        account = PrefetchAccount("392662", "geheim")
+        first = await scheduler.refresh(account)
+        unchanged = await scheduler.refresh(account)
+        plans["21.04.-25.04.25_MTA"] = b"woche-2-neu"
+        changed = await scheduler.refresh(account)
+        return scheduler, first, unchanged, changed
+
+    scheduler, first, unchanged, changed = asyncio.run(run())
+    assert (first, unchanged, changed) == (True, False, True)
+    # Beim zweiten Durchlauf nur der geänderte Plan plus der (gecachte) neueste Plan
+    assert ocr_batches == [
+        ["14.04.-18.04.25_MTA", "21.04.-25.04.25_MTA"],
+        ["14.04.-18.04.25_MTA", "21.04.-25.04.25_MTA"],
+    ]
+    assert stored == [("392662", b"woche-1"), ("392662", b"woche-1")]
+    assert scheduler.stats()["changes"] == 2
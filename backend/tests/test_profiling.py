@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import profiling
+from services.profiling import Profiler, profiled_call
+
+def test_profiler_is_off_by_default():
+    """Test, ob ohne Token und Stichprobenrate keine Anfrage profiliert wird."""
+    profiler = Profiler(directory="unbenutzt")
+    assert not profiler.enabled
+    assert profiler.trigger("irgendwas") is None
+
+def test_admin_header_captures_profile_with_stages(monkeypatch, tmp_path):
+    """Test, ob eine Anfrage mit Admin-Header samt Request-ID und Schrittdauern gespeichert wird."""
+    monkeypatch.setattr(profiling, "_profiler", Profiler(directory=str(tmp_path), admin_token="geheim"))
+    client = TestClient(app)
+
+    plain = client.get("/", headers={"X-Request-ID": "anfrage-1"})
+    assert plain.headers["x-request-id"] == "anfrage-1"
+    assert "x-profile-id" not in plain.headers
+    assert list(tmp_path.iterdir()) == []
+
+    response = client.get("/metrics", headers={"X-Profile": "geheim", "X-Request-ID": "anfrage-2"})
+    assert response.headers["x-profile-id"] == "anfrage-2"
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert len(files) == 2 and files[0].endswith("anfrage-2.json") and files[1].endswith("anfrage-2.prof")
+
+    meta = json.loads((tmp_path / files[0]).read_text(encoding="utf-8"))
+    assert meta["trigger"] == "header" and meta["path"] == "/metrics" and meta["status"] == 200
+
+def test_profiled_call_records_thread_profile():
+    """Test, ob Aufrufe im ThreadPool dem Profil der Anfrage hinzugefügt werden."""
+    profile = profiling.RequestProfile("anfrage-3", "POST", "/api/dsb/parse-plan", "sample")
+    token = profiling._current_profile.set(profile)
+    try:
+        profiling.record_stage("ocr", 0.5)
+        assert profiled_call(sum, [1, 2, 3])() == 6
+    finally:
+        profiling._current_profile.reset(token)
+    assert profile.stages == [{"stage": "ocr", "seconds": 0.5}]
+    assert profiled_call(sum, [1])() == 1  # ohne Profil unverändert
@@ -0,0 +1,58 @@
+import os
+import sys
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pydsb
+from services import dsb_service
+from services.session_pool import SessionPool
+
+class FakeDSB:
+    """Zählt Anmeldungen und Planabrufe statt DSBmobile anzusprechen."""
+    logins = 0
+
+    def __init__(self, username, password):
+        FakeDSB.logins += 1
+        self.plan_calls = 0
+
+    def get_plans(self):
+        self.plan_calls += 1
+        return [{"title": "14.04.-18.04.25_MTA", "url": "https://example.invalid/plan.jpg"}]
+
+def test_repeat_requests_reuse_session_and_listing(monkeypatch):
+    """Test, ob wiederholte Anfragen weder neu anmelden noch die Planliste neu abrufen."""
+    monkeypatch.setattr(pydsb, "PyDSB", FakeDSB)
+    monkeypatch.setattr(dsb_service, "get_session_pool", lambda pool=SessionPool(): pool)
+    FakeDSB.logins = 0
+
+    async def run():
+        first = await dsb_service.authenticate_user("392662", "geheim")
+        second = await dsb_service.authenticate_user("392662", "geheim")
+        plans = await dsb_service.list_plans(second)
+        return first, second, plans
+
+    first, second, plans = asyncio.run(run())
+    assert first is second
+    assert FakeDSB.logins == 1
+    assert first.plan_calls == 1
+    assert plans[0]["title"] == "14.04.-18.04.25_MTA"
+
+def test_invalidate_forces_new_login():
+    """Test, ob eine verworfene Sitzung nicht wieder ausgeliefert wird."""
+    pool = SessionPool()
+    session = pool.put("392662", "geheim", object(), plans=[])
+    assert pool.get("392662", "geheim") is session
+    assert pool.get("392662", "falsch") is None
+
+    pool.invalidate(session.key)
+    assert pool.get("392662", "geheim") is None
+    assert pool.stats()["invalidations"] == 1
+
+def test_plans_expire_before_session():
+    """Test, ob die Planliste nach ihrer eigenen TTL verfällt."""
+    pool = SessionPool(session_ttl=60, plans_ttl=0)
+    session = pool.put("392662", "geheim", object(), plans=[{"title": "x"}])
+    assert pool.get("392662", "geheim") is session
+    assert pool.get_plans(session) is None
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import asyncio
+import subprocess
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import db, shared_cache
+from services.shared_cache import SharedCache
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def test_write_in_one_worker_invalidates_the_others(tmp_path):
+    """Test, ob ein Worker nach der Änderungsmeldung eines anderen nicht mehr den alten Stand liefert."""
+    path = str(tmp_path / "shared.db")
+    first, second = SharedCache(path), SharedCache(path)
+
+    first.put("latest:392662", {"v": 1}, b'{"v": 1}')
+    assert second.get("latest:392662", json.loads) == {"v": 1}
+
+    second.put("latest:392662", {"v": 2}, b'{"v": 2}')
+    assert first.get("latest:392662", json.loads) == {"v": 2}
+
+    first.remember("latest:anderer", {"v": 1}, first.seen)
+    second.invalidate("latest:anderer")
+    assert first.get("latest:anderer", json.loads) is None
+
+    # Ein vor einer Änderung begonnener Lesevorgang wird nicht zwischengespeichert
+    since = first.seen
+    second.invalidate("latest:anderer")
+    first.remember("latest:anderer", {"v": "veraltet"}, since)
+    assert first.get("latest:anderer", json.loads) is None
+    assert first.next_id("memory_version") == 1 and second.next_id("memory_version") == 2
+
+def test_entries_read_from_storage_are_shared(tmp_path):
+    """Test, ob ein aus dem Speicher-Backend gelesener Eintrag auch den übrigen Workern dient, ohne sie zu stören."""
+    path = str(tmp_path / "shared.db")
+    first, second = SharedCache(path), SharedCache(path)
+
+    second.put("latest:392662", {"v": 1}, b'{"v": 1}')
+    first.remember("latest:anderer", {"v": 1}, first.seen, b'{"v": 1}')
+    assert second.get("latest:anderer", json.loads) == {"v": 1}
+    # Der gelesene Stand verdrängt keinen lokalen Eintrag eines anderen Workers
+    assert second.stats()["invalidations"] == 0
+
+    # Ein vor einer Änderung begonnener Lesevorgang landet auch nicht in der gemeinsamen Datei
+    since = first.seen
+    second.invalidate("latest:dritter")
+    first.remember("latest:dritter", {"v": "veraltet"}, since, b'{"v": "veraltet"}')
+    assert second.get("latest:dritter", json.loads) is None
+
+def test_shared_entries_are_bounded_by_bytes_and_age(tmp_path):
+    """Test, ob die gemeinsame Datei älteste und abgelaufene Einträge in allen Workern verwirft."""
+    path = str(tmp_path / "shared.db")
+    first, second = SharedCache(path, max_bytes=250), SharedCache(path, max_bytes=250)
+
+    for user in ("a", "b", "c"):
+        first.put(f"latest:{user}", {"user": user}, b"x" * 100)
+    assert second.get("latest:a", bytes) is None
+    assert second.get("latest:c", bytes) == b"x" * 100
+
+    # Auch der schreibende Worker liefert verdrängte Einträge nicht mehr aus
+    first.put("latest:d", {"user": "d"}, b"x" * 100)
+    assert first.get("latest:b", bytes) is None
+
+    expiring = SharedCache(path, max_bytes=250, entry_ttl=60)
+    first._conn.execute("UPDATE entries SET updated = updated - 120 WHERE key = 'latest:c'")
+    assert expiring.get("latest:c", bytes) is None
+    expiring.put("latest:e", {"user": "e"}, b"x")
+    keys = {row[0] for row in first._conn.execute("SELECT key FROM entries")}
+    assert keys == {"latest:d", "latest:e"}
+
+def test_job_entries_have_their_own_budget(tmp_path):
+    """Test, ob Job-Stände nur untereinander verdrängt werden und keine Stundenpläne verdrängen."""
+    cache = SharedCache(str(tmp_path / "shared.db"), max_bytes=250, budgets={"job": 150})
+    cache.put("latest:a", {"user": "a"}, b"x" * 100)
+    cache.put("latest:b", {"user": "b"}, b"x" * 100)
+    for job_id in ("1", "2", "3"):
+        cache.put(f"job:{job_id}", {"job_id": job_id}, b"x" * 100)
+    keys = {row[0] for row in cache._conn.execute("SELECT key FROM entries")}
+    assert keys == {"latest:a", "latest:b", "job:3"}
+
+    # Stundenpläne zählen ohne die Job-Stände gegen max_bytes
+    cache.put("latest:c", {"user": "c"}, b"x" * 100)
+    keys = {row[0] for row in cache._conn.execute("SELECT key FROM entries")}
+    assert keys == {"latest:b", "latest:c", "job:3"}
+
+def test_latest_is_coherent_across_processes(monkeypatch, tmp_path):
+    """Test, ob ein in einem anderen Prozess gespeicherter Stundenplan sofort über /latest-Daten sichtbar ist."""
+    path = str(tmp_path / "shared.db")
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.setenv("SHARED_CACHE_PATH", path)
+    monkeypatch.setattr(shared_cache, "_shared_cache", None)
+    monkeypatch.setattr(db, "TIMETABLE_CACHE", {})
+
+    asyncio.run(db.store_timetable("392662", {"entries": ["alt"]}, None, "2025-04-14 07:30:00"))
+    assert json.loads(asyncio.run(db.get_latest_timetable("392662"))["data"]) == {"entries": ["alt"]}
+
+    script = (
+        "import asyncio; from services import db; "
+        "asyncio.run(db.store_timetable('392662', {'entries': ['neu']}, None, '2025-04-15 07:30:00'))"
+    )
+    env = dict(os.environ, STORAGE_BACKEND="memory", SHARED_CACHE_PATH=path)
+    subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+    latest = asyncio.run(db.get_latest_timetable("392662"))
+    response = asyncio.run(db.get_latest_response("392662"))
+    assert json.loads(latest["data"]) == {"entries": ["neu"]}
+    assert latest["id"] == 2
+    assert json.loads(response["body"])["last_updated"] == "2025-04-15 07:30:00"
+    shared_cache.close_shared_cache()
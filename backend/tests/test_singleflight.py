@@ -0,0 +1,80 @@
+import os
+import sys
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_execution():
+    """Test, ob gleichzeitige Aufrufer mit demselben Schlüssel nur einen Lauf auslösen."""
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"entries": []}
+
+    async def run():
+        return await asyncio.gather(*[flights.do(("ocr", "abc"), work) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+def test_failure_reaches_all_waiters_without_poisoning():
+    """Test, ob ein Fehler an alle Wartenden geht und ein späterer Versuch neu startet."""
+    flights = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("DSB nicht erreichbar")
+
+    async def succeeding():
+        return b"bild"
+
+    async def run():
+        results = await asyncio.gather(
+            flights.do(("download", "url"), failing),
+            flights.do(("download", "url"), failing),
+            return_exceptions=True,
+        )
+        retry = await flights.do(("download", "url"), succeeding)
+        return results, retry
+
+    results, retry = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry == b"bild"
+
+def test_batch_joins_single_flights_and_runs_only_the_misses():
+    """Test, ob ein gebündelter Lauf laufende Einzelläufe mitnutzt und seine Schlüssel einzeln belegt."""
+    flights = SingleFlight()
+    batches = []
+
+    async def single():
+        await asyncio.sleep(0.02)
+        return "einzeln"
+
+    async def batch(keys):
+        batches.append(keys)
+        await asyncio.sleep(0.01)
+        return {key: f"batch {key[1]}" for key in keys}
+
+    async def run():
+        running = asyncio.ensure_future(flights.do(("ocr", "a"), single))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(
+            flights.do_many([("ocr", "a"), ("ocr", "b"), ("ocr", "c")], batch),
+            flights.do(("ocr", "b"), single),
+        )
+        return await running, results
+
+    running, (batched, joined) = asyncio.run(run())
+    assert batches == [[("ocr", "b"), ("ocr", "c")]]
+    assert running == "einzeln"
+    assert batched == {("ocr", "a"): "einzeln", ("ocr", "b"): "batch b", ("ocr", "c"): "batch c"}
+    assert joined == "batch b"
+    assert flights.stats() == {"in_flight": 0, "started": 2, "coalesced": 2}
@@ -0,0 +1,71 @@
+import os
+import sys
+import numpy as np
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.table_segmentation import detect_grid, grid_cells, recognize_cells
+from services.ocr_service import parse_grid_cells
+
+def _synthetic_plan():
+    """Zeichnet ein MTL-Raster (Kopfzeile/-spalte + 5x5 Zellen) mit zwei beschrifteten Zellen."""
+    gray = np.full((420, 620), 255, dtype=np.uint8)
+    gray[10:16, 20:200] = 0  # Überschrift über der Tabelle
+    for y in range(40, 401, 60):
+        gray[y:y + 2, 10:610] = 0
+    for x in range(10, 620, 100):
+        gray[40:402, x:x + 2] = 0
+    gray[110:118, 120:170] = 0  # Montag, Block I, erste Zeile
+    gray[124:130, 120:150] = 0  # Montag, Block I, zweite Zeile
+    gray[350:358, 520:560] = 0  # Freitag, Block bb - V
+    return gray
+
+class FakeReader:
+    """Liefert für jede Box deren Position als Text, statt echter Erkennung."""
+    def __init__(self):
+        self.boxes = []
+        self.batch_size = 1
+
+    def recognize(self, gray, horizontal_list=None, free_list=None, detail=1, batch_size=1):
+        self.boxes = horizontal_list
+        self.batch_size = batch_size
+        texts = {110: "LF 04.6 (Mich)", 124: "Raum 423", 350: "LF 02.2 Labor", 10: "Klasse MTL 01"}
+        return [
+            ([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], texts.get(y0 + 2, "?"), 0.9)
+            for x0, x1, y0, y1 in horizontal_list
+        ]
+
+def test_detect_grid_finds_day_columns_and_period_rows():
+    """Test, ob die Linien des Wochenrasters gefunden und den Zellen zugeordnet werden."""
+    grid = detect_grid(_synthetic_plan())
+    assert grid is not None
+    assert len(grid.rows) == 7
+    assert len(grid.cols) == 7
+
+    cells = grid_cells(grid)
+    assert len(cells) == 25
+    assert cells[0]["day"] == "Montag" and cells[0]["period"] == "I"
+    assert cells[0]["x0"] == 112 and cells[0]["y0"] == 102
+
+def test_detect_grid_rejects_pages_without_table():
+    """Test, ob Seiten ohne Raster auf die Erkennung der ganzen Seite zurückfallen."""
+    gray = np.full((200, 200), 255, dtype=np.uint8)
+    gray[50:60, 20:120] = 0
+    assert detect_grid(gray) is None
+
+def test_only_non_empty_cells_are_recognized(monkeypatch):
+    """Test, ob nur beschriftete Zellen erkannt und als Einträge abgebildet werden."""
+    monkeypatch.setenv("OCR_BATCH_SIZE", "16")
+    gray = _synthetic_plan()
+    reader = FakeReader()
+    cells, results = recognize_cells(reader, gray, detect_grid(gray))
+
+    assert len(reader.boxes) == 4  # Überschrift + 2 Zeilen Montag + 1 Zeile Freitag
+    assert reader.batch_size == 16  # Zeilen gebündelt statt einzeln erkannt
+    timetable = parse_grid_cells(cells)
+    assert timetable["entries"] == [
+        {"day": "Montag", "period": "I", "subject": "LF 04.6", "room": "423", "text": "LF 04.6 (Mich) Raum 423"},
+        {"day": "Freitag", "period": "bb - V", "subject": "LF 02.2", "room": "Labor", "text": "LF 02.2 Labor"},
+    ]
+    assert any(text == "Klasse MTL 01" for _, text, _ in results)
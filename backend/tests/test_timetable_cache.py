@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import json
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import timetable_cache
+from services.timetable_cache import FRESH, STALE, TimetableCache
+
+def _entry(size: int) -> dict:
+    return {"timetable": {"entries": ["x" * size]}, "available_plans": [], "available_classes": [], "last_updated": ""}
+
+def test_states_and_byte_bounded_eviction():
+    """Test, ob Einträge nach Alter frisch/veraltet/abgelaufen sind und nach Bytes verdrängt wird."""
+    cache = TimetableCache(max_bytes=2500, ttl=60, grace=600)
+    now = time.time()
+    cache.put("frisch", _entry(1000), now)
+    cache.put("veraltet", _entry(10), now - 120)
+    cache.put("abgelaufen", _entry(10), now - 3600)
+
+    assert cache.get("frisch")[1] == FRESH
+    assert cache.get("veraltet")[1] == STALE
+    assert cache.get("abgelaufen") == (None, None)
+
+    # Zwei weitere große Einträge passen nur, wenn der am längsten ungenutzte verdrängt wird
+    cache.put("gross", _entry(1000), now)
+    cache.put("noch-groesser", _entry(1000), now)
+    stats = cache.stats()
+    assert stats["bytes"] <= 2500 and stats["evictions"] >= 1
+    assert cache.get("frisch") == (None, None)
+
+def test_parse_plan_serves_fresh_and_revalidates_stale(monkeypatch):
+    """Test, ob frische Pläne ohne Abruf und veraltete sofort geliefert und im Hintergrund erneuert werden."""
+    from app.api import dsb as dsb_api
+
+    cache = TimetableCache(ttl=60, grace=600)
+    monkeypatch.setattr(timetable_cache, "_timetable_cache", cache)
+    fetches = []
+    stored = []
+
+    async def fake_authenticate(username, password):
+        return object()
+
+    async def fake_latest(username):
+        return None
+
+    async def fake_timetable(auth_result):
+        fetches.append(auth_result)
+        return b"bild"
+
+    async def fake_ocr(image_data):
+        return {"entries": [f"abruf-{len(fetches)}"]}
+
+    async def fake_store(username, data, *args, **kwargs):
+        stored.append(data)
+        return True
+
+    monkeypatch.setattr(dsb_api, "authenticate_user", fake_authenticate)
+    monkeypatch.setattr(dsb_api, "get_latest_timetable", fake_latest)
+    monkeypatch.setattr(dsb_api, "get_timetable", fake_timetable)
+    monkeypatch.setattr(dsb_api, "process_ocr", fake_ocr)
+    monkeypatch.setattr(dsb_api, "store_timetable", fake_store)
+    client = TestClient(app)
+    login = {"username": "392662", "password": "geheim"}
+
+    first = client.post("/api/dsb/parse-plan", json=login).json()
+    fresh = client.post("/api/dsb/parse-plan", json=login).json()
+    assert first["from_cache"] is False and fresh["from_cache"] is True
+    assert fresh["timetable"] == {"entries": ["abruf-1"]} and len(fetches) == 1
+
+    # Eintrag altern lassen: die Antwort kommt sofort aus dem Cache, der Abruf läuft danach
+    entry, _ = cache.get("392662")
+    cache.put("392662", entry, time.time() - 120)
+    stale = client.post("/api/dsb/parse-plan", json=login).json()
+    assert stale["from_cache"] is True and stale["timetable"] == {"entries": ["abruf-1"]}
+    assert len(fetches) == 2 and stored[-1] == {"entries": ["abruf-2"]}
+    assert cache.get("392662")[1] == FRESH
+    assert json.dumps(client.post("/api/dsb/parse-plan", json=login).json()["timetable"]) == '{"entries": ["abruf-2"]}'
+
+def test_confirmed_unchanged_plan_is_fresh_after_restart(monkeypatch):
+    """Test, ob ein unverändert bestätigter Plan ab der Bestätigung, nicht ab seiner ersten Version frisch ist."""
+    from app.api import dsb as dsb_api
+
+    monkeypatch.setattr(timetable_cache, "_timetable_cache", TimetableCache(ttl=60, grace=600))
+    confirmed = time.strftime("%Y-%m-%d %H:%M:%S")
+    fetches = []
+
+    async def fake_authenticate(username, password):
+        return object()
+
+    async def fake_latest(username):
+        return {"id": 1, "data": '{"entries": ["erste Version"]}', "timestamp": "2025-04-14 07:30:00",
+                "checked_at": confirmed, "available_plans": [], "available_classes": []}
+
+    async def fake_timetable(auth_result):
+        fetches.append(auth_result)
+        return b"bild"
+
+    monkeypatch.setattr(dsb_api, "authenticate_user", fake_authenticate)
+    monkeypatch.setattr(dsb_api, "get_latest_timetable", fake_latest)
+    monkeypatch.setattr(dsb_api, "get_timetable", fake_timetable)
+    monkeypatch.setattr(dsb_api, "get_prefetch_scheduler", lambda: None)
+
+    response = TestClient(app).post("/api/dsb/parse-plan", json={"username": "392662", "password": "geheim"}).json()
+    assert response["from_cache"] is True and response["last_updated"] == "2025-04-14 07:30:00"
+    assert fetches == []
@@ -0,0 +1,100 @@
+import os
+import sys
+import asyncio
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import db
+from services.timetable_diff import diff_timetables, is_empty
+
+def _entry(day, period, subject, room):
+    return {"day": day, "period": period, "subject": subject, "room": room, "text": f"{subject} Raum {room}"}
+
+OLD = {"class_names": ["MTL 01"], "entries": [
+    _entry("Montag", "I", "LF 04.6", "423"),
+    _entry("Dienstag", "II", "LF 02.2", "Labor"),
+    _entry("Freitag", "bb - V", "LF 08.1.1", "423"),
+]}
+NEW = {"class_names": ["MTL 01"], "entries": [
+    _entry("Montag", "I", "LF 04.6", "118"),
+    _entry("Dienstag", "II", "LF 02.2", "Labor"),
+    _entry("Mittwoch", "III", "LF 01.1", "207"),
+]}
+
+def test_diff_reports_added_removed_and_changed_entries():
+    """Test, ob Änderungen je Klasse/Tag/Block erkannt werden."""
+    diff = diff_timetables(OLD, NEW)
+    assert [(e["class"], e["day"], e["period"]) for e in diff["added"]] == [("MTL 01", "Mittwoch", "III")]
+    assert [(e["day"], e["period"]) for e in diff["removed"]] == [("Freitag", "bb - V")]
+    assert len(diff["changed"]) == 1
+    assert diff["changed"][0]["day"] == "Montag" and diff["changed"][0]["fields"] == ["room", "text"]
+    assert diff["unchanged"] == 1
+    assert is_empty(diff_timetables(NEW, NEW))
+
+def test_delta_endpoint_sends_only_changes(monkeypatch, tmp_path):
+    """Test, ob /delta für eine bekannte Version nur den Diff und sonst den ganzen Plan liefert."""
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "timetables.db"))
+    monkeypatch.setenv("BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(db, "_sqlite_store", None)
+
+    async def store():
+        await db.store_timetable("392662", OLD, None, "2025-04-14 07:30:00")
+        first = (await db.get_latest_timetable("392662"))["id"]
+        await db.store_timetable("392662", NEW, None, "2025-04-15 07:30:00")
+        return first
+    first = asyncio.run(store())
+
+    client = TestClient(app)
+    full = client.get("/api/dsb/delta", params={"username": "392662"}).json()
+    assert full["full"] is True and full["timetable"] == NEW
+
+    delta = client.get("/api/dsb/delta", params={"username": "392662", "since": first}).json()
+    assert delta["full"] is False and delta["changed"] is True
+    assert delta["version"] == full["version"]
+    assert len(delta["diff"]["added"]) == 1 and len(delta["diff"]["removed"]) == 1
+
+    current = client.get("/api/dsb/delta", params={"username": "392662", "since": full["version"]}).json()
+    assert current["changed"] is False
+
+    changes = client.get("/api/dsb/changes", params={"username": "392662"}).json()["changes"]
+    assert [(c["version"], c["previous_version"]) for c in changes] == [(full["version"], first)]
+
+    asyncio.run(db.close_db())
+
+def test_versions_of_other_plans_are_not_diffed(monkeypatch):
+    """Test, ob /delta und /changes nur Versionen desselben Plans vergleichen."""
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    week_15 = "14.04.-18.04.25_MTA MTL 01"
+    week_16 = "21.04.-25.04.25_MTA MTL 01"
+
+    async def store():
+        await db.store_timetable("392662", OLD, None, "2025-04-14 07:30:00", plan=week_15)
+        first = (await db.get_latest_timetable("392662"))["id"]
+        await db.store_timetable("392662", NEW, None, "2025-04-14 08:30:00", plan=week_16)
+        await db.store_timetable("392662", NEW, None, "2025-04-15 07:30:00", plan=week_15)
+        return first
+    first = asyncio.run(store())
+
+    client = TestClient(app)
+    delta = client.get("/api/dsb/delta", params={"username": "392662", "since": first}).json()
+    assert delta["plan"] == week_15 and delta["full"] is False
+    assert len(delta["diff"]["added"]) == 1
+
+    current = client.get("/api/dsb/delta", params={"username": "392662", "since": delta["version"]}).json()
+    assert current["diff"]["unchanged"] == len(NEW["entries"])
+
+    # Die Version der anderen Woche wird nicht als Vorgänger betrachtet
+    other = client.get("/api/dsb/delta", params={"username": "392662", "since": first + 1}).json()
+    assert other["full"] is True
+
+    changes = client.get("/api/dsb/changes", params={"username": "392662"}).json()
+    assert changes["plan"] == week_15
+    assert [(c["version"], c["previous_version"]) for c in changes["changes"]] == [(delta["version"], first)]
+    assert client.get("/api/dsb/changes", params={"username": "392662", "plan": week_16}).json()["changes"] == []
+
+    asyncio.run(db.close_db())
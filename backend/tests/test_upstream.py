@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+import requests
+
+# Füge den Hauptpfad zum Pythonpfad hinzu
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import timetable_cache
+from services.session_pool import get_session_pool
+from services.timetable_cache import TimetableCache
+from services.dsb_service import PLAN_IMAGES_GATEWAY, plan_gateway_name
+from services.upstream import TokenBucket, UpstreamGateway, UpstreamUnavailable
+
+def _gateway(**kwargs) -> UpstreamGateway:
+    options = dict(rate=1000, burst=1000, timeout=0.2, retries=2, backoff=0.001, backoff_max=0.002,
+                   failure_threshold=3, reset_timeout=0.05)
+    options.update(kwargs)
+    return UpstreamGateway("dsb.test", **options)
+
+def test_transient_errors_are_retried_but_rejections_are_not():
+    """Test, ob Verbindungsfehler wiederholt und abgelehnte Zugangsdaten sofort weitergegeben werden."""
+    gateway = _gateway()
+    calls = []
+
+    async def flaky():
+        calls.append("flaky")
+        if len(calls) < 3:
+            raise requests.ConnectionError("Verbindung abgebrochen")
+        return "ok"
+
+    async def rejected():
+        calls.append("rejected")
+        raise Exception("Invalid Credentials")
+
+    async def run():
+        result = await gateway.call(flaky)
+        with pytest.raises(Exception, match="Invalid Credentials"):
+            await gateway.call(rejected)
+        return result
+
+    assert asyncio.run(run()) == "ok"
+    assert calls == ["flaky", "flaky", "flaky", "rejected"]
+    assert gateway.stats()["retries"] == 2 and gateway.breaker.state == "closed"
+
+def test_hung_threads_are_not_retried_and_stay_occupied():
+    """Test, ob ein blockierender Aufruf nach dem Zeitlimit nicht wiederholt wird und seinen Thread belegt."""
+    import threading
+    gateway = _gateway(max_concurrency=1, timeout=0.05, failure_threshold=10)
+    release = threading.Event()
+    calls = []
+
+    def hanging():
+        calls.append("hanging")
+        release.wait(2)
+        return "spät"
+
+    async def run():
+        with pytest.raises(UpstreamUnavailable):
+            await gateway.run_sync(hanging)
+        assert gateway.stats()["abandoned_threads"] == 1
+        with pytest.raises(UpstreamUnavailable, match="hängende Aufrufe"):
+            await gateway.run_sync(hanging)
+        release.set()
+        for _ in range(100):
+            if gateway.stats()["abandoned_threads"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return await gateway.run_sync(lambda: "ok")
+
+    assert asyncio.run(run()) == "ok"
+    assert calls == ["hanging"]
+    assert gateway.stats()["timeouts"] == 1 and gateway.stats()["retries"] == 0
+
+def test_unknown_plan_hosts_share_one_gateway(monkeypatch):
+    """Test, ob Plan-URLs fremder Hosts kein eigenes Gateway erhalten."""
+    monkeypatch.setenv("DSB_PLAN_HOSTS", "light.dsbcontrol.de")
+    assert plan_gateway_name("https://light.dsbcontrol.de/DSBlightWebsite/Data/plan.jpg") == "light.dsbcontrol.de"
+    assert plan_gateway_name("https://beliebig.example/plan.jpg") == PLAN_IMAGES_GATEWAY
+    assert plan_gateway_name("http://127.0.0.1:9/plan.jpg") == PLAN_IMAGES_GATEWAY
+
+def test_circuit_opens_fails_fast_and_recovers():
+    """Test, ob der Schutzschalter nach Zeitüberschreitungen öffnet, sofort ablehnt und nach einem Probeaufruf schließt."""
+    gateway = _gateway(retries=0)
+    calls = []
+
+    async def hanging():
+        calls.append("hanging")
+        await asyncio.sleep(1)
+
+    async def healthy():
+        calls.append("healthy")
+        return "ok"
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(UpstreamUnavailable):
+                await gateway.call(hanging)
+        with pytest.raises(UpstreamUnavailable, match="Schutzschalter"):
+            await gateway.call(healthy)
+        await asyncio.sleep(0.06)
+        return await gateway.call(healthy)
+
+    assert asyncio.run(run()) == "ok"
+    assert calls == ["hanging"] * 3 + ["healthy"]
+    assert gateway.stats()["rejected"] == 1 and gateway.stats()["timeouts"] == 3
+    assert gateway.breaker.state == "closed" and gateway.breaker.times_opened == 1
+
+def test_token_bucket_limits_rate():
+    """Test, ob das Ratenlimit nach dem Burst wartet und zu lange Wartezeiten ablehnt."""
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve(max_wait=1) == 0 and bucket.reserve(max_wait=1) == 0
+    assert 0.05 < bucket.reserve(max_wait=1) <= 0.1
+    assert bucket.reserve(max_wait=0.1) is None
+
+def test_parse_plan_falls_back_to_cached_data_when_dsb_is_down(monkeypatch):
+    """Test, ob bei ausgefallenem DSBmobile bekannte Zugangsdaten den gespeicherten Plan und andere 503 erhalten."""
+    from app.api import dsb as dsb_api
+
+    monkeypatch.setattr(timetable_cache, "_timetable_cache", TimetableCache())
+    get_session_pool().put("392662", "geheim", object())
+
+    async def unavailable(username, password):
+        raise UpstreamUnavailable("mobileapi.dsbcontrol.de", "Schutzschalter offen", 30)
+
+    async def fake_latest(username):
+        return {"data": json.dumps({"entries": ["gespeichert"]}), "timestamp": "2025-04-13 07:30:00"}
+
+    monkeypatch.setattr(dsb_api, "authenticate_user", unavailable)
+    monkeypatch.setattr(dsb_api, "get_latest_timetable", fake_latest)
+    client = TestClient(app)
+
+    known = client.post("/api/dsb/parse-plan", json={"username": "392662", "password": "geheim"})
+    assert known.status_code == 200
+    assert known.json()["timetable"] == {"entries": ["gespeichert"]} and known.json()["from_cache"] is True
+
+    unknown = client.post("/api/dsb/parse-plan", json={"username": "392662", "password": "falsch"})
+    assert unknown.status_code == 503 and unknown.headers["Retry-After"] == "30"
+    get_session_pool().clear()